@@ -2,7 +2,7 @@
 API v1 Router
 """
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, users, products, orders, wallet, chat, seller_profile, tariff, partners, reviews, admin, locations, upload, categories, analytics, notifications, favorites, search, reports, recommendations, coupons, settings, export
+from app.api.v1.endpoints import auth, users, products, orders, wallet, chat, seller_profile, tariff, partners, reviews, admin, locations, upload, categories, analytics, notifications, favorites, search, reports, recommendations, coupons, settings, export, realtime
 
 api_router = APIRouter()
 
@@ -30,3 +30,4 @@ api_router.include_router(recommendations.router, prefix="/recommendations", tag
 api_router.include_router(coupons.router, prefix="/coupons", tags=["Coupons"])
 api_router.include_router(settings.router, prefix="/settings", tags=["Settings"])
 api_router.include_router(export.router, prefix="/export", tags=["Export"])
+api_router.include_router(realtime.router, prefix="/realtime", tags=["Realtime"])
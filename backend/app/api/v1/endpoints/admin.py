@@ -2,20 +2,40 @@
 Admin Endpoints - System maintenance and cron jobs
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Header, Query, Body
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, func
 from uuid import UUID
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 from app.database.session import get_db
+from app.core.config import settings
 from app.services.tariff_renewal import check_and_renew_tariffs
-from app.models.wallet import WithdrawalRequest, Wallet, Transaction, ProductReferralPurchase
+from app.services.order_placement import release_stock
+from app.services.referral_settlement import settle_orders
+from app.services.referral_stats import cancel_order_purchases
+from app.services.ledger import LedgerEntry, post_entries
+from app.services.coupons import commit_coupons, release_coupon, invalidate_coupon
+from app.services.realtime import publish, publish_balances, publish_orders
+from app.services.notification_fanout import create_fanout
+from app.services import catalog_facets, moderation_queue, user_directory
+from app.services.user_directory import InvalidCursorError, UserFilter
+from app.services.image_moderation import ban_image
+from app.services.duplicate_detection import duplicate_clusters
+from app.services.reference_data import registry as reference_registry, request_reload as request_reference_reload
+from app.services.storefront import invalidate as invalidate_storefront
+from app.services.partner_offers import sync_products as sync_partner_offers
+from app.tasks.referrals import enqueue_settlement
+from app.tasks.notifications import enqueue_fanout
+from app.models.wallet import WithdrawalRequest, Transaction, ProductReferralPurchase
 from app.models.user import User
 from app.models.product import Product
 from app.models.order import Order
 from app.models.report import Report, ReportStatus
+from app.models.notification import NotificationFanout
+from app.models.moderation import BannedImage
 from app.core.dependencies import get_current_active_user
 
 router = APIRouter()
@@ -32,6 +52,30 @@ class ProductModeration(BaseModel):
     status: str
 
 
+class ModerationDecision(BaseModel):
+    product_ids: List[UUID]
+    status: str  # active, rejected
+    reason: Optional[str] = None
+
+
+class ModerationRelease(BaseModel):
+    product_ids: Optional[List[UUID]] = None  # None = all of mine
+
+
+class BannedImageCreate(BaseModel):
+    image_url: str
+    reason: Optional[str] = None
+
+
+class NotificationFanoutCreate(BaseModel):
+    audience: str
+    params: dict = {}
+    type: str = "system"
+    title: str
+    message: str
+    data: Optional[dict] = None
+
+
 def require_admin(current_user: User = Depends(get_current_active_user)):
     """Dependency to require admin role"""
     if current_user.role != "admin":
@@ -42,6 +86,16 @@ def require_admin(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 
+def require_moderator(current_user: User = Depends(get_current_active_user)):
+    """Dependency to require moderator or admin role"""
+    if current_user.role not in ("admin", "moderator"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Moderator access required"
+        )
+    return current_user
+
+
 @router.post("/cron/renew-tariffs")
 async def cron_renew_tariffs(
     db: AsyncSession = Depends(get_db),
@@ -176,6 +230,10 @@ async def approve_withdrawal(
         transaction.status = "completed"
 
     await db.commit()
+    await publish(withdrawal.user_id, "wallet", "withdrawal_approved", {
+        "withdrawal_id": withdrawal.id,
+        "amount": withdrawal.amount,
+    })
 
     return {
         "success": True,
@@ -222,30 +280,26 @@ async def reject_withdrawal(
     withdrawal.processed_at = datetime.utcnow()
     withdrawal.rejection_reason = rejection_reason
 
-    # Return money to user's referral balance
-    wallet_result = await db.execute(
-        select(Wallet).where(Wallet.user_id == withdrawal.user_id)
-    )
-    wallet = wallet_result.scalar_one_or_none()
-
-    if wallet:
-        wallet.referral_balance += withdrawal.amount
-
-        # Create transaction for refund
-        refund_transaction = Transaction(
+    # Return money to user's referral balance (once per withdrawal)
+    posting = await post_entries(
+        db,
+        [LedgerEntry(
             user_id=withdrawal.user_id,
-            type="withdrawal_refund",
-            amount=withdrawal.amount,
             balance_type="referral",
+            delta=withdrawal.amount,
+            type="withdrawal_refund",
             description=f"Возврат средств: вывод отклонен ({rejection_reason})",
-            reference_id=withdrawal.id,
-            status="completed"
-        )
-        db.add(refund_transaction)
+            reference_id=withdrawal.id
+        )],
+        f"withdrawal-refund:{withdrawal.id}"
+    )
 
     # Update related transaction status
     transaction_result = await db.execute(
-        select(Transaction).where(Transaction.reference_id == withdrawal.id)
+        select(Transaction).where(
+            Transaction.reference_id == withdrawal.id,
+            Transaction.type == "withdrawal"
+        )
     )
     transaction = transaction_result.scalar_one_or_none()
 
@@ -253,6 +307,12 @@ async def reject_withdrawal(
         transaction.status = "failed"
 
     await db.commit()
+    await publish(withdrawal.user_id, "wallet", "withdrawal_rejected", {
+        "withdrawal_id": withdrawal.id,
+        "amount": withdrawal.amount,
+        "reason": rejection_reason,
+    })
+    await publish_balances(posting.balances)
 
     return {
         "success": True,
@@ -266,6 +326,20 @@ async def reject_withdrawal(
 
 # User Management Endpoints
 
+def _user_dict(u: User) -> dict:
+    return {
+        "id": str(u.id),
+        "email": u.email,
+        "full_name": u.full_name,
+        "role": u.role,
+        "tariff": u.tariff,
+        "is_active": not u.is_banned,
+        "is_banned": u.is_banned,
+        "created_at": u.created_at,
+        "avatar": u.avatar
+    }
+
+
 @router.get("/users/all")
 async def get_all_users(
     limit: int = Query(100, le=500),
@@ -273,26 +347,74 @@ async def get_all_users(
     current_user: User = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all users (admin only)"""
+    """Get all users (admin only); GET /users searches and pages without OFFSET"""
     query = select(User).order_by(desc(User.created_at)).limit(limit).offset(offset)
     
     result = await db.execute(query)
     users = result.scalars().all()
     
-    return [
-        {
-            "id": str(u.id),
-            "email": u.email,
-            "full_name": u.full_name,
-            "role": u.role,
-            "tariff": u.tariff,
-            "is_active": not u.is_banned,
-            "is_banned": u.is_banned,
-            "created_at": u.created_at,
-            "avatar": u.avatar
-        }
-        for u in users
-    ]
+    return [_user_dict(u) for u in users]
+
+
+def _user_filter(
+    q: Optional[str] = Query(None, description="Part of email, name or phone"),
+    role: Optional[str] = Query(None, description="user, seller, moderator, admin, cashier"),
+    tariff: Optional[str] = Query(None, description="free, pro, business"),
+    is_banned: Optional[bool] = Query(None),
+) -> UserFilter:
+    return UserFilter(q=q, role=role, tariff=tariff, is_banned=is_banned)
+
+
+@router.get("/users")
+async def search_users(
+    filters: UserFilter = Depends(_user_filter),
+    limit: int = Query(settings.ADMIN_USERS_PAGE_SIZE, ge=1, le=settings.ADMIN_USERS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    current_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    User directory (admin only)
+
+    Search by email, name or phone and filter by role, tariff and ban status;
+    newest first. Pass next_cursor back as cursor for the next page.
+    """
+    try:
+        users, next_cursor = await user_directory.search_users(db, filters, limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.detail
+        )
+
+    return {
+        "items": [
+            {
+                **_user_dict(u),
+                "phone": u.phone,
+                "tariff_expires_at": u.tariff_expires_at,
+                "ban_reason": u.ban_reason,
+            }
+            for u in users
+        ],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    }
+
+
+@router.get("/users/export")
+async def export_users(
+    filters: UserFilter = Depends(_user_filter),
+    current_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream every user matching the filters as CSV (admin only)"""
+    filename = f"users_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return StreamingResponse(
+        user_directory.export_rows(db.bind, filters),  # AsyncEngine; get_bind() is the sync one
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 
 @router.put("/users/{user_id}/ban")
@@ -463,12 +585,222 @@ async def moderate_product(
             detail="Product not found"
         )
     
+    facets_before = await catalog_facets.snapshot(db, Product.id == product.id)
     product.status = data.status
+    product.moderation_claimed_by = None
+    product.moderation_lease_until = None
+    await db.flush()  # sync_partner_offers and the facet counts read the new status
+    await sync_partner_offers(db, [product.id])
+    await catalog_facets.record_change(db, facets_before, Product.id == product.id)
     await db.commit()
+    await invalidate_storefront(product.seller_id)
+    await publish(product.seller_id, "moderation", "product_moderated", {
+        "product_id": product.id,
+        "title": product.title,
+        "status": product.status,
+    })
     
     return {"success": True, "message": f"Product status changed to {data.status}"}
 
 
+# Moderation Queue Endpoints
+
+@router.get("/moderation/queue/stats")
+async def get_moderation_queue_stats(
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """Products waiting for moderation and how many are leased right now"""
+    return await moderation_queue.queue_stats(db)
+
+
+@router.post("/moderation/queue/claim")
+async def claim_moderation_batch(
+    limit: int = Query(20, ge=1, le=settings.MODERATION_BATCH_MAX),
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Lease a batch of the oldest waiting products
+
+    Other moderators won't get these products until they are decided,
+    released, or the lease (MODERATION_LEASE_MINUTES) expires. Calling again
+    returns the products you still hold plus new ones up to `limit`.
+    """
+    products = await moderation_queue.claim_batch(db, current_user.id, limit)
+    await db.commit()
+
+    return {
+        "items": [
+            {
+                "id": str(product.id),
+                "seller_id": str(product.seller_id),
+                "title": product.title,
+                "description": product.description,
+                "price": float(product.price),
+                "images": product.images or [],
+                "category_id": product.category_id,
+                "moderation_result": product.moderation_result,
+                "created_at": product.created_at,
+            }
+            for product in products
+        ],
+        "lease_until": products[0].moderation_lease_until if products else None,
+    }
+
+
+@router.post("/moderation/queue/release")
+async def release_moderation_batch(
+    data: ModerationRelease,
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """Return leased products to the queue without deciding them"""
+    count = await moderation_queue.release(db, current_user.id, data.product_ids)
+    await db.commit()
+    return {"success": True, "released": count}
+
+
+@router.post("/moderation/queue/decide")
+async def decide_moderation_batch(
+    data: ModerationDecision,
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Approve (status=active) or reject (status=rejected) many products at once
+
+    Products already decided or leased to another moderator are skipped and
+    listed in `skipped`. Sellers are notified.
+    """
+    if data.status not in moderation_queue.DECISIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid status. Supported: active, rejected"
+        )
+    if not data.product_ids or len(data.product_ids) > settings.MODERATION_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Pass 1 to {settings.MODERATION_BATCH_MAX} product ids"
+        )
+
+    decided = await moderation_queue.decide(db, current_user.id, data.product_ids, data.status, data.reason)
+    await db.commit()
+    await invalidate_storefront(product["seller_id"] for product in decided)
+
+    for product in decided:
+        await publish(product["seller_id"], "moderation", "product_moderated", {
+            "product_id": product["id"],
+            "title": product["title"],
+            "status": product["status"],
+        })
+
+    decided_ids = {product["id"] for product in decided}
+    return {
+        "success": True,
+        "updated": [str(product_id) for product_id in decided_ids],
+        "skipped": [str(product_id) for product_id in data.product_ids if product_id not in decided_ids],
+    }
+
+
+def _banned_image_response(banned: BannedImage) -> dict:
+    return {
+        "id": str(banned.id),
+        "image_url": banned.image_url,
+        "reason": banned.reason,
+        "created_by": str(banned.created_by) if banned.created_by else None,
+        "created_at": banned.created_at,
+    }
+
+
+@router.get("/moderation/banned-images")
+async def get_banned_images(
+    limit: int = Query(100, le=500),
+    offset: int = 0,
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """Images the automatic moderation rejects copies of"""
+    result = await db.execute(
+        select(BannedImage).order_by(desc(BannedImage.created_at)).limit(limit).offset(offset)
+    )
+    return {"items": [_banned_image_response(banned) for banned in result.scalars().all()]}
+
+
+@router.post("/moderation/banned-images", status_code=status.HTTP_201_CREATED)
+async def create_banned_image(
+    data: BannedImageCreate,
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ban an image (e.g. from a rejected product)
+
+    Products whose images are resized or recompressed copies of it are
+    rejected by the automatic image moderation.
+    """
+    try:
+        banned = await ban_image(db, data.image_url, data.reason, current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    await db.commit()
+    return _banned_image_response(banned)
+
+
+@router.delete("/moderation/banned-images/{banned_image_id}")
+async def delete_banned_image(
+    banned_image_id: UUID,
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stop rejecting copies of an image"""
+    banned = await db.get(BannedImage, banned_image_id)
+    if not banned:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Banned image not found")
+    await db.delete(banned)
+    await db.commit()
+    return {"success": True}
+
+
+@router.get("/moderation/duplicates")
+async def get_duplicate_clusters(
+    limit: int = Query(50, ge=1, le=200),
+    min_size: int = Query(2, ge=2),
+    current_user: User = Depends(require_moderator),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Clusters of near-duplicate listings, largest first
+
+    Each cluster lists its products and the pairs that connect them
+    (match: image, title or image+title; distance in bits).
+    """
+    return {"clusters": await duplicate_clusters(db, limit=limit, min_size=min_size)}
+
+
+# Reference Data
+
+@router.post("/reference-data/reload")
+async def reload_reference_data(
+    current_user: User = Depends(require_admin)
+):
+    """
+    Reload cities, markets and categories on every API worker
+
+    Call after changing these tables outside the API (e.g. SQL imports);
+    category endpoints reload by themselves.
+    """
+    version = await request_reference_reload()
+    snapshot = reference_registry.snapshot
+    return {
+        "success": True,
+        "version": version,
+        "cities": len(snapshot.cities),
+        "markets": len(snapshot.markets),
+        "categories": len(snapshot.categories),
+    }
+
+
 # Platform Statistics
 
 # Order Management Endpoints
@@ -573,8 +905,9 @@ async def update_order_status_admin(
             detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
         )
 
+    # Row lock: a concurrent cancellation can't release stock twice
     result = await db.execute(
-        select(Order).where(Order.id == order_id)
+        select(Order).where(Order.id == order_id).with_for_update()
     )
     order = result.scalar_one_or_none()
 
@@ -584,96 +917,40 @@ async def update_order_status_admin(
             detail="Order not found"
         )
 
+    # Commissions of a completed order are already settled
+    if order.status == "completed" and data.status == "cancelled":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Completed orders can't be cancelled"
+        )
+
+    # Return reserved stock and coupon redemption when an order is cancelled
+    released_coupon = None
+    if data.status == "cancelled" and order.status != "cancelled":
+        await release_stock(db, order)
+        released_coupon = await release_coupon(db, order)
+        await cancel_order_purchases(db, order.id)
+
     # Update status
     order.status = data.status
     order.updated_at = datetime.utcnow()
 
-    # If order is completed, process product referral commissions (same logic as in orders.py)
+    # If order is completed, settle product referral commissions
+    settle_later = data.status == "completed" and settings.REFERRAL_SETTLEMENT_ASYNC
     if data.status == "completed":
-        # Find all pending product referral purchases for this order
-        referral_purchases_result = await db.execute(
-            select(ProductReferralPurchase).where(
-                ProductReferralPurchase.order_id == order.id,
-                ProductReferralPurchase.status == "pending"
-            )
-        )
-        referral_purchases = referral_purchases_result.scalars().all()
-
-        for purchase in referral_purchases:
-            # Get product to find owner
-            product_result = await db.execute(
-                select(Product).where(Product.id == purchase.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-
-            if not product:
-                continue
-
-            # Get product owner's wallet
-            owner_wallet_result = await db.execute(
-                select(Wallet).where(Wallet.user_id == product.seller_id)
-            )
-            owner_wallet = owner_wallet_result.scalar_one_or_none()
-
-            if not owner_wallet:
-                owner_wallet = Wallet(user_id=product.seller_id)
-                db.add(owner_wallet)
-                await db.flush()
-
-            # Check if owner has enough balance to pay commission
-            if owner_wallet.main_balance < purchase.commission_amount:
-                # Insufficient balance - skip this commission
-                purchase.status = "failed"
-                purchase.completed_at = datetime.utcnow()
-                continue
-
-            # Deduct commission from product owner's main balance
-            owner_wallet.main_balance -= purchase.commission_amount
-
-            # Create transaction for product owner (deduction)
-            owner_transaction = Transaction(
-                user_id=product.seller_id,
-                type="product_referral_commission_deducted",
-                amount=purchase.commission_amount,
-                balance_type="main",
-                description=f"Комиссия реферальной программы за товар (заказ {order.order_number})",
-                reference_id=order.id,
-                status="completed"
-            )
-            db.add(owner_transaction)
-
-            # Get referrer's wallet
-            referrer_wallet_result = await db.execute(
-                select(Wallet).where(Wallet.user_id == purchase.referrer_id)
-            )
-            referrer_wallet = referrer_wallet_result.scalar_one_or_none()
-
-            if not referrer_wallet:
-                referrer_wallet = Wallet(user_id=purchase.referrer_id)
-                db.add(referrer_wallet)
-                await db.flush()
-
-            # Credit commission to referrer's referral balance
-            referrer_wallet.referral_balance += purchase.commission_amount
-
-            # Create transaction for referrer (credit)
-            referrer_transaction = Transaction(
-                user_id=purchase.referrer_id,
-                type="product_referral_commission",
-                amount=purchase.commission_amount,
-                balance_type="referral",
-                description=f"Комиссия за реферальную покупку товара (заказ {order.order_number})",
-                reference_id=order.id,
-                status="completed"
-            )
-            db.add(referrer_transaction)
-
-            # Update purchase status
-            purchase.status = "completed"
-            purchase.completed_at = datetime.utcnow()
+        await commit_coupons(db, [order.id])
+        if not settle_later:
+            await db.flush()  # settle_orders only picks up completed orders
+            await settle_orders(db, [order.id])
 
     await db.commit()
 
+    if settle_later:
+        enqueue_settlement([order.id])
+    if released_coupon:
+        await invalidate_coupon(released_coupon)
+    await publish_orders([order], "status_changed")
+
     return {"success": True, "message": f"Order status changed to {data.status}"}
 
 
@@ -794,3 +1071,69 @@ async def get_platform_stats(
         "partner_platform_share": round(partner_platform_share, 2),
         "partner_active_products": partner_active_products or 0
     }
+
+
+# Bulk Notifications
+
+def _fanout_response(fanout: NotificationFanout) -> dict:
+    return {
+        "id": str(fanout.id),
+        "audience": fanout.audience,
+        "params": fanout.params,
+        "status": fanout.status,
+        "sent_count": fanout.sent_count,
+        "error": fanout.error,
+        "created_at": fanout.created_at,
+        "started_at": fanout.started_at,
+        "completed_at": fanout.completed_at,
+    }
+
+
+@router.post("/notifications/fanout", status_code=status.HTTP_202_ACCEPTED)
+async def create_notification_fanout(
+    data: NotificationFanoutCreate,
+    current_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Send one notification to an audience (admin only)
+
+    Delivered in the background by a Celery worker. Title and message may
+    use {name} for the recipient's name.
+    Audiences: all_users, users {user_ids}, seller_followers {seller_id},
+    tariff_expiring {days}, settlement_referrers {order_ids}
+    """
+    try:
+        fanout = await create_fanout(
+            db,
+            audience=data.audience,
+            params=data.params,
+            type=data.type,
+            title=data.title,
+            message=data.message,
+            data=data.data,
+            created_by=current_user.id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    await db.commit()
+    enqueue_fanout(fanout.id)
+
+    return _fanout_response(fanout)
+
+
+@router.get("/notifications/fanout/{fanout_id}")
+async def get_notification_fanout(
+    fanout_id: UUID,
+    current_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """Progress of a bulk notification job (admin only)"""
+    fanout = await db.get(NotificationFanout, fanout_id)
+    if not fanout:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Fan-out job not found"
+        )
+    return _fanout_response(fanout)
@@ -8,7 +8,7 @@ from typing import Optional
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-from app.database.session import get_db
+from app.database.session import get_read_db
 from app.models.user import User, SellerProfile
 from app.models.product import Product
 from app.models.order import Order
@@ -31,7 +31,7 @@ async def verify_seller_access(current_user: User):
 @router.get("/dashboard")
 async def get_seller_dashboard(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get seller dashboard statistics
@@ -159,7 +159,7 @@ async def get_products_performance(
     limit: int = Query(10, le=50, description="Number of products to return"),
     sort_by: str = Query("views", description="Sort by: views, orders, revenue"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get top performing products
@@ -253,7 +253,7 @@ async def get_products_performance(
 async def get_sales_by_period(
     period: str = Query("week", description="Period: day, week, month, year"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get sales statistics for a specific period
@@ -320,7 +320,7 @@ async def get_sales_by_period(
 @router.get("/reviews/stats")
 async def get_reviews_statistics(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get detailed review statistics for seller
@@ -387,7 +387,7 @@ async def get_reviews_statistics(
 @router.get("/traffic/sources")
 async def get_traffic_sources(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get traffic sources statistics
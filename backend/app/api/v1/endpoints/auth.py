@@ -18,6 +18,7 @@ from app.schemas.auth import (
     EmailLoginRequest
 )
 from app.services.google_auth import google_auth_service
+from app.services.referral_stats import record_signup
 from app.core.security import (
     create_access_token,
     create_refresh_token,
@@ -93,6 +94,7 @@ async def google_auth(
         )
         db.add(user)
         await db.flush()  # Flush to get user.id
+        await record_signup(db, referred_by_user_id)
 
         # Create wallet for new user
         wallet = Wallet(user_id=user.id)
@@ -266,6 +268,7 @@ async def register_with_email(
     )
     db.add(user)
     await db.flush()  # Flush to get user.id
+    await record_signup(db, referrer_id)
 
     # Create wallet for new user
     wallet = Wallet(user_id=user.id)
@@ -6,10 +6,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from typing import Optional
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.product import Category
 from app.models.user import User
 from app.core.dependencies import get_current_active_user
+from app.services.reference_data import current as current_reference_data, request_reload
+from app.services.catalog_facets import get_facets
+from app.services.price_stats import get_price_facets
 from pydantic import BaseModel, Field
 
 router = APIRouter()
@@ -65,34 +68,24 @@ async def check_admin_access(current_user: User = Depends(get_current_active_use
 async def get_categories(
     level: Optional[int] = Query(None, ge=1, le=3, description="Filter by level"),
     parent_id: Optional[int] = Query(None, description="Filter by parent category"),
-    is_active: Optional[bool] = Query(None, description="Filter by active status"),
-    db: AsyncSession = Depends(get_db)
+    is_active: Optional[bool] = Query(None, description="Filter by active status")
 ):
     """
     Get all categories with optional filters
 
     Public endpoint - no authentication required
+    Served from the in-memory reference registry
     """
-    query = select(Category)
-
-    # Apply filters
-    if level is not None:
-        query = query.where(Category.level == level)
-
-    if parent_id is not None:
-        query = query.where(Category.parent_id == parent_id)
-
-    if is_active is not None:
-        query = query.where(Category.is_active == is_active)
-    else:
-        # By default, show only active categories
-        query = query.where(Category.is_active == True)
+    # By default, show only active categories
+    active = True if is_active is None else is_active
 
-    # Sort by sort_order, then by name
-    query = query.order_by(Category.sort_order, Category.name)
-
-    result = await db.execute(query)
-    categories = result.scalars().all()
+    # Sorted by sort_order, then by name
+    categories = [
+        c for c in (await current_reference_data()).sorted_categories()
+        if c.is_active == active
+        and (level is None or c.level == level)
+        and (parent_id is None or c.parent_id == parent_id)
+    ]
 
     return {
         "items": [
@@ -114,21 +107,25 @@ async def get_categories(
 
 @router.get("/tree")
 async def get_categories_tree(
-    db: AsyncSession = Depends(get_db)
+    city_id: Optional[int] = Query(None, description="Count only products of sellers in this city"),
+    seller_type: Optional[str] = Query(None, description="Count only products of this seller type"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get categories as hierarchical tree structure
 
-    Returns root categories with nested children up to 3 levels
+    Returns root categories with nested children up to 3 levels.
+    product_count is the number of active products in the category and
+    its subcategories (materialized counts, no per-node query).
     Public endpoint - no authentication required
     """
+    facets = await get_facets(db, city_id=city_id, seller_type=seller_type)
+    counts = facets["categories"]
+
     # Get all active categories
-    result = await db.execute(
-        select(Category)
-        .where(Category.is_active == True)
-        .order_by(Category.level, Category.sort_order, Category.name)
-    )
-    all_categories = result.scalars().all()
+    all_categories = [
+        c for c in (await current_reference_data()).sorted_categories() if c.is_active
+    ]
 
     # Build tree structure using dictionary for O(1) lookup
     categories_dict = {}
@@ -143,6 +140,7 @@ async def get_categories_tree(
             "level": category.level,
             "icon": category.icon,
             "sort_order": category.sort_order,
+            "product_count": counts.get(category.id, 0),
             "children": []
         }
 
@@ -163,20 +161,52 @@ async def get_categories_tree(
     return {"tree": tree}
 
 
-@router.get("/{category_id}")
-async def get_category(
-    category_id: int,
-    db: AsyncSession = Depends(get_db)
+@router.get("/facets")
+async def get_catalog_facets(
+    category_id: Optional[int] = Query(None, description="Selected category (includes subcategories)"),
+    city_id: Optional[int] = Query(None, description="Selected city"),
+    seller_type: Optional[str] = Query(None, description="Selected seller type"),
+    db: AsyncSession = Depends(get_read_db)
 ):
+    """
+    Active product counts for the filter sidebar
+
+    Counts per category (with subcategories), city and seller type. Each
+    facet is counted within the other selected filters, so it shows what
+    picking another value would give. price_facets is the price histogram
+    of the selected category.
+    Public endpoint - no authentication required
+    """
+    facets = await get_facets(db, category_id=category_id, city_id=city_id, seller_type=seller_type)
+    refs = await current_reference_data()
+
+    return {
+        "categories": sorted((
+            {"id": category_id, "name": refs.categories[category_id].name, "count": count}
+            for category_id, count in facets["categories"].items()
+            if category_id in refs.categories and refs.categories[category_id].is_active
+        ), key=lambda item: -item["count"]),
+        "cities": sorted((
+            {"id": city_id, "name": refs.city_name(city_id), "count": count}
+            for city_id, count in facets["cities"].items()
+        ), key=lambda item: -item["count"]),
+        "seller_types": sorted((
+            {"seller_type": seller_type, "count": count}
+            for seller_type, count in facets["seller_types"].items()
+        ), key=lambda item: -item["count"]),
+        "total": facets["total"],
+        "price_facets": await get_price_facets(db, category_id)
+    }
+
+
+@router.get("/{category_id}")
+async def get_category(category_id: int):
     """
     Get category by ID
 
     Public endpoint - no authentication required
     """
-    result = await db.execute(
-        select(Category).where(Category.id == category_id)
-    )
-    category = result.scalar_one_or_none()
+    category = (await current_reference_data()).categories.get(category_id)
 
     if not category:
         raise HTTPException(
@@ -248,6 +278,7 @@ async def create_category(
     db.add(category)
     await db.commit()
     await db.refresh(category)
+    await request_reload()
 
     return CategoryResponse(
         id=category.id,
@@ -328,6 +359,7 @@ async def update_category(
 
     await db.commit()
     await db.refresh(category)
+    await request_reload()
 
     return CategoryResponse(
         id=category.id,
@@ -379,6 +411,7 @@ async def delete_category(
     # Soft delete - mark as inactive
     category.is_active = False
     await db.commit()
+    await request_reload()
 
     return {
         "message": "Category deactivated successfully",
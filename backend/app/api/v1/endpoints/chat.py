@@ -7,6 +7,7 @@ from sqlalchemy import select, desc, or_, and_, func
 from typing import Optional, Dict, List
 from uuid import UUID
 from datetime import datetime
+import asyncio
 import json
 
 from app.database.session import get_db
@@ -14,6 +15,7 @@ from app.models.chat import Chat, Message
 from app.models.user import User
 from app.models.product import Product
 from app.core.dependencies import get_current_active_user
+from app.services.realtime import Subscription, hub, publish
 from app.schemas.chat import (
     ChatCreateRequest,
     ChatResponse,
@@ -26,24 +28,39 @@ router = APIRouter()
 
 # WebSocket connection manager
 class ConnectionManager:
+    """
+    Chat sockets on top of the realtime bus (app.services.realtime)
+
+    Messages are published to the recipient's "chat" topic, so they reach
+    every open socket of the user, on any API worker.
+    """
     def __init__(self):
-        # Store active connections: {user_id: websocket}
-        self.active_connections: Dict[str, WebSocket] = {}
+        # Store active connections: {websocket: (subscription, forwarding task)}
+        self.active_connections: Dict[WebSocket, tuple] = {}
 
     async def connect(self, user_id: str, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        subscription = hub.subscribe(user_id, ["chat"])
+        forwarder = asyncio.create_task(self._forward(websocket, subscription))
+        self.active_connections[websocket] = (subscription, forwarder)
 
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.active_connections:
+            subscription, forwarder = self.active_connections.pop(websocket)
+            forwarder.cancel()
+            hub.unsubscribe(subscription)
 
-    async def send_message_to_user(self, user_id: str, message: dict):
-        if user_id in self.active_connections:
+    async def _forward(self, websocket: WebSocket, subscription: Subscription):
+        while True:
+            event = await subscription.queue.get()
             try:
-                await self.active_connections[user_id].send_json(message)
-            except:
-                self.disconnect(user_id)
+                await websocket.send_json({"type": event["type"], **event["data"]})
+            except Exception:
+                return
+
+    async def send_message_to_user(self, user_id: str, message: dict):
+        data = {key: value for key, value in message.items() if key != "type"}
+        await publish(user_id, "chat", message["type"], data)
 
 manager = ConnectionManager()
 
@@ -496,7 +513,7 @@ async def websocket_endpoint(
                     })
 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        manager.disconnect(websocket)
     except Exception as e:
-        manager.disconnect(user_id)
+        manager.disconnect(websocket)
         print(f"WebSocket error: {e}")
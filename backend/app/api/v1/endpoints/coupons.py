@@ -7,11 +7,13 @@ from sqlalchemy import select, desc, func, and_
 from typing import Optional
 from uuid import UUID
 from datetime import datetime, timedelta
+from decimal import Decimal
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.coupon import Coupon, CouponUsage, CouponType
 from app.models.user import User
 from app.core.dependencies import get_current_active_user
+from app.services.coupons import CouponError, get_coupon, get_user_uses, check_coupon, invalidate_coupon
 from pydantic import BaseModel, Field
 
 router = APIRouter()
@@ -140,6 +142,7 @@ async def create_coupon(
     db.add(coupon)
     await db.commit()
     await db.refresh(coupon)
+    await invalidate_coupon(coupon.code)  # Code may be cached as unknown
 
     return CouponResponse(
         id=str(coupon.id),
@@ -165,99 +168,32 @@ async def validate_coupon(
     order_amount: int = Query(..., gt=0, description="Order amount in KGS"),
     seller_id: Optional[UUID] = Query(None, description="Seller ID for seller-specific coupons"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Validate a coupon code
 
-    Returns validation status and potential discount amount
+    Returns validation status and potential discount amount. The coupon comes
+    from the cache; the limit itself is enforced when the order is placed.
     """
-    # Get coupon
-    result = await db.execute(
-        select(Coupon).where(Coupon.code == code.upper())
-    )
-    coupon = result.scalar_one_or_none()
-
-    if not coupon:
-        return CouponValidateResponse(
-            is_valid=False,
-            message="Coupon code not found"
-        )
-
-    # Check if active
-    if not coupon.is_active:
-        return CouponValidateResponse(
-            is_valid=False,
-            message="Coupon is not active"
-        )
-
-    # Check validity period
-    now = datetime.utcnow()
-    if now < coupon.valid_from:
-        return CouponValidateResponse(
-            is_valid=False,
-            message=f"Coupon is not yet valid (starts from {coupon.valid_from.strftime('%Y-%m-%d')})"
-        )
-
-    if now > coupon.valid_until:
-        return CouponValidateResponse(
-            is_valid=False,
-            message="Coupon has expired"
-        )
-
-    # Check usage limit
-    if coupon.max_uses and coupon.used_count >= coupon.max_uses:
-        return CouponValidateResponse(
-            is_valid=False,
-            message="Coupon usage limit reached"
-        )
-
-    # Check seller restriction
-    if coupon.seller_id:
-        if not seller_id or coupon.seller_id != seller_id:
-            return CouponValidateResponse(
-                is_valid=False,
-                message="Coupon is only valid for specific seller"
-            )
-
-    # Check user usage limit
-    user_usage_result = await db.execute(
-        select(func.count())
-        .select_from(CouponUsage)
-        .where(
-            CouponUsage.coupon_id == coupon.id,
-            CouponUsage.user_id == current_user.id
-        )
-    )
-    user_usage_count = user_usage_result.scalar()
-
-    if user_usage_count >= coupon.max_uses_per_user:
-        return CouponValidateResponse(
-            is_valid=False,
-            message=f"You have already used this coupon {coupon.max_uses_per_user} time(s)"
-        )
-
-    # Check minimum order amount
-    if coupon.min_order_amount and order_amount < coupon.min_order_amount:
+    coupon = await get_coupon(db, code)
+    try:
+        user_uses = await get_user_uses(db, coupon.id, current_user.id) if coupon else 0
+        check_coupon(coupon, Decimal(order_amount), seller_id, user_uses)
+    except CouponError as e:
         return CouponValidateResponse(
             is_valid=False,
-            message=f"Minimum order amount is {coupon.min_order_amount} KGS"
+            message=e.detail
         )
 
-    # Calculate discount
-    if coupon.type == CouponType.PERCENTAGE:
-        discount = int(order_amount * coupon.value / 100)
-    else:  # FIXED
-        discount = min(coupon.value, order_amount)  # Can't discount more than order amount
-
     return CouponValidateResponse(
         is_valid=True,
         message="Coupon is valid",
-        discount_amount=discount,
+        discount_amount=int(coupon.discount_for(Decimal(order_amount))),
         coupon=CouponResponse(
-            id=str(coupon.id),
+            id=coupon.id,
             code=coupon.code,
-            type=coupon.type.value,
+            type=coupon.type,
             value=coupon.value,
             max_uses=coupon.max_uses,
             used_count=coupon.used_count,
@@ -266,7 +202,7 @@ async def validate_coupon(
             valid_from=coupon.valid_from,
             valid_until=coupon.valid_until,
             is_active=coupon.is_active,
-            seller_id=str(coupon.seller_id) if coupon.seller_id else None,
+            seller_id=coupon.seller_id,
             description=coupon.description,
             created_at=coupon.created_at
         )
@@ -366,6 +302,7 @@ async def deactivate_coupon(
     coupon.is_active = False
     coupon.updated_at = datetime.utcnow()
     await db.commit()
+    await invalidate_coupon(coupon.code)
 
     return {
         "message": "Coupon deactivated successfully",
@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from io import StringIO
 import csv
 
-from app.database.session import get_db
+from app.database.session import get_read_db
 from app.models.user import User
 from app.models.order import Order
 from app.models.product import Product
@@ -33,7 +33,7 @@ async def export_orders_csv(
     period: str = Query("month", description="Period: week, month, quarter, year, all"),
     status_filter: Optional[str] = Query(None, description="Filter by status"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Export seller orders to CSV
@@ -129,7 +129,7 @@ async def export_orders_csv(
 async def export_products_csv(
     status_filter: Optional[str] = Query(None, description="Filter by status"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Export seller products to CSV
@@ -201,7 +201,7 @@ async def export_products_csv(
 async def export_analytics_json(
     period: str = Query("month", description="Period: week, month, quarter, year"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Export seller analytics in JSON format
@@ -294,7 +294,7 @@ async def export_analytics_json(
 async def export_comprehensive_report(
     format: str = Query("json", description="Format: json or csv"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Generate comprehensive seller report
@@ -13,6 +13,7 @@ from app.models.favorite import Favorite, ViewHistory
 from app.models.product import Product
 from app.models.user import User
 from app.core.dependencies import get_current_active_user
+from app.services.recommendations import record_view, reset_user_history
 
 router = APIRouter()
 
@@ -226,6 +227,9 @@ async def record_product_view(
     # Increment product views count
     product.views_count += 1
 
+    # Category affinity and seen filter for /recommendations/for-you
+    await record_view(db, current_user.id, product)
+
     await db.commit()
 
     return {
@@ -324,6 +328,8 @@ async def clear_view_history(
     for view in views:
         await db.delete(view)
 
+    await reset_user_history(db, current_user.id)
+
     await db.commit()
 
     return {
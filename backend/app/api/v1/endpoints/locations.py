@@ -1,5 +1,8 @@
 """
 Location Endpoints (Cities and Markets)
+
+Served from the in-memory reference registry (app.services.reference_data);
+only per-request counts of sellers go to the database.
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -7,24 +10,29 @@ from sqlalchemy import select, func
 from typing import Optional
 
 from app.database.session import get_db
-from app.models.location import City, Market
+from app.services.reference_data import MarketRef, current as current_reference_data
 
 router = APIRouter()
 
 
+def _market_dict(m: MarketRef) -> dict:
+    return {
+        "id": m.id,
+        "name": m.name,
+        "address": m.address,
+        "latitude": m.latitude,
+        "longitude": m.longitude
+    }
+
+
 @router.get("/cities")
-async def get_cities(
-    db: AsyncSession = Depends(get_db)
-):
+async def get_cities():
     """
     Get list of all cities
 
     Returns cities ordered by sort_order
     """
-    result = await db.execute(
-        select(City).order_by(City.sort_order, City.name)
-    )
-    cities = result.scalars().all()
+    cities = (await current_reference_data()).sorted_cities()
 
     return {
         "items": [
@@ -41,19 +49,14 @@ async def get_cities(
 
 
 @router.get("/cities/{city_id}")
-async def get_city_details(
-    city_id: int,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_city_details(city_id: int):
     """
     Get city details including markets count
 
     Returns city information and number of markets
     """
-    result = await db.execute(
-        select(City).where(City.id == city_id)
-    )
-    city = result.scalar_one_or_none()
+    refs = await current_reference_data()
+    city = refs.cities.get(city_id)
 
     if not city:
         raise HTTPException(
@@ -61,36 +64,24 @@ async def get_city_details(
             detail="City not found"
         )
 
-    # Count markets in this city
-    markets_count_result = await db.execute(
-        select(func.count()).select_from(Market).where(Market.city_id == city_id)
-    )
-    markets_count = markets_count_result.scalar()
-
     return {
         "id": city.id,
         "name": city.name,
         "slug": city.slug,
         "region": city.region,
-        "markets_count": markets_count or 0
+        "markets_count": len(refs.sorted_markets(city_id))
     }
 
 
 @router.get("/cities/{city_id}/markets")
-async def get_city_markets(
-    city_id: int,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_city_markets(city_id: int):
     """
     Get markets in a specific city
 
     Returns list of markets with their details
     """
-    # Verify city exists
-    city_result = await db.execute(
-        select(City).where(City.id == city_id)
-    )
-    city = city_result.scalar_one_or_none()
+    refs = await current_reference_data()
+    city = refs.cities.get(city_id)
 
     if not city:
         raise HTTPException(
@@ -98,61 +89,27 @@ async def get_city_markets(
             detail="City not found"
         )
 
-    # Get markets
-    result = await db.execute(
-        select(Market).where(Market.city_id == city_id).order_by(Market.name)
-    )
-    markets = result.scalars().all()
+    markets = refs.sorted_markets(city_id)
 
     return {
         "city_id": city_id,
         "city_name": city.name,
-        "items": [
-            {
-                "id": m.id,
-                "name": m.name,
-                "address": m.address,
-                "latitude": float(m.latitude) if m.latitude else None,
-                "longitude": float(m.longitude) if m.longitude else None
-            }
-            for m in markets
-        ],
+        "items": [_market_dict(m) for m in markets],
         "total": len(markets)
     }
 
 
 @router.get("/markets")
-async def get_all_markets(
-    city_id: Optional[int] = None,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_all_markets(city_id: Optional[int] = None):
     """
     Get list of all markets
 
     Optionally filter by city_id
     """
-    query = select(Market)
-
-    if city_id:
-        query = query.where(Market.city_id == city_id)
-
-    query = query.order_by(Market.name)
-
-    result = await db.execute(query)
-    markets = result.scalars().all()
+    markets = (await current_reference_data()).sorted_markets(city_id or None)
 
     return {
-        "items": [
-            {
-                "id": m.id,
-                "city_id": m.city_id,
-                "name": m.name,
-                "address": m.address,
-                "latitude": float(m.latitude) if m.latitude else None,
-                "longitude": float(m.longitude) if m.longitude else None
-            }
-            for m in markets
-        ],
+        "items": [{**_market_dict(m), "city_id": m.city_id} for m in markets],
         "total": len(markets)
     }
 
@@ -167,10 +124,8 @@ async def get_market_details(
 
     Returns market information with city details
     """
-    result = await db.execute(
-        select(Market).where(Market.id == market_id)
-    )
-    market = result.scalar_one_or_none()
+    refs = await current_reference_data()
+    market = refs.markets.get(market_id)
 
     if not market:
         raise HTTPException(
@@ -178,12 +133,6 @@ async def get_market_details(
             detail="Market not found"
         )
 
-    # Get city info
-    city_result = await db.execute(
-        select(City).where(City.id == market.city_id)
-    )
-    city = city_result.scalar_one_or_none()
-
     # Count sellers in this market
     from app.models.user import SellerProfile
     sellers_count_result = await db.execute(
@@ -192,12 +141,8 @@ async def get_market_details(
     sellers_count = sellers_count_result.scalar()
 
     return {
-        "id": market.id,
+        **_market_dict(market),
         "city_id": market.city_id,
-        "city_name": city.name if city else None,
-        "name": market.name,
-        "address": market.address,
-        "latitude": float(market.latitude) if market.latitude else None,
-        "longitude": float(market.longitude) if market.longitude else None,
+        "city_name": refs.city_name(market.city_id),
         "sellers_count": sellers_count or 0
     }
@@ -8,15 +8,27 @@ from typing import Optional
 from uuid import UUID
 from datetime import datetime
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.notification import Notification
 from app.models.user import User
 from app.core.dependencies import get_current_active_user
+from app.services.notifications import (
+    create_notifications,
+    mark_read,
+    delete_notifications,
+    get_unread_count as unread_count,
+)
+from app.services.realtime import publish
 from pydantic import BaseModel, Field
 
 router = APIRouter()
 
 
+async def _push_unread_count(db: AsyncSession, user_id: UUID):
+    """Send the new badge value to the user's open connections (after commit)"""
+    await publish(user_id, "notifications", "unread_count", {"unread_count": await unread_count(db, user_id)})
+
+
 # Schemas
 class NotificationCreate(BaseModel):
     """Notification creation schema (internal use)"""
@@ -53,16 +65,25 @@ async def create_notification(
 
     This can be called from other endpoints when events occur
     """
-    notification = Notification(
-        user_id=user_id,
-        type=type,
-        title=title,
-        message=message,
-        data=data
-    )
-    db.add(notification)
+    (notification_id,) = await create_notifications(db, [{
+        "user_id": user_id,
+        "type": type,
+        "title": title,
+        "message": message,
+        "data": data
+    }])
     await db.commit()
-    await db.refresh(notification)
+    notification = await db.get(Notification, notification_id)
+
+    await publish(user_id, "notifications", "created", {
+        "id": notification.id,
+        "type": notification.type,
+        "title": notification.title,
+        "message": notification.message,
+        "data": notification.data,
+        "created_at": notification.created_at,
+    })
+    await _push_unread_count(db, user_id)
     return notification
 
 
@@ -134,25 +155,17 @@ async def get_notifications(
 @router.get("/unread/count")
 async def get_unread_count(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get count of unread notifications for current user
 
-    Useful for badge display in UI
+    Useful for badge display in UI. Reads the maintained counter, not a COUNT.
     """
-    result = await db.execute(
-        select(func.count())
-        .select_from(Notification)
-        .where(
-            Notification.user_id == current_user.id,
-            Notification.is_read == False
-        )
-    )
-    count = result.scalar()
+    count = await unread_count(db, current_user.id)
 
     return {
-        "unread_count": count or 0
+        "unread_count": count
     }
 
 
@@ -200,24 +213,22 @@ async def mark_as_read(
     """
     Mark notification as read
     """
-    result = await db.execute(
-        select(Notification).where(
-            Notification.id == notification_id,
-            Notification.user_id == current_user.id
-        )
-    )
-    notification = result.scalar_one_or_none()
-
-    if not notification:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Notification not found"
+    if not await mark_read(db, current_user.id, [notification_id]):
+        # Already read, or not found
+        exists = await db.scalar(
+            select(Notification.id).where(
+                Notification.id == notification_id,
+                Notification.user_id == current_user.id
+            )
         )
+        if not exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Notification not found"
+            )
 
-    if not notification.is_read:
-        notification.is_read = True
-        notification.read_at = datetime.utcnow()
-        await db.commit()
+    await db.commit()
+    await _push_unread_count(db, current_user.id)
 
     return {
         "message": "Notification marked as read",
@@ -233,21 +244,9 @@ async def mark_all_as_read(
     """
     Mark all notifications as read for current user
     """
-    result = await db.execute(
-        select(Notification).where(
-            Notification.user_id == current_user.id,
-            Notification.is_read == False
-        )
-    )
-    notifications = result.scalars().all()
-
-    count = 0
-    for notification in notifications:
-        notification.is_read = True
-        notification.read_at = datetime.utcnow()
-        count += 1
-
+    count = await mark_read(db, current_user.id)
     await db.commit()
+    await _push_unread_count(db, current_user.id)
 
     return {
         "message": f"Marked {count} notifications as read",
@@ -264,22 +263,14 @@ async def delete_notification(
     """
     Delete notification
     """
-    result = await db.execute(
-        select(Notification).where(
-            Notification.id == notification_id,
-            Notification.user_id == current_user.id
-        )
-    )
-    notification = result.scalar_one_or_none()
-
-    if not notification:
+    if not await delete_notifications(db, current_user.id, [notification_id]):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notification not found"
         )
 
-    await db.delete(notification)
     await db.commit()
+    await _push_unread_count(db, current_user.id)
 
     return {
         "message": "Notification deleted successfully",
@@ -295,16 +286,9 @@ async def delete_all_notifications(
     """
     Delete all notifications for current user
     """
-    result = await db.execute(
-        select(Notification).where(Notification.user_id == current_user.id)
-    )
-    notifications = result.scalars().all()
-
-    count = len(notifications)
-    for notification in notifications:
-        await db.delete(notification)
-
+    count = await delete_notifications(db, current_user.id)
     await db.commit()
+    await _push_unread_count(db, current_user.id)
 
     return {
         "message": f"Deleted {count} notifications",
@@ -11,15 +11,41 @@ from datetime import datetime
 
 from app.database.session import get_db
 from app.models.order import Order
-from app.models.product import Product
 from app.models.user import User
-from app.models.wallet import Wallet, Transaction, ProductReferralPurchase
+from app.core.config import settings
 from app.core.dependencies import get_current_active_user
-from app.schemas.order import OrderCreate, OrderStatusUpdate, OrderResponse, OrderListItem
+from app.schemas.order import OrderCreate, OrderStatusUpdate, OrderResponse, OrderListItem, CartCheckout, CartCheckoutResponse
+from app.services.order_placement import (
+    OrderDraft, OrderPlacementError, load_products, place_orders, split_by_seller, release_stock
+)
+from app.services.referral_settlement import settle_orders
+from app.services.referral_stats import cancel_order_purchases
+from app.services.coupons import commit_coupons, release_coupon, invalidate_coupon
+from app.services.realtime import publish_orders
+from app.tasks.referrals import enqueue_settlement
 
 router = APIRouter()
 
 
+def _order_response(order: Order) -> OrderResponse:
+    return OrderResponse(
+        id=str(order.id),
+        order_number=order.order_number,
+        buyer_id=str(order.buyer_id),
+        seller_id=str(order.seller_id),
+        items=order.items,
+        total_amount=order.total_amount,
+        discount_amount=order.discount_amount or 0,
+        delivery_address=order.delivery_address,
+        phone_number=order.phone_number,
+        payment_method=order.payment_method,
+        notes=order.notes,
+        status=order.status,
+        created_at=order.created_at,
+        updated_at=order.updated_at
+    )
+
+
 @router.post("/", response_model=OrderResponse)
 async def create_order(
     order_data: OrderCreate,
@@ -30,10 +56,11 @@ async def create_order(
     Create a new order
 
     Process:
-    1. Validate all products exist and belong to seller
-    2. Calculate total amount
+    1. Validate all products exist and belong to seller (one query)
+    2. Reserve stock atomically (409 if any item is out of stock)
     3. Create order with cash payment (payment on delivery)
-    4. Create product referral purchase records if applicable
+    4. Create product referral purchase records if applicable (one insert)
+    5. Reserve the coupon redemption if coupon_code is given
     """
     if not order_data.items:
         raise HTTPException(
@@ -52,117 +79,69 @@ async def create_order(
             detail="Seller not found"
         )
 
-    # Validate products and calculate total
-    total_amount = Decimal(0)
-    order_items = []
-
-    for item in order_data.items:
-        product_result = await db.execute(
-            select(Product).where(Product.id == UUID(item.product_id))
+    try:
+        products = await load_products(db, order_data.items)
+        orders = await place_orders(
+            db,
+            buyer_id=current_user.id,
+            drafts=[OrderDraft(seller_id=seller.id, items=order_data.items)],
+            products=products,
+            delivery_address=order_data.delivery_address,
+            phone_number=order_data.phone_number,
+            payment_method=order_data.payment_method,
+            notes=order_data.notes,
+            coupon_code=order_data.coupon_code,
         )
-        product = product_result.scalar_one_or_none()
+    except OrderPlacementError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-        if not product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Product {item.product_id} not found"
-            )
+    await db.commit()
+    await publish_orders(orders, "created")
 
-        if str(product.seller_id) != order_data.seller_id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product {item.product_id} does not belong to seller"
-            )
+    return _order_response(orders[0])
 
-        if product.status != "active":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product {product.title} is not available"
-            )
 
-        # Use discount price if available, otherwise regular price
-        item_price = item.discount_price if item.discount_price else item.price
-        total_amount += item_price * item.quantity
-
-        order_items.append({
-            "product_id": str(product.id),
-            "product_title": product.title,
-            "quantity": item.quantity,
-            "price": float(item.price),
-            "discount_price": float(item.discount_price) if item.discount_price else None
-        })
-
-    # Create order with cash payment (payment on delivery)
-    order = Order(
-        order_number=Order.generate_order_number(),
-        buyer_id=current_user.id,
-        seller_id=UUID(order_data.seller_id),
-        items=order_items,
-        total_amount=total_amount,
-        delivery_address=order_data.delivery_address,
-        phone_number=order_data.phone_number,
-        payment_method=order_data.payment_method,
-        notes=order_data.notes,
-        status="pending"  # Cash orders start as pending
-    )
+@router.post("/cart", response_model=CartCheckoutResponse)
+async def checkout_cart(
+    checkout_data: CartCheckout,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Checkout a multi-seller cart
 
-    db.add(order)
-    await db.flush()  # Flush to get order.id
-
-    # Process product referral purchases
-    # Create ProductReferralPurchase records for products with referral program enabled
-    for item in order_data.items:
-        # Check if product_referrer_id exists and is not empty
-        if item.product_referrer_id and item.product_referrer_id.strip():
-            try:
-                # Validate that product_referrer_id is a valid UUID
-                referrer_uuid = UUID(item.product_referrer_id)
-
-                # Get product to check if referral program is enabled
-                product_result = await db.execute(
-                    select(Product).where(Product.id == UUID(item.product_id))
-                )
-                product = product_result.scalar_one_or_none()
-
-                if product and product.is_referral_enabled and product.referral_commission_percent:
-                    # Calculate commission amount
-                    item_price = item.discount_price if item.discount_price else item.price
-                    total_item_price = item_price * item.quantity
-                    commission_amount = (total_item_price * product.referral_commission_percent) / Decimal('100')
-
-                    # Create ProductReferralPurchase record
-                    referral_purchase = ProductReferralPurchase(
-                        referrer_id=referrer_uuid,
-                        buyer_id=current_user.id,
-                        product_id=UUID(item.product_id),
-                        order_id=order.id,
-                        commission_percent=product.referral_commission_percent,
-                        commission_amount=commission_amount,
-                        product_price=total_item_price,
-                        status="pending"  # Will be completed when order is confirmed
-                    )
-                    db.add(referral_purchase)
-            except (ValueError, AttributeError):
-                # Skip invalid referrer_id (not a valid UUID)
-                continue
+    Splits the cart into one order per seller and creates all of them, with
+    stock reservation and referral records, in a single transaction: either
+    every order is placed or none is.
+    """
+    if not checkout_data.items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Order must contain at least one item"
+        )
+
+    try:
+        products = await load_products(db, checkout_data.items)
+        orders = await place_orders(
+            db,
+            buyer_id=current_user.id,
+            drafts=split_by_seller(checkout_data.items, products),
+            products=products,
+            delivery_address=checkout_data.delivery_address,
+            phone_number=checkout_data.phone_number,
+            payment_method=checkout_data.payment_method,
+            notes=checkout_data.notes,
+            coupon_code=checkout_data.coupon_code,
+        )
+    except OrderPlacementError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     await db.commit()
-    await db.refresh(order)
+    await publish_orders(orders, "created")
 
-    return OrderResponse(
-        id=str(order.id),
-        order_number=order.order_number,
-        buyer_id=str(order.buyer_id),
-        seller_id=str(order.seller_id),
-        items=order.items,
-        total_amount=order.total_amount,
-        delivery_address=order.delivery_address,
-        phone_number=order.phone_number,
-        payment_method=order.payment_method,
-        notes=order.notes,
-        status=order.status,
-        created_at=order.created_at,
-        updated_at=order.updated_at
+    return CartCheckoutResponse(
+        orders=[_order_response(order) for order in orders],
+        total_amount=sum((order.total_amount for order in orders), Decimal(0))
     )
 
 
@@ -312,21 +291,7 @@ async def get_order_by_id(
             detail="You don't have permission to view this order"
         )
 
-    return OrderResponse(
-        id=str(order.id),
-        order_number=order.order_number,
-        buyer_id=str(order.buyer_id),
-        seller_id=str(order.seller_id),
-        items=order.items,
-        total_amount=order.total_amount,
-        delivery_address=order.delivery_address,
-        phone_number=order.phone_number,
-        payment_method=order.payment_method,
-        notes=order.notes,
-        status=order.status,
-        created_at=order.created_at,
-        updated_at=order.updated_at
-    )
+    return _order_response(order)
 
 
 @router.put("/{order_id}/status", response_model=OrderResponse)
@@ -339,7 +304,7 @@ async def update_order_status(
     """
     Update order status
 
-    - Seller can update to any status
+    - Seller can update to any status, except cancelling a completed order
     - Buyer can only cancel pending orders
     Valid statuses: pending, processing, completed, cancelled
     """
@@ -350,8 +315,10 @@ async def update_order_status(
             detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
         )
 
+    # Row lock: concurrent status changes of one order run one after another,
+    # so a cancellation can't release stock twice
     result = await db.execute(
-        select(Order).where(Order.id == order_id)
+        select(Order).where(Order.id == order_id).with_for_update()
     )
     order = result.scalar_one_or_none()
 
@@ -384,109 +351,40 @@ async def update_order_status(
                 detail="Можно отменить только заказы в статусе 'Ожидает'"
             )
 
+    # Commissions of a completed order are already settled
+    if order.status == "completed" and status_data.status == "cancelled":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Завершённый заказ нельзя отменить"
+        )
+
+    # Return reserved stock and coupon redemption when an order is cancelled
+    released_coupon = None
+    if status_data.status == "cancelled" and order.status != "cancelled":
+        await release_stock(db, order)
+        released_coupon = await release_coupon(db, order)
+        await cancel_order_purchases(db, order.id)
+
     # Update status
     order.status = status_data.status
     order.updated_at = datetime.utcnow()
 
-    # If order is completed, process product referral commissions
+    # If order is completed, settle product referral commissions
+    settle_later = status_data.status == "completed" and settings.REFERRAL_SETTLEMENT_ASYNC
     if status_data.status == "completed":
-        # Find all pending product referral purchases for this order
-        referral_purchases_result = await db.execute(
-            select(ProductReferralPurchase).where(
-                ProductReferralPurchase.order_id == order.id,
-                ProductReferralPurchase.status == "pending"
-            )
-        )
-        referral_purchases = referral_purchases_result.scalars().all()
+        await commit_coupons(db, [order.id])
+        if not settle_later:
+            await db.flush()  # settle_orders only picks up completed orders
+            await settle_orders(db, [order.id])
 
-        for purchase in referral_purchases:
-            # Get product to find owner
-            product_result = await db.execute(
-                select(Product).where(Product.id == purchase.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-
-            if not product:
-                continue
-
-            # Get product owner's wallet
-            owner_wallet_result = await db.execute(
-                select(Wallet).where(Wallet.user_id == product.seller_id)
-            )
-            owner_wallet = owner_wallet_result.scalar_one_or_none()
-
-            if not owner_wallet:
-                owner_wallet = Wallet(user_id=product.seller_id)
-                db.add(owner_wallet)
-                await db.flush()
-
-            # Check if owner has enough balance to pay commission
-            if owner_wallet.main_balance < purchase.commission_amount:
-                # Insufficient balance - skip this commission
-                purchase.status = "failed"
-                purchase.completed_at = datetime.utcnow()
-                continue
-
-            # Deduct commission from product owner's main balance
-            owner_wallet.main_balance -= purchase.commission_amount
-
-            # Create transaction for product owner (deduction)
-            owner_transaction = Transaction(
-                user_id=product.seller_id,
-                type="product_referral_commission_deducted",
-                amount=purchase.commission_amount,
-                balance_type="main",
-                description=f"Комиссия реферальной программы за товар (заказ {order.order_number})",
-                reference_id=order.id,
-                status="completed"
-            )
-            db.add(owner_transaction)
-
-            # Get referrer's wallet
-            referrer_wallet_result = await db.execute(
-                select(Wallet).where(Wallet.user_id == purchase.referrer_id)
-            )
-            referrer_wallet = referrer_wallet_result.scalar_one_or_none()
-
-            if not referrer_wallet:
-                referrer_wallet = Wallet(user_id=purchase.referrer_id)
-                db.add(referrer_wallet)
-                await db.flush()
-
-            # Credit commission to referrer's referral balance
-            referrer_wallet.referral_balance += purchase.commission_amount
-
-            # Create transaction for referrer (credit)
-            referrer_transaction = Transaction(
-                user_id=purchase.referrer_id,
-                type="product_referral_commission",
-                amount=purchase.commission_amount,
-                balance_type="referral",
-                description=f"Комиссия за реферальную покупку товара (заказ {order.order_number})",
-                reference_id=order.id,
-                status="completed"
-            )
-            db.add(referrer_transaction)
+    await db.commit()
 
-            # Update purchase status
-            purchase.status = "completed"
-            purchase.completed_at = datetime.utcnow()
+    if settle_later:
+        enqueue_settlement([order.id])
+    if released_coupon:
+        await invalidate_coupon(released_coupon)
 
-    await db.commit()
     await db.refresh(order)
+    await publish_orders([order], "status_changed")
 
-    return OrderResponse(
-        id=str(order.id),
-        order_number=order.order_number,
-        buyer_id=str(order.buyer_id),
-        seller_id=str(order.seller_id),
-        items=order.items,
-        total_amount=order.total_amount,
-        delivery_address=order.delivery_address,
-        phone_number=order.phone_number,
-        payment_method=order.payment_method,
-        notes=order.notes,
-        status=order.status,
-        created_at=order.created_at,
-        updated_at=order.updated_at
-    )
+    return _order_response(order)
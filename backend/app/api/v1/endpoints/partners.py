@@ -10,10 +10,12 @@ from decimal import Decimal
 from app.database.session import get_db
 from app.models.user import User
 from app.models.order import Order
-from app.models.wallet import Transaction
+from app.models.product import Product, PartnerOffer
+from app.models.wallet import Transaction, Wallet, ReferralStats
 from app.core.dependencies import get_current_active_user
 from app.core.config import settings
 from app.schemas.partner import ReferralStatsResponse, ReferralHistoryItem, PartnerLinkResponse
+from app.services.partner_offers import listed as listed_offer
 
 router = APIRouter()
 
@@ -31,41 +33,29 @@ async def get_referral_stats(
     - Total number of referrals
     - Total earnings from referral commissions
     - Current referral balance
+    - Commission on referred orders not completed yet
     """
-    # Count total referrals (users who signed up with this referral code)
-    referrals_result = await db.execute(
-        select(func.count())
-        .select_from(User)
-        .where(User.referred_by == current_user.id)
-    )
-    total_referrals = referrals_result.scalar()
-
-    # Calculate total earnings from referral commissions
-    earnings_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount), 0))
-        .select_from(Transaction)
-        .where(
-            Transaction.user_id == current_user.id,
-            Transaction.type == "referral_commission",
-            Transaction.status == "completed"
+    # Totals are kept per referrer by app.services.referral_stats
+    result = await db.execute(
+        select(
+            ReferralStats.referrals_count,
+            ReferralStats.commission_earnings,
+            ReferralStats.pending_earnings,
+            Wallet.referral_balance,
         )
+        .select_from(User)
+        .outerjoin(ReferralStats, ReferralStats.referrer_id == User.id)
+        .outerjoin(Wallet, Wallet.user_id == User.id)
+        .where(User.id == current_user.id)
     )
-    total_earnings = earnings_result.scalar()
-
-    # Get current wallet
-    from app.models.wallet import Wallet
-    wallet_result = await db.execute(
-        select(Wallet).where(Wallet.user_id == current_user.id)
-    )
-    wallet = wallet_result.scalar_one_or_none()
-    referral_balance = wallet.referral_balance if wallet else Decimal(0)
+    total_referrals, total_earnings, pending_earnings, referral_balance = result.one()
 
     return ReferralStatsResponse(
         referral_code=current_user.referral_id,
         total_referrals=total_referrals or 0,
         total_earnings=Decimal(total_earnings or 0),
-        referral_balance=referral_balance,
-        pending_earnings=Decimal(0)  # Can be calculated if there are pending orders
+        referral_balance=referral_balance or Decimal(0),
+        pending_earnings=Decimal(pending_earnings or 0)
     )
 
 
@@ -143,34 +133,34 @@ async def get_referral_earnings(
     """
     Get detailed earnings history from referral commissions
 
-    Shows all transactions where user earned referral commission
+    Shows all transactions where user earned referral commission, with the
+    order of each one (single joined query)
     """
+    # Ledger type written by app.services.referral_settlement
+    commissions = (
+        Transaction.user_id == current_user.id,
+        Transaction.type == "product_referral_commission"
+    )
     result = await db.execute(
-        select(Transaction)
-        .where(
-            Transaction.user_id == current_user.id,
-            Transaction.type == "referral_commission"
-        )
+        select(Transaction, Order.order_number, Order.total_amount)
+        .outerjoin(Order, Order.id == Transaction.reference_id)
+        .where(*commissions)
         .order_by(desc(Transaction.created_at))
         .limit(limit)
         .offset(offset)
     )
-    transactions = result.scalars().all()
+    rows = result.all()
 
     # Count total
     count_result = await db.execute(
         select(func.count())
         .select_from(Transaction)
-        .where(
-            Transaction.user_id == current_user.id,
-            Transaction.type == "referral_commission"
-        )
+        .where(*commissions)
     )
     total = count_result.scalar()
 
-    # Get order details for each transaction if reference_id exists
     earnings_with_details = []
-    for t in transactions:
+    for t, order_number, order_total in rows:
         earning = {
             "id": str(t.id),
             "amount": t.amount,
@@ -179,16 +169,9 @@ async def get_referral_earnings(
             "created_at": t.created_at,
             "order_id": str(t.reference_id) if t.reference_id else None
         }
-
-        # If reference_id exists, try to get order details
-        if t.reference_id:
-            order_result = await db.execute(
-                select(Order).where(Order.id == t.reference_id)
-            )
-            order = order_result.scalar_one_or_none()
-            if order:
-                earning["order_number"] = order.order_number
-                earning["order_total"] = float(order.total_amount)
+        if order_number is not None:
+            earning["order_number"] = order_number
+            earning["order_total"] = float(order_total)
 
         earnings_with_details.append(earning)
 
@@ -213,16 +196,12 @@ async def get_top_referral_products(
     Shows products with highest referral commission that users can promote
     These are products with referral program enabled (Business tariff only)
     """
-    from app.models.product import Product
-
-    # Get products with referral program enabled, ordered by commission percent desc
+    # Partner offer index (app.services.partner_offers), highest percent first
     result = await db.execute(
         select(Product)
-        .where(
-            Product.status == "active",
-            Product.is_referral_enabled == True
-        )
-        .order_by(desc(Product.referral_commission_percent), desc(Product.views_count))
+        .join(PartnerOffer, PartnerOffer.product_id == Product.id)
+        .where(listed_offer())
+        .order_by(desc(PartnerOffer.commission_percent), desc(PartnerOffer.commission_amount))
         .limit(limit)
     )
     products = result.scalars().all()
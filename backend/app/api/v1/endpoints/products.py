@@ -1,9 +1,9 @@
 """
 Product Endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select, desc, func, update
 from sqlalchemy.orm import selectinload
 from typing import Optional, List
 from uuid import UUID
@@ -11,12 +11,21 @@ from datetime import datetime
 from decimal import Decimal
 
 from app.database.session import get_db
-from app.models.product import Product, Category
+from app.models.product import Product, Category, PartnerOffer
 from app.models.user import User
-from app.models.wallet import Wallet, Transaction
+from app.models.wallet import Wallet
 from app.core.config import settings
 from app.core.dependencies import get_current_active_user
+from app.services.ledger import LedgerEntry, InsufficientFundsError, post_entries, make_idempotency_key
+from app.services.realtime import publish_balances
 from app.schemas.product import ProductCreate, ProductUpdate, ProductResponse
+from app.services.reference_data import current as current_reference_data
+from app.services.storefront import invalidate as invalidate_storefront
+from app.services.partner_offers import listed as listed_offer, sync_products as sync_partner_offers
+from app.services import catalog_facets, price_stats, product_attributes
+from app.services.product_attributes import InvalidAttributeFilterError
+from app.services.geo import InvalidLocationError, parse_near, seller_within, seller_distance, distance_from
+from app.tasks.moderation import enqueue_image_moderation, enqueue_duplicate_check
 
 router = APIRouter()
 
@@ -55,25 +64,12 @@ async def get_category_ids_with_children(category_id: int, db: AsyncSession) ->
 
     Args:
         category_id: Parent category ID
-        db: Database session
+        db: Database session (unused; the tree comes from the reference registry)
 
     Returns:
         List of category IDs including parent and all descendants
     """
-    category_ids = [category_id]
-
-    # Get direct children
-    result = await db.execute(
-        select(Category).where(Category.parent_id == category_id)
-    )
-    children = result.scalars().all()
-
-    # Recursively get children of children
-    for child in children:
-        child_ids = await get_category_ids_with_children(child.id, db)
-        category_ids.extend(child_ids)
-
-    return category_ids
+    return (await current_reference_data()).category_with_descendants(category_id)
 
 
 @router.get("/")
@@ -85,6 +81,10 @@ async def get_products(
     search: Optional[str] = Query(None, description="Search in product titles"),
     min_price: Optional[float] = Query(None, description="Minimum price"),
     max_price: Optional[float] = Query(None, description="Maximum price"),
+    attr: Optional[List[str]] = Query(None, description="Characteristic filter name:value, repeatable"),
+    facets: bool = Query(False, description="Include characteristic value counts of the result"),
+    near: Optional[str] = Query(None, description="Seller location near \"lat,lon\""),
+    radius_km: float = Query(settings.GEO_DEFAULT_RADIUS_KM, gt=0, le=settings.GEO_MAX_RADIUS_KM, description="Radius for near"),
     limit: int = Query(settings.DEFAULT_PAGE_SIZE, le=settings.MAX_PAGE_SIZE),
     offset: int = 0,
     db: AsyncSession = Depends(get_db)
@@ -99,19 +99,35 @@ async def get_products(
     - seller_type: Filter by seller type (market, boutique, shop, office, home, mobile, warehouse)
     - search: Search in product titles
     - min_price/max_price: Filter by price range
+    - attr: Characteristics, e.g. attr=Цвет:Черный&attr=Память:256GB; values
+      of one characteristic are OR'ed, different characteristics AND'ed
+    - near + radius_km: Sellers within radius_km of "lat,lon"; sorted by distance
+
+    With facets=true the response has attribute_facets: value counts of the
+    characteristics over the whole filtered result.
+    price_facets is the price histogram of the category (with subcategories,
+    or of the whole catalog), for the price range slider.
     """
     from app.models.user import SellerProfile
-    from sqlalchemy.orm import joinedload
+
+    point = None
+    if near:
+        try:
+            point = parse_near(near)
+        except InvalidLocationError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
+
+    try:
+        attribute_filters = product_attributes.parse_filters(attr)
+    except InvalidAttributeFilterError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
 
     # LEFT JOIN with SellerProfile to include products from users without profile
     # Select both Product and SellerProfile (SellerProfile can be None)
-    # Use joinedload to eagerly load city and market relationships
+    # City and market names come from the reference registry, not joins
     query = select(Product, SellerProfile).outerjoin(
         SellerProfile,
         Product.seller_id == SellerProfile.user_id
-    ).options(
-        joinedload(SellerProfile.city),
-        joinedload(SellerProfile.market)
     ).where(Product.status == "active")
 
     # Apply filters
@@ -139,14 +155,23 @@ async def get_products(
     if seller_type:
         query = query.where(SellerProfile.seller_type == seller_type)
 
-    # Order by promotion views remaining (promoted products first), then by created_at
-    # Products with promotion_views_remaining > 0 appear first (in random order for fairness)
-    # Then regular products sorted by newest first
-    # Use COALESCE to handle NULL values safely
-    query = query.order_by(
-        desc(func.coalesce(Product.promotion_views_remaining, 0)),
-        desc(Product.created_at)
-    )
+    if attribute_filters:
+        query = query.where(*product_attributes.filter_clauses(attribute_filters))
+
+    if point:
+        # Bounding box on the sellers' (latitude, longitude) index, then exact distance
+        query = query.where(seller_within(point, radius_km))
+        # Nearest sellers first
+        query = query.order_by(seller_distance(point), desc(Product.created_at))
+    else:
+        # Order by promotion views remaining (promoted products first), then by created_at
+        # Products with promotion_views_remaining > 0 appear first (in random order for fairness)
+        # Then regular products sorted by newest first
+        # Use COALESCE to handle NULL values safely
+        query = query.order_by(
+            desc(func.coalesce(Product.promotion_views_remaining, 0)),
+            desc(Product.created_at)
+        )
 
     # Count total before pagination - LEFT JOIN with SellerProfile
     count_query = select(func.count()).select_from(Product).outerjoin(
@@ -169,15 +194,26 @@ async def get_products(
         count_query = count_query.where(SellerProfile.city_id == city_id)
     if seller_type:
         count_query = count_query.where(SellerProfile.seller_type == seller_type)
+    if attribute_filters:
+        count_query = count_query.where(*product_attributes.filter_clauses(attribute_filters))
+    if point:
+        count_query = count_query.where(seller_within(point, radius_km))
 
     count_result = await db.execute(count_query)
     total = count_result.scalar()
 
+    attribute_facets = None
+    if facets:
+        attribute_facets = await product_attributes.facet_counts(
+            db, query.with_only_columns(Product.id).order_by(None)
+        )
+
     # Pagination
     query = query.limit(limit).offset(offset)
 
     result = await db.execute(query)
     products_with_sellers = result.all()  # Returns list of (Product, SellerProfile) tuples
+    refs = await current_reference_data()
 
     # Extract all data from products BEFORE any commit/detach
     # This avoids SQLAlchemy lazy loading issues
@@ -193,8 +229,8 @@ async def get_products(
         city_name = None
         market_name = None
         if seller_profile:
-            city_name = seller_profile.city.name if seller_profile.city else None
-            market_name = seller_profile.market.name if seller_profile.market else None
+            city_name = refs.city_name(seller_profile.city_id)
+            market_name = refs.market_name(seller_profile.market_id)
 
         product_dict = {
             "id": str(p.id),
@@ -220,6 +256,8 @@ async def get_products(
                 "market_name": market_name,
             }
         }
+        if point:
+            product_dict["distance_km"] = distance_from(point, seller_profile)
 
         products_data.append(product_dict)
 
@@ -284,6 +322,7 @@ async def get_products(
                             0
                         )
                     )
+                    .execution_options(read_your_writes=False)  # Bookkeeping, not a user write
                 )
             await db.commit()
         except Exception as e:
@@ -291,13 +330,17 @@ async def get_products(
             print(f"Warning: Failed to decrement promotion views: {e}")
             await db.rollback()
 
-    return {
+    response = {
         "items": products_data,
         "total": total,
         "limit": limit,
         "offset": offset,
         "has_more": (offset + limit) < total
     }
+    if facets:
+        response["attribute_facets"] = attribute_facets
+    response["price_facets"] = await price_stats.get_price_facets(db, category_id)
+    return response
 
 
 @router.get("/referral/products")
@@ -306,7 +349,7 @@ async def get_referral_products(
     search: Optional[str] = Query(None, description="Search in product titles"),
     min_price: Optional[float] = Query(None, description="Minimum price"),
     max_price: Optional[float] = Query(None, description="Maximum price"),
-    sort_by: Optional[str] = Query("commission", description="Sort by: commission, price, created"),
+    sort_by: Optional[str] = Query("commission", description="Sort by: commission (som), commission_percent, price, created"),
     limit: int = Query(settings.DEFAULT_PAGE_SIZE, le=settings.MAX_PAGE_SIZE),
     offset: int = 0,
     db: AsyncSession = Depends(get_db)
@@ -316,60 +359,43 @@ async def get_referral_products(
 
     Only products from Business tariff users with commission >= 1% are shown.
     All users can view and share referral links for these products.
+    Served from the partner offer index (app.services.partner_offers).
     """
-    # Base query - only products with referral enabled, commission >= 1%, and seller has Business tariff
-    query = select(Product).join(
-        User, Product.seller_id == User.id
-    ).where(
-        Product.status == "active",
-        Product.is_referral_enabled == True,
-        Product.referral_commission_percent >= 1,
-        User.tariff == "business"
-    )
+    # Only active referral products of Business sellers are listed offers
+    filters = [listed_offer()]
 
     # Apply filters
     if category_id:
         # Get all child categories to include products from subcategories
         category_ids = await get_category_ids_with_children(category_id, db)
-        query = query.where(Product.category_id.in_(category_ids))
+        filters.append(PartnerOffer.category_id.in_(category_ids))
 
     if search:
-        query = query.where(Product.title.ilike(f"%{search}%"))
+        filters.append(Product.title.ilike(f"%{search}%"))
 
     if min_price is not None:
-        query = query.where(Product.price >= min_price)
+        filters.append(Product.price >= min_price)
 
     if max_price is not None:
-        query = query.where(Product.price <= max_price)
+        filters.append(Product.price <= max_price)
+
+    query = select(Product).join(PartnerOffer, PartnerOffer.product_id == Product.id).where(*filters)
 
     # Apply sorting
     if sort_by == "commission":
-        # Sort by commission amount (highest first)
-        query = query.order_by(desc(Product.referral_commission_percent))
+        # Commission amount in som (highest first)
+        query = query.order_by(desc(PartnerOffer.commission_amount), PartnerOffer.product_id)
+    elif sort_by == "commission_percent":
+        query = query.order_by(desc(PartnerOffer.commission_percent), desc(PartnerOffer.commission_amount))
     elif sort_by == "price":
         query = query.order_by(Product.price)
     else:  # created or default
-        query = query.order_by(desc(Product.created_at))
+        query = query.order_by(desc(PartnerOffer.created_at))
 
     # Count total before pagination
-    count_query = select(func.count()).select_from(Product).join(
-        User, Product.seller_id == User.id
-    ).where(
-        Product.status == "active",
-        Product.is_referral_enabled == True,
-        Product.referral_commission_percent >= 1,
-        User.tariff == "business"
-    )
-
-    if category_id:
-        # Use same category_ids list for count query
-        count_query = count_query.where(Product.category_id.in_(category_ids))
-    if search:
-        count_query = count_query.where(Product.title.ilike(f"%{search}%"))
-    if min_price is not None:
-        count_query = count_query.where(Product.price >= min_price)
-    if max_price is not None:
-        count_query = count_query.where(Product.price <= max_price)
+    count_query = select(func.count()).select_from(PartnerOffer).where(*filters)
+    if search or min_price is not None or max_price is not None:
+        count_query = count_query.join(Product, PartnerOffer.product_id == Product.id)
 
     count_result = await db.execute(count_query)
     total = count_result.scalar()
@@ -517,8 +543,12 @@ async def create_product(
     )
 
     db.add(product)
+    await db.flush()
+    await product_attributes.sync_products(db, [product.id])
     await db.commit()
     await db.refresh(product)
+    enqueue_image_moderation()
+    enqueue_duplicate_check(product.id)
 
     return ProductResponse(
         id=str(product.id),
@@ -576,6 +606,7 @@ async def update_product(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You can only update your own products"
         )
+    facets_before = await catalog_facets.snapshot(db, Product.id == product.id)
 
     # Update fields
     if product_data.title is not None:
@@ -681,8 +712,16 @@ async def update_product(
         else:
             product.referral_commission_percent = None
 
+    await db.flush()  # sync_partner_offers and the facet counts read the updated row
+    await sync_partner_offers(db, [product.id])
+    await catalog_facets.record_change(db, facets_before, Product.id == product.id)
+    if product_data.characteristics is not None:
+        await product_attributes.sync_products(db, [product.id])
     await db.commit()
     await db.refresh(product)
+    await invalidate_storefront(product.seller_id)
+    if product_data.title is not None or product_data.images is not None:
+        enqueue_duplicate_check(product.id)
 
     return ProductResponse(
         id=str(product.id),
@@ -740,8 +779,12 @@ async def delete_product(
             detail="You can only delete your own products"
         )
 
+    facets_before = await catalog_facets.snapshot(db, Product.id == product_id)
     await db.delete(product)
+    await db.flush()
+    await catalog_facets.record_change(db, facets_before, Product.id == product_id)
     await db.commit()
+    await invalidate_storefront(current_user.id)
 
     return {"message": "Product deleted successfully"}
 
@@ -773,7 +816,8 @@ async def promote_product(
     product_id: UUID,
     views: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Promote product by purchasing promotion views
@@ -832,40 +876,43 @@ async def promote_product(
             "amount_paid": 0
         }
 
-    # Get wallet
-    wallet_result = await db.execute(
-        select(Wallet).where(Wallet.user_id == current_user.id)
-    )
-    wallet = wallet_result.scalar_one_or_none()
-
-    if not wallet or wallet.main_balance < promotion_price:
+    # Deduct from wallet
+    try:
+        posting = await post_entries(
+            db,
+            [LedgerEntry(
+                user_id=current_user.id,
+                balance_type="main",
+                delta=-promotion_price,
+                type="promotion",
+                description=f"Продвижение товара '{product.title}' ({views} просмотров)",
+                reference_id=product.id
+            )],
+            make_idempotency_key("promotion", product.id, client_key)
+        )
+    except InsufficientFundsError:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Insufficient balance. Required: {float(promotion_price)} KGS"
         )
 
-    # Deduct from wallet
-    wallet.main_balance -= promotion_price
-
-    # Update product promotion stats
-    product.promotion_views_total += views
-    product.promotion_views_remaining += views
-    if not product.promotion_started_at:
-        product.promotion_started_at = datetime.utcnow()
-
-    # Create transaction
-    transaction = Transaction(
-        user_id=current_user.id,
-        type="promotion",
-        amount=promotion_price,
-        balance_type="main",
-        description=f"Продвижение товара '{product.title}' ({views} просмотров)",
-        reference_id=product.id,
-        status="completed"
-    )
-    db.add(transaction)
+    if not posting.replayed:
+        # Update product promotion stats
+        await db.execute(
+            update(Product)
+            .where(Product.id == product.id)
+            .values(
+                promotion_views_total=func.coalesce(Product.promotion_views_total, 0) + views,
+                promotion_views_remaining=func.coalesce(Product.promotion_views_remaining, 0) + views,
+                promotion_started_at=func.coalesce(Product.promotion_started_at, datetime.utcnow())
+            )
+        )
 
     await db.commit()
+    await db.refresh(product)
+    await publish_balances(posting.balances)
+    await invalidate_storefront(product.seller_id)
 
     return {
         "message": "Product promotion purchased successfully",
@@ -986,15 +1033,11 @@ async def get_product_by_id(
     Get product details by ID with full seller and category information
     """
     from app.models.user import User, SellerProfile
-    from app.models.product import Category
-    from sqlalchemy.orm import joinedload
 
     # Get product with seller info (LEFT JOIN for SellerProfile as it may not exist yet)
     result = await db.execute(
         select(Product, User).join(
             User, Product.seller_id == User.id
-        ).options(
-            joinedload(Product.category)
         ).where(Product.id == product_id)
     )
     row = result.first()
@@ -1009,41 +1052,32 @@ async def get_product_by_id(
 
     # Get seller profile separately (may not exist for new users)
     seller_profile_result = await db.execute(
-        select(SellerProfile).options(
-            joinedload(SellerProfile.city),
-            joinedload(SellerProfile.market)
-        ).where(SellerProfile.user_id == user.id)
+        select(SellerProfile).where(SellerProfile.user_id == user.id)
     )
     seller_profile = seller_profile_result.scalar_one_or_none()
 
-    # Get city and market names if seller profile exists
+    # City, market and category names come from the reference registry
+    refs = await current_reference_data()
     city_name = None
     market_name = None
     if seller_profile:
-        city_name = seller_profile.city.name if seller_profile.city else None
-        market_name = seller_profile.market.name if seller_profile.market else None
-
-    # Get category hierarchy BEFORE commit (while still in session)
-    category_hierarchy = []
-    if product.category_id:
-        category = product.category
-        category_hierarchy = []
-        while category:
-            category_hierarchy.insert(0, {
-                "id": category.id,
-                "name": category.name,
-                "slug": category.slug
-            })
-            if category.parent_id:
-                parent_result = await db.execute(
-                    select(Category).where(Category.id == category.parent_id)
-                )
-                category = parent_result.scalar_one_or_none()
-            else:
-                category = None
-
-    # Increment views
-    product.views_count += 1
+        city_name = refs.city_name(seller_profile.city_id)
+        market_name = refs.market_name(seller_profile.market_id)
+
+    category_hierarchy = [
+        {"id": category.id, "name": category.name, "slug": category.slug}
+        for category in refs.category_path(product.category_id)
+    ]
+
+    # Increment views. A counter: neither an edit nor a user write (no
+    # read-your-writes cookie), so it doesn't go through the ORM flush
+    views_count = (product.views_count or 0) + 1
+    await db.execute(
+        update(Product)
+        .where(Product.id == product.id)
+        .values(views_count=Product.views_count + 1, updated_at=Product.updated_at)
+        .execution_options(synchronize_session=False, read_your_writes=False)
+    )
     await db.commit()
 
     return {
@@ -1059,7 +1093,7 @@ async def get_product_by_id(
         "characteristics": product.characteristics or [],
         "delivery_type": product.delivery_type,
         "delivery_methods": product.delivery_methods,
-        "views_count": product.views_count,
+        "views_count": views_count,
         "created_at": product.created_at,
         "status": product.status,
         "category_id": product.category_id,
@@ -0,0 +1,187 @@
+"""
+Realtime Endpoints (Server-Sent Events and WebSocket)
+
+One long-lived connection per client replaces polling of notifications,
+orders and the wallet. Both endpoints carry the same events from
+app.services.realtime:
+    {"topic": "orders", "type": "status_changed", "data": {...}, "sent_at": "..."}
+
+Browsers can't set headers on EventSource or WebSocket, so the access
+token is passed in the query string.
+"""
+import asyncio
+import logging
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, status, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.security import verify_token
+from app.database.session import AsyncSessionLocal
+from app.models.user import User
+from app.services.notifications import get_unread_count
+from app.services.realtime import TOPICS, Subscription, hub, encode_event
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _parse_topics(topics: Optional[str]) -> Optional[set]:
+    """Comma-separated topics from the query string (None = all)"""
+    if not topics:
+        return None
+    return {topic.strip() for topic in topics.split(",") if topic.strip()}
+
+
+async def _authenticate(token: str) -> Optional[tuple]:
+    """
+    Active user from an access token, with the unread count for the first event
+
+    Uses its own short session: the connection outlives the request and
+    must not hold a database connection.
+    """
+    payload = verify_token(token, token_type="access")
+    if not payload or not payload.get("sub"):
+        return None
+    try:
+        user_id = UUID(payload["sub"])
+    except ValueError:
+        return None
+
+    async with AsyncSessionLocal() as session:
+        user = await session.get(User, user_id)
+        if not user or user.is_banned:
+            return None
+        return user.id, await get_unread_count(session, user.id)
+
+
+def _initial_event(user_id, unread_count: int) -> dict:
+    return {
+        "user_id": str(user_id),
+        "topic": "notifications",
+        "type": "unread_count",
+        "data": {"unread_count": unread_count},
+    }
+
+
+@router.get("/events")
+async def stream_events(
+    token: str = Query(..., description="Access token"),
+    topics: Optional[str] = Query(None, description=f"Comma-separated: {', '.join(sorted(TOPICS))}")
+):
+    """
+    Server-Sent Events stream of the user's events
+
+    Connect with: new EventSource("/api/v1/realtime/events?token=<jwt_token>")
+
+    Each event is sent with `event: <topic>`. The first one is the current
+    unread notification count. A comment line is sent every
+    REALTIME_HEARTBEAT_SECONDS to keep proxies from closing the stream.
+    """
+    authenticated = await _authenticate(token)
+    if not authenticated:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    user_id, unread_count = authenticated
+    wanted_topics = _parse_topics(topics)
+
+    async def event_stream():
+        # Subscribed inside the generator, so the finally below always runs
+        subscription = hub.subscribe(user_id, wanted_topics)
+        try:
+            yield "retry: 3000\n\n"
+            if subscription.wants("notifications"):
+                subscription.queue.put_nowait(_initial_event(user_id, unread_count))
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.REALTIME_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['topic']}\ndata: {encode_event(event)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _send_events(websocket: WebSocket, subscription: Subscription):
+    while True:
+        try:
+            event = await asyncio.wait_for(
+                subscription.queue.get(), timeout=settings.REALTIME_HEARTBEAT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            await websocket.send_json({"type": "ping"})
+            continue
+        await websocket.send_text(encode_event(event))
+
+
+async def _receive_commands(websocket: WebSocket, subscription: Subscription):
+    while True:
+        data = await websocket.receive_json()
+        command = data.get("type")
+        if command == "subscribe":
+            subscription.topics |= TOPICS & set(data.get("topics") or [])
+        elif command == "unsubscribe":
+            subscription.topics -= set(data.get("topics") or [])
+        elif command == "ping":
+            await websocket.send_json({"type": "pong"})
+            continue
+        else:
+            continue
+        await websocket.send_json({"type": "subscribed", "topics": sorted(subscription.topics)})
+
+
+@router.websocket("/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    token: str = Query(...),
+    topics: Optional[str] = Query(None)
+):
+    """
+    Multiplexed WebSocket channel of the user's events
+
+    Connect with: ws://host/api/v1/realtime/ws?token=<jwt_token>&topics=orders,wallet
+
+    Messages format:
+    - Send: {"type": "subscribe" | "unsubscribe", "topics": ["orders", ...]}
+    - Send: {"type": "ping"}
+    - Receive: {"topic": "...", "type": "...", "data": {...}, "sent_at": "..."}
+    """
+    authenticated = await _authenticate(token)
+    if not authenticated:
+        await websocket.close(code=4001, reason="Invalid token")
+        return
+    user_id, unread_count = authenticated
+
+    await websocket.accept()
+    subscription = hub.subscribe(user_id, _parse_topics(topics))
+    if subscription.wants("notifications"):
+        subscription.queue.put_nowait(_initial_event(user_id, unread_count))
+
+    tasks = [
+        asyncio.create_task(_send_events(websocket, subscription)),
+        asyncio.create_task(_receive_commands(websocket, subscription)),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error and not isinstance(error, WebSocketDisconnect):
+                logger.warning(f"Realtime socket of user {user_id} closed: {error!r}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        hub.unsubscribe(subscription)
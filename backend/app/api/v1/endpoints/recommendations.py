@@ -3,15 +3,16 @@ Product Recommendations Endpoints
 """
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func, and_, or_
+from sqlalchemy import select, desc, func, and_
 from typing import Optional
 from uuid import UUID
 
-from app.database.session import get_db
+from app.database.session import get_read_db
 from app.models.product import Product
-from app.models.favorite import ViewHistory
+from app.models.recommendation import ProductSimilarity
 from app.models.user import User
 from app.core.dependencies import get_current_active_user
+from app.services.recommendations import recommend_for_user
 from app.api.v1.endpoints.products import get_category_ids_with_children
 
 router = APIRouter()
@@ -21,85 +22,19 @@ router = APIRouter()
 async def get_personalized_recommendations(
     limit: int = Query(20, le=50),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get personalized product recommendations for current user
 
     Based on:
-    - User's view history (categories they viewed)
-    - Popular products in those categories
+    - User's category affinity (maintained incrementally from views)
+    - Cached candidate pools of the top categories, minus already seen products
     - Fallback to trending products if no history
-    """
-    # Get user's viewed categories from history
-    viewed_categories_result = await db.execute(
-        select(Product.category_id, func.count(ViewHistory.id).label('view_count'))
-        .select_from(ViewHistory)
-        .join(Product, ViewHistory.product_id == Product.id)
-        .where(
-            ViewHistory.user_id == current_user.id,
-            Product.category_id.isnot(None)
-        )
-        .group_by(Product.category_id)
-        .order_by(desc('view_count'))
-        .limit(3)
-    )
-    viewed_categories = [cat_id for cat_id, _ in viewed_categories_result.all()]
-
-    # Get products from viewed categories that user hasn't viewed yet
-    if viewed_categories:
-        # Get IDs of products user already viewed
-        viewed_products_result = await db.execute(
-            select(ViewHistory.product_id)
-            .where(ViewHistory.user_id == current_user.id)
-        )
-        viewed_product_ids = [p_id for (p_id,) in viewed_products_result.all()]
-
-        # Get recommendations from categories user viewed
-        query = select(Product).where(
-            and_(
-                Product.status == "active",
-                Product.category_id.in_(viewed_categories),
-                ~Product.id.in_(viewed_product_ids) if viewed_product_ids else True
-            )
-        ).order_by(
-            desc(func.coalesce(Product.promotion_views_remaining, 0)),
-            desc(Product.views_count),
-            desc(Product.created_at)
-        ).limit(limit)
-
-        result = await db.execute(query)
-        products = result.scalars().all()
-
-        # If not enough products, add trending products
-        if len(products) < limit:
-            remaining = limit - len(products)
-            trending_query = select(Product).where(
-                and_(
-                    Product.status == "active",
-                    ~Product.id.in_([p.id for p in products]),
-                    ~Product.id.in_(viewed_product_ids) if viewed_product_ids else True
-                )
-            ).order_by(
-                desc(Product.views_count),
-                desc(func.coalesce(Product.promotion_views_remaining, 0))
-            ).limit(remaining)
-
-            trending_result = await db.execute(trending_query)
-            trending_products = trending_result.scalars().all()
-            products.extend(trending_products)
 
-    else:
-        # No history - show trending products
-        query = select(Product).where(
-            Product.status == "active"
-        ).order_by(
-            desc(Product.views_count),
-            desc(func.coalesce(Product.promotion_views_remaining, 0))
-        ).limit(limit)
-
-        result = await db.execute(query)
-        products = result.scalars().all()
+    Cost does not depend on the length of the user's view history.
+    """
+    products, based_on = await recommend_for_user(db, current_user.id, limit)
 
     return {
         "items": [
@@ -119,7 +54,7 @@ async def get_personalized_recommendations(
             for p in products
         ],
         "total": len(products),
-        "based_on": "view_history" if viewed_categories else "trending"
+        "based_on": based_on
     }
 
 
@@ -127,51 +62,57 @@ async def get_personalized_recommendations(
 async def get_similar_products(
     product_id: UUID,
     limit: int = Query(10, le=30),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get similar products to a specific product
 
     Based on:
-    - Same category
-    - Similar price range
-    - Same seller (if available)
+    - Precomputed item-to-item neighbours (co-viewed / co-favorited products),
+      rebuilt nightly by the build_product_similarities task
+    - Fallback for products without neighbours yet: same category, similar price
     """
-    # Get the reference product
-    product_result = await db.execute(
-        select(Product).where(Product.id == product_id)
+    # Single keyed lookup on the (product_id, rank) primary key
+    neighbours_result = await db.execute(
+        select(Product, ProductSimilarity.score)
+        .join(ProductSimilarity, ProductSimilarity.neighbor_id == Product.id)
+        .where(
+            ProductSimilarity.product_id == product_id,
+            Product.status == "active"
+        )
+        .order_by(ProductSimilarity.rank)
+        .limit(limit)
     )
-    product = product_result.scalar_one_or_none()
+    neighbours = neighbours_result.all()
 
-    if not product:
-        return {"items": [], "total": 0}
+    if neighbours:
+        items = [(p, "co_interest", score) for p, score in neighbours]
+    else:
+        # Cold start: product is new or has no co-interest signal yet
+        product_result = await db.execute(
+            select(Product).where(Product.id == product_id)
+        )
+        product = product_result.scalar_one_or_none()
 
-    # Calculate price range (±30%)
-    price = float(product.price)
-    min_price = price * 0.7
-    max_price = price * 1.3
+        if not product or product.category_id is None:
+            return {"items": [], "total": 0, "reference_product_id": str(product_id)}
 
-    # Get similar products
-    query = select(Product).where(
-        and_(
-            Product.status == "active",
-            Product.id != product_id,
-            or_(
-                # Same category
+        # Calculate price range (±30%)
+        price = float(product.price)
+        query = select(Product).where(
+            and_(
+                Product.status == "active",
+                Product.id != product_id,
                 Product.category_id == product.category_id,
-                # Same seller
-                Product.seller_id == product.seller_id
-            ),
-            # Similar price range
-            Product.price.between(min_price, max_price)
-        )
-    ).order_by(
-        desc(func.coalesce(Product.promotion_views_remaining, 0)),
-        desc(Product.views_count)
-    ).limit(limit)
+                Product.price.between(price * 0.7, price * 1.3)
+            )
+        ).order_by(
+            desc(func.coalesce(Product.promotion_views_remaining, 0)),
+            desc(Product.views_count)
+        ).limit(limit)
 
-    result = await db.execute(query)
-    similar_products = result.scalars().all()
+        result = await db.execute(query)
+        items = [(p, "same_category", None) for p in result.scalars().all()]
 
     return {
         "items": [
@@ -187,11 +128,12 @@ async def get_similar_products(
                 "category_id": p.category_id,
                 "is_promoted": p.is_promoted,
                 "views_count": p.views_count,
-                "similarity_reason": "same_category" if p.category_id == product.category_id else "same_seller"
+                "similarity_reason": reason,
+                "similarity_score": round(score, 4) if score is not None else None
             }
-            for p in similar_products
+            for p, reason, score in items
         ],
-        "total": len(similar_products),
+        "total": len(items),
         "reference_product_id": str(product_id)
     }
 
@@ -201,7 +143,7 @@ async def get_trending_products(
     limit: int = Query(20, le=50),
     category_id: Optional[int] = Query(None, description="Filter by category"),
     city_id: Optional[int] = Query(None, description="Filter by seller city"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get trending products
@@ -269,7 +211,7 @@ async def get_trending_products(
 async def get_new_arrivals(
     limit: int = Query(20, le=50),
     category_id: Optional[int] = Query(None, description="Filter by category"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get newest products
@@ -315,7 +257,7 @@ async def get_deals(
     limit: int = Query(20, le=50),
     min_discount: int = Query(10, description="Minimum discount percentage"),
     category_id: Optional[int] = Query(None, description="Filter by category"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get products with discounts
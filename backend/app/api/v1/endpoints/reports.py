@@ -9,17 +9,26 @@ from uuid import UUID
 from datetime import datetime
 
 from app.database.session import get_db
-from app.models.report import Report, ReportType, ReportReason, ReportStatus
+from app.models.report import Report, ReportTarget, ReportType, ReportReason, ReportStatus
 from app.models.user import User, SellerProfile
 from app.models.product import Product
 from app.models.review import Review
 from app.models.order import Order
 from app.core.dependencies import get_current_active_user
+from app.services.report_triage import file_report, close_target, pending_targets
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import selectinload
 
 router = APIRouter()
 
+# Report type -> (ReportCreate field with the id, model, name for errors)
+REPORT_TARGETS = {
+    ReportType.PRODUCT: ("reported_product_id", Product, "Product"),
+    ReportType.SELLER: ("reported_seller_id", User, "Seller"),
+    ReportType.REVIEW: ("reported_review_id", Review, "Review"),
+    ReportType.USER: ("reported_user_id", User, "User"),
+    ReportType.ORDER: ("reported_order_id", Order, "Order"),
+}
+
 
 # Schemas
 class ReportCreate(BaseModel):
@@ -74,7 +83,9 @@ async def create_report(
     """
     Create a new report
 
-    Users can report products, sellers, reviews, or other users
+    Users can report products, sellers, reviews, or other users. Reporting
+    the same target again while the first report is pending returns the
+    pending report.
     """
     # Validate report type
     try:
@@ -94,114 +105,58 @@ async def create_report(
             detail=f"Invalid reason: {report_data.reason}"
         )
 
-    # Validate that the correct ID is provided based on type
-    if report_type == ReportType.PRODUCT and not report_data.reported_product_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="reported_product_id is required for product reports"
-        )
-    elif report_type == ReportType.SELLER and not report_data.reported_seller_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="reported_seller_id is required for seller reports"
-        )
-    elif report_type == ReportType.REVIEW and not report_data.reported_review_id:
+    # Parse the given ids; the one matching the type is required
+    reported_ids = {}
+    for field, _, _ in REPORT_TARGETS.values():
+        value = getattr(report_data, field)
+        if value:
+            try:
+                reported_ids[field] = UUID(value)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{field} is not a valid id"
+                )
+
+    field, model, label = REPORT_TARGETS[report_type]
+    target_id = reported_ids.get(field)
+    if not target_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="reported_review_id is required for review reports"
+            detail=f"{field} is required for {report_type.value} reports"
         )
-    elif report_type == ReportType.USER and not report_data.reported_user_id:
+
+    # Verify that the reported entity exists (one lookup by primary key)
+    target = await db.get(model, target_id)
+    if not target:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="reported_user_id is required for user reports"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{label} not found"
         )
-    elif report_type == ReportType.ORDER and not report_data.reported_order_id:
+    # Verify that the current user is the buyer of this order
+    if report_type == ReportType.ORDER and target.buyer_id != current_user.id:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="reported_order_id is required for order reports"
-        )
-
-    # Verify that the reported entity exists
-    if report_type == ReportType.PRODUCT:
-        product_result = await db.execute(
-            select(Product).where(Product.id == UUID(report_data.reported_product_id))
-        )
-        if not product_result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Product not found"
-            )
-
-    elif report_type == ReportType.SELLER:
-        seller_result = await db.execute(
-            select(User).where(User.id == UUID(report_data.reported_seller_id))
-        )
-        if not seller_result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Seller not found"
-            )
-
-    elif report_type == ReportType.REVIEW:
-        review_result = await db.execute(
-            select(Review).where(Review.id == UUID(report_data.reported_review_id))
-        )
-        if not review_result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Review not found"
-            )
-
-    elif report_type == ReportType.USER:
-        user_result = await db.execute(
-            select(User).where(User.id == UUID(report_data.reported_user_id))
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only report orders you purchased"
         )
-        if not user_result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-
-    elif report_type == ReportType.ORDER:
-        order_result = await db.execute(
-            select(Order).where(Order.id == UUID(report_data.reported_order_id))
-        )
-        order = order_result.scalar_one_or_none()
-        if not order:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Order not found"
-            )
-        # Verify that the current user is the buyer of this order
-        if order.buyer_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You can only report orders you purchased"
-            )
 
     # Auto-fill reporter contact info from user profile if not provided
-    reporter_phone = report_data.reporter_phone or current_user.phone_number
+    reporter_phone = report_data.reporter_phone or current_user.phone
     reporter_email = report_data.reporter_email or current_user.email
 
-    # Create report
-    report = Report(
+    # Stored once per reporter and target, counted on the target
+    report, _ = await file_report(
+        db,
+        report_type,
+        target_id,
         reporter_id=current_user.id,
-        report_type=report_type,
-        reported_product_id=UUID(report_data.reported_product_id) if report_data.reported_product_id else None,
-        reported_seller_id=UUID(report_data.reported_seller_id) if report_data.reported_seller_id else None,
-        reported_review_id=UUID(report_data.reported_review_id) if report_data.reported_review_id else None,
-        reported_user_id=UUID(report_data.reported_user_id) if report_data.reported_user_id else None,
-        reported_order_id=UUID(report_data.reported_order_id) if report_data.reported_order_id else None,
+        **reported_ids,
         reporter_phone=reporter_phone,
         reporter_email=reporter_email,
         reason=reason,
-        description=report_data.description,
-        status=ReportStatus.PENDING
+        description=report_data.description
     )
-
-    db.add(report)
     await db.commit()
-    await db.refresh(report)
 
     return ReportResponse(
         id=str(report.id),
@@ -279,45 +234,55 @@ async def get_pending_reports(
     """
     Get pending reports (admin/moderator only)
 
-    Includes reporter contact info and seller details for order complaints
+    One item per reported entity, highest priority first. The item shows the
+    latest report (reporter contact info, reason, description) together with
+    the number of pending reports and their reasons. Includes seller details
+    for order complaints.
     """
-    query = select(Report).where(Report.status == ReportStatus.PENDING.value).options(
-        selectinload(Report.reported_order).selectinload(Order.seller)
-    )
-
+    rt = None
     if report_type:
         try:
             rt = ReportType(report_type)
-            query = query.where(Report.report_type == rt)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Invalid report type: {report_type}"
             )
 
-    query = query.order_by(desc(Report.created_at))
+    targets = pending_targets(rt)
 
     # Count total
-    count_query = select(func.count()).select_from(Report).where(
-        Report.status == ReportStatus.PENDING.value
+    count_result = await db.execute(
+        targets.with_only_columns(func.count()).order_by(None)
     )
-    if report_type:
-        count_query = count_query.where(Report.report_type == rt)
-
-    count_result = await db.execute(count_query)
     total = count_result.scalar()
 
-    # Pagination
-    query = query.limit(limit).offset(offset)
+    result = await db.execute(
+        targets.add_columns(Report)
+        .join(Report, Report.id == ReportTarget.last_report_id)
+        .limit(limit)
+        .offset(offset)
+    )
+    rows = result.all()
 
-    result = await db.execute(query)
-    reports = result.scalars().all()
+    # Seller details of the reported orders, in one query
+    order_ids = [r.reported_order_id for _, r in rows if r.report_type == ReportType.ORDER and r.reported_order_id]
+    sellers = {}
+    if order_ids:
+        seller_result = await db.execute(
+            select(Order.id, User, SellerProfile.shop_name)
+            .join(User, User.id == Order.seller_id)
+            .outerjoin(SellerProfile, SellerProfile.user_id == User.id)
+            .where(Order.id.in_(order_ids))
+        )
+        sellers = {order_id: (seller, shop_name) for order_id, seller, shop_name in seller_result.all()}
 
     # Build response with seller details
     items = []
-    for r in reports:
+    for target, r in rows:
         item = {
             "id": str(r.id),
+            "target_id": str(target.target_id),
             "reporter_id": str(r.reporter_id),
             "reporter_phone": r.reporter_phone,
             "reporter_email": r.reporter_email,
@@ -331,26 +296,24 @@ async def get_pending_reports(
             "description": r.description,
             "status": r.status.value,
             "created_at": r.created_at,
+            "reports_count": target.reports_count,
+            "pending_reports": target.pending_reports,
+            "priority_score": target.priority_score,
+            "reasons": target.reasons or {},
+            "first_reported_at": target.first_reported_at,
             "seller_info": None
         }
 
         # For order complaints, include seller details
-        if r.report_type == ReportType.ORDER and r.reported_order:
-            seller = r.reported_order.seller
-            if seller:
-                # Get seller profile for shop name
-                seller_profile_result = await db.execute(
-                    select(SellerProfile).where(SellerProfile.user_id == seller.id)
-                )
-                seller_profile = seller_profile_result.scalar_one_or_none()
-
-                item["seller_info"] = {
-                    "seller_id": str(seller.id),
-                    "email": seller.email,
-                    "phone": seller.phone_number,
-                    "shop_name": seller_profile.shop_name if seller_profile else seller.full_name,
-                    "full_name": seller.full_name
-                }
+        if r.reported_order_id in sellers:
+            seller, shop_name = sellers[r.reported_order_id]
+            item["seller_info"] = {
+                "seller_id": str(seller.id),
+                "email": seller.email,
+                "phone": seller.phone,
+                "shop_name": shop_name or seller.full_name,
+                "full_name": seller.full_name
+            }
 
         items.append(item)
 
@@ -374,7 +337,8 @@ async def review_report(
     """
     Review a report (admin/moderator only)
 
-    Update report status and add admin notes
+    Update report status and add admin notes. Reviewing a pending report
+    settles every pending report on the same entity.
     """
     # Validate status
     if new_status not in ["reviewed", "resolved", "dismissed"]:
@@ -394,20 +358,27 @@ async def review_report(
             detail="Report not found"
         )
 
-    # Update report
-    report.status = ReportStatus(new_status)
-    report.reviewed_by = admin_user.id
-    report.reviewed_at = datetime.utcnow()
-    if admin_notes:
-        report.admin_notes = admin_notes
-    report.updated_at = datetime.utcnow()
+    settled = 1
+    if report.status == ReportStatus.PENDING and report.target_id:
+        settled = await close_target(
+            db, report.report_type, report.target_id, ReportStatus(new_status), admin_user.id, admin_notes
+        )
+    else:
+        # Update report
+        report.status = ReportStatus(new_status)
+        report.reviewed_by = admin_user.id
+        report.reviewed_at = datetime.utcnow()
+        if admin_notes:
+            report.admin_notes = admin_notes
+        report.updated_at = datetime.utcnow()
 
     await db.commit()
 
     return {
         "message": f"Report {new_status} successfully",
         "report_id": str(report_id),
-        "status": new_status
+        "status": new_status,
+        "reports_settled": settled
     }
 
 
@@ -419,54 +390,29 @@ async def get_report_stats(
     """
     Get report statistics (admin/moderator only)
 
-    Returns counts by status and type
+    Returns counts by status and type (one grouped scan of
+    idx_reports_status_type) and the number of entities awaiting review
     """
-    # Count by status
-    pending_result = await db.execute(
-        select(func.count())
-        .select_from(Report)
-        .where(Report.status == ReportStatus.PENDING.value)
-    )
-    pending = pending_result.scalar() or 0
-
-    reviewed_result = await db.execute(
-        select(func.count())
-        .select_from(Report)
-        .where(Report.status == ReportStatus.REVIEWED.value)
+    result = await db.execute(
+        select(Report.status, Report.report_type, func.count())
+        .group_by(Report.status, Report.report_type)
     )
-    reviewed = reviewed_result.scalar() or 0
 
-    resolved_result = await db.execute(
-        select(func.count())
-        .select_from(Report)
-        .where(Report.status == ReportStatus.RESOLVED.value)
-    )
-    resolved = resolved_result.scalar() or 0
+    by_status = {s.value: 0 for s in ReportStatus}
+    type_counts = {t.value: 0 for t in ReportType}
+    for report_status, report_type, count in result.all():
+        by_status[report_status.value] += count
+        type_counts[report_type.value] += count
 
-    dismissed_result = await db.execute(
-        select(func.count())
-        .select_from(Report)
-        .where(Report.status == ReportStatus.DISMISSED.value)
+    pending_targets_result = await db.execute(
+        pending_targets().with_only_columns(func.count()).order_by(None)
     )
-    dismissed = dismissed_result.scalar() or 0
-
-    # Count by type
-    type_counts = {}
-    for report_type in ReportType:
-        type_result = await db.execute(
-            select(func.count())
-            .select_from(Report)
-            .where(Report.report_type == report_type)
-        )
-        type_counts[report_type.value] = type_result.scalar() or 0
 
     return {
         "by_status": {
-            "pending": pending,
-            "reviewed": reviewed,
-            "resolved": resolved,
-            "dismissed": dismissed,
-            "total": pending + reviewed + resolved + dismissed
+            **by_status,
+            "total": sum(by_status.values())
         },
-        "by_type": type_counts
+        "by_type": type_counts,
+        "pending_targets": pending_targets_result.scalar() or 0
     }
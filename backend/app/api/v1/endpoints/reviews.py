@@ -14,6 +14,7 @@ from app.models.review import Review
 from app.models.order import Order
 from app.models.user import User, SellerProfile
 from app.core.dependencies import get_current_active_user
+from app.services.storefront import invalidate as invalidate_storefront
 from app.schemas.review import ReviewCreate, ReviewCreateByProduct, ReviewResponse, SellerRatingResponse
 
 router = APIRouter()
@@ -112,6 +113,7 @@ async def create_review(
 
     await db.commit()
     await db.refresh(review)
+    await invalidate_storefront(review.seller_id)
 
     return ReviewResponse(
         id=str(review.id),
@@ -234,6 +236,7 @@ async def create_review_by_product(
 
     await db.commit()
     await db.refresh(review)
+    await invalidate_storefront(review.seller_id)
 
     return ReviewResponse(
         id=str(review.id),
@@ -558,5 +561,6 @@ async def delete_review(
 
     await db.delete(review)
     await db.commit()
+    await invalidate_storefront(review.seller_id)
 
     return {"message": "Review deleted successfully"}
@@ -7,11 +7,14 @@ from sqlalchemy import select, desc, func, or_, and_
 from typing import Optional, List
 from uuid import UUID
 
-from app.database.session import get_db
+from app.database.session import get_read_db
 from app.models.product import Product, Category
 from app.models.user import User, SellerProfile
 from app.core.config import settings
 from app.api.v1.endpoints.products import get_category_ids_with_children
+from app.services import price_stats, product_attributes
+from app.services.product_attributes import InvalidAttributeFilterError
+from app.services.geo import InvalidLocationError, parse_near, seller_within, seller_distance, distance_from
 
 router = APIRouter()
 
@@ -20,7 +23,7 @@ router = APIRouter()
 async def get_search_suggestions(
     q: str = Query(..., min_length=2, description="Search query"),
     limit: int = Query(10, le=20),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get search suggestions (autocomplete)
@@ -83,26 +86,50 @@ async def search_all(
     category_id: Optional[int] = Query(None, description="Filter by category"),
     min_price: Optional[float] = Query(None, description="Minimum price"),
     max_price: Optional[float] = Query(None, description="Maximum price"),
-    sort_by: str = Query("relevance", description="Sort by: relevance, price_asc, price_desc, newest, popular"),
+    attr: Optional[List[str]] = Query(None, description="Characteristic filter name:value, repeatable"),
+    facets: bool = Query(False, description="Include characteristic value counts of the products found"),
+    sort_by: str = Query("relevance", description="Sort by: relevance, price_asc, price_desc, newest, popular, distance"),
+    near: Optional[str] = Query(None, description="Seller location near \"lat,lon\""),
+    radius_km: float = Query(settings.GEO_DEFAULT_RADIUS_KM, gt=0, le=settings.GEO_MAX_RADIUS_KM, description="Radius for near"),
     limit: int = Query(30, le=100),
     offset: int = 0,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Universal search across products, sellers, and categories
 
     Returns results based on search query and filters
     Supports multiple sort options
+    With near, products and sellers are limited to radius_km around
+    "lat,lon"; relevance (default) and distance then sort nearest first.
+    attr filters products by characteristics (name:value, as in
+    GET /products); with facets=true products get attribute_facets.
+    products.price_facets is the price histogram of the category.
     """
     search_term = f"%{q}%"
     results = {}
 
+    point = None
+    if near:
+        try:
+            point = parse_near(near)
+        except InvalidLocationError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
+    elif sort_by == "distance":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="sort_by=distance requires near")
+    by_distance = point is not None and sort_by in ("relevance", "distance")
+
+    try:
+        attribute_filters = product_attributes.parse_filters(attr)
+    except InvalidAttributeFilterError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
+
     # Search products if no type specified or type is 'products'
     if not type or type == "products":
         from app.models.user import SellerProfile
 
         # Build query
-        if city_id:
+        if city_id or point:
             query = select(Product).join(
                 SellerProfile,
                 Product.seller_id == SellerProfile.user_id
@@ -141,8 +168,17 @@ async def search_all(
         if city_id:
             query = query.where(SellerProfile.city_id == city_id)
 
+        if attribute_filters:
+            query = query.where(*product_attributes.filter_clauses(attribute_filters))
+
+        if point:
+            query = query.where(seller_within(point, radius_km))
+            query = query.add_columns(seller_distance(point).label("distance_km"))
+
         # Apply sorting
-        if sort_by == "price_asc":
+        if by_distance:
+            query = query.order_by(seller_distance(point), desc(Product.views_count))
+        elif sort_by == "price_asc":
             query = query.order_by(Product.price.asc())
         elif sort_by == "price_desc":
             query = query.order_by(Product.price.desc())
@@ -159,7 +195,7 @@ async def search_all(
 
         # Count total
         count_query = select(func.count()).select_from(Product)
-        if city_id:
+        if city_id or point:
             count_query = count_query.join(
                 SellerProfile,
                 Product.seller_id == SellerProfile.user_id
@@ -184,15 +220,28 @@ async def search_all(
             count_query = count_query.where(Product.price <= max_price)
         if city_id:
             count_query = count_query.where(SellerProfile.city_id == city_id)
+        if attribute_filters:
+            count_query = count_query.where(*product_attributes.filter_clauses(attribute_filters))
+        if point:
+            count_query = count_query.where(seller_within(point, radius_km))
 
         count_result = await db.execute(count_query)
         products_total = count_result.scalar()
 
+        attribute_facets = None
+        if facets:
+            attribute_facets = await product_attributes.facet_counts(
+                db, query.with_only_columns(Product.id).order_by(None)
+            )
+
         # Pagination
         query = query.limit(limit).offset(offset)
 
         products_result = await db.execute(query)
-        products = products_result.scalars().all()
+        if point:
+            products_with_distance = products_result.all()
+        else:
+            products_with_distance = [(p, None) for p in products_result.scalars().all()]
 
         results["products"] = {
             "items": [
@@ -207,15 +256,19 @@ async def search_all(
                     "images": p.images or [],
                     "is_promoted": p.is_promoted,
                     "views_count": p.views_count,
-                    "created_at": p.created_at
+                    "created_at": p.created_at,
+                    **({"distance_km": round(distance, 2)} if point else {})
                 }
-                for p in products
+                for p, distance in products_with_distance
             ],
             "total": products_total or 0,
             "limit": limit,
             "offset": offset,
             "has_more": (offset + limit) < (products_total or 0)
         }
+        if facets:
+            results["products"]["attribute_facets"] = attribute_facets
+        results["products"]["price_facets"] = await price_stats.get_price_facets(db, category_id)
 
     # Search sellers if no type specified or type is 'sellers'
     if not type or type == "sellers":
@@ -229,6 +282,11 @@ async def search_all(
         if city_id:
             query = query.where(SellerProfile.city_id == city_id)
 
+        if point:
+            query = query.where(seller_within(point, radius_km))
+        if by_distance:
+            query = query.order_by(seller_distance(point))
+
         # Order by rating
         query = query.order_by(
             desc(SellerProfile.rating),
@@ -244,6 +302,8 @@ async def search_all(
         )
         if city_id:
             count_query = count_query.where(SellerProfile.city_id == city_id)
+        if point:
+            count_query = count_query.where(seller_within(point, radius_km))
 
         count_result = await db.execute(count_query)
         sellers_total = count_result.scalar()
@@ -266,7 +326,8 @@ async def search_all(
                     "seller_type": s.seller_type,
                     "rating": float(s.rating),
                     "reviews_count": s.reviews_count,
-                    "is_verified": s.is_verified
+                    "is_verified": s.is_verified,
+                    **({"distance_km": distance_from(point, s)} if point else {})
                 }
                 for s in sellers
             ],
@@ -310,7 +371,9 @@ async def search_all(
             "category_id": category_id,
             "min_price": min_price,
             "max_price": max_price,
-            "sort_by": sort_by
+            "sort_by": sort_by,
+            "near": near,
+            "radius_km": radius_km if point else None
         },
         "results": results
     }
@@ -319,7 +382,7 @@ async def search_all(
 @router.get("/trending")
 async def get_trending_searches(
     limit: int = Query(10, le=20),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get trending/popular searches
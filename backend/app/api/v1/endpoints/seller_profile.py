@@ -1,16 +1,21 @@
 """
 Seller Profile Endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, func
 from typing import Optional
 from uuid import UUID
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.user import User, SellerProfile
 from app.models.product import Product
+from app.core.config import settings
 from app.core.dependencies import get_current_active_user
+from app.services.reference_data import current as current_reference_data
+from app.services import catalog_facets
+from app.services.storefront import get_storefront, invalidate as invalidate_storefront
+from app.services.geo import InvalidLocationError, parse_near, seller_within, seller_distance, distance_from, fill_location_from_market
 from app.schemas.user import SellerProfileUpdate, SellerProfileResponse
 
 router = APIRouter()
@@ -47,6 +52,10 @@ async def create_seller_profile(
             detail="shop_name is required"
         )
 
+    # The seller's products move from "no city" to the profile's city
+    seller_products = Product.seller_id == current_user.id
+    facets_before = await catalog_facets.snapshot(db, seller_products)
+
     # Create new seller profile
     seller_profile = SellerProfile(
         user_id=current_user.id,
@@ -62,10 +71,14 @@ async def create_seller_profile(
         latitude=profile_data.latitude,
         longitude=profile_data.longitude
     )
+    await fill_location_from_market(db, seller_profile)
 
     db.add(seller_profile)
+    await db.flush()
+    await catalog_facets.record_change(db, facets_before, seller_products)
     await db.commit()
     await db.refresh(seller_profile)
+    await invalidate_storefront(current_user.id)
 
     return SellerProfileResponse(
         id=str(seller_profile.id),
@@ -93,6 +106,8 @@ async def get_sellers_catalog(
     category_id: Optional[int] = Query(None, description="Filter by category"),
     market_id: Optional[int] = Query(None, description="Filter by market"),
     search: Optional[str] = Query(None, description="Search in shop names"),
+    near: Optional[str] = Query(None, description="Sellers near \"lat,lon\""),
+    radius_km: float = Query(settings.GEO_DEFAULT_RADIUS_KM, gt=0, le=settings.GEO_MAX_RADIUS_KM, description="Radius for near"),
     limit: int = Query(30, le=100),
     offset: int = 0,
     db: AsyncSession = Depends(get_db)
@@ -102,20 +117,21 @@ async def get_sellers_catalog(
 
     Returns list of seller profiles with filters.
     Only shows sellers with tariff "pro" or "business".
+    With near, only sellers within radius_km, nearest first.
     """
-    from app.models.location import City, Market
-    from app.models.product import Category
-    from sqlalchemy.orm import selectinload
+    point = None
+    if near:
+        try:
+            point = parse_near(near)
+        except InvalidLocationError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
 
     # JOIN with User table to filter by tariff - only Pro and Business users shown
+    # City, market and category names come from the reference registry
     query = select(SellerProfile).join(
         User, SellerProfile.user_id == User.id
     ).where(
         User.tariff.in_(["pro", "business"])
-    ).options(
-        selectinload(SellerProfile.city),
-        selectinload(SellerProfile.market),
-        selectinload(SellerProfile.category)
     )
 
     # Apply filters
@@ -134,6 +150,9 @@ async def get_sellers_catalog(
     if search:
         query = query.where(SellerProfile.shop_name.ilike(f"%{search}%"))
 
+    if point:
+        query = query.where(seller_within(point, radius_km)).order_by(seller_distance(point))
+
     # Order by rating desc, then by reviews count
     query = query.order_by(
         desc(SellerProfile.rating),
@@ -158,6 +177,8 @@ async def get_sellers_catalog(
         count_query = count_query.where(SellerProfile.market_id == market_id)
     if search:
         count_query = count_query.where(SellerProfile.shop_name.ilike(f"%{search}%"))
+    if point:
+        count_query = count_query.where(seller_within(point, radius_km))
 
     count_result = await db.execute(count_query)
     total = count_result.scalar()
@@ -167,6 +188,7 @@ async def get_sellers_catalog(
 
     result = await db.execute(query)
     sellers = result.scalars().all()
+    refs = await current_reference_data()
 
     return {
         "items": [
@@ -181,9 +203,10 @@ async def get_sellers_catalog(
                 "rating": float(s.rating),
                 "reviews_count": s.reviews_count,
                 "is_verified": s.is_verified,
-                "city": {"id": s.city.id, "name": s.city.name} if s.city else None,
-                "market": {"id": s.market.id, "name": s.market.name} if s.market else None,
-                "category": {"id": s.category.id, "name": s.category.name} if s.category else None
+                "city": {"id": s.city_id, "name": refs.city_name(s.city_id)} if s.city_id in refs.cities else None,
+                "market": {"id": s.market_id, "name": refs.market_name(s.market_id)} if s.market_id in refs.markets else None,
+                "category": refs.category_ref(s.category_id),
+                **({"distance_km": distance_from(point, s)} if point else {})
             }
             for s in sellers
         ],
@@ -194,11 +217,40 @@ async def get_sellers_catalog(
     }
 
 
+@router.get("/{seller_id}/storefront")
+async def get_seller_storefront(
+    seller_id: UUID,
+    products_limit: int = Query(10, ge=1, le=50),
+    reviews_limit: int = Query(10, ge=1, le=50),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Everything the seller's storefront page needs in one response
+
+    Profile (with city and market names), rating statistics, recent active
+    products and recent reviews. Send the ETag back in If-None-Match to get
+    304 Not Modified while nothing changed.
+    """
+    storefront = await get_storefront(db, seller_id, products_limit, reviews_limit)
+    if storefront is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Seller profile not found"
+        )
+
+    body, etag = storefront
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/{seller_id}")
 async def get_seller_profile_details(
     seller_id: UUID,
     include_products: bool = Query(False, description="Include seller products"),
-    products_limit: int = Query(10, le=50),
+    products_limit: int = Query(10, ge=1, le=50),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -227,27 +279,10 @@ async def get_seller_profile_details(
     )
     user = user_result.scalar_one_or_none()
 
-    # Get city info if available
-    city_name = None
-    if seller_profile.city_id:
-        from app.models.location import City
-        city_result = await db.execute(
-            select(City).where(City.id == seller_profile.city_id)
-        )
-        city = city_result.scalar_one_or_none()
-        if city:
-            city_name = city.name
-
-    # Get market info if available
-    market_name = None
-    if seller_profile.market_id:
-        from app.models.location import Market
-        market_result = await db.execute(
-            select(Market).where(Market.id == seller_profile.market_id)
-        )
-        market = market_result.scalar_one_or_none()
-        if market:
-            market_name = market.name
+    # City and market names from the reference registry
+    refs = await current_reference_data()
+    city_name = refs.city_name(seller_profile.city_id)
+    market_name = refs.market_name(seller_profile.market_id)
 
     # Count products
     products_count_result = await db.execute(
@@ -326,6 +361,8 @@ async def update_seller_profile(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Seller profile not found. Create one first."
         )
+    seller_products = Product.seller_id == current_user.id
+    facets_before = await catalog_facets.snapshot(db, seller_products)
 
     # Update fields
     if profile_data.shop_name is not None:
@@ -343,6 +380,9 @@ async def update_seller_profile(
     if profile_data.seller_type is not None:
         seller_profile.seller_type = profile_data.seller_type
     if profile_data.market_id is not None:
+        if profile_data.market_id != seller_profile.market_id and profile_data.latitude is None:
+            # Moved to another market: its point replaces the old one below
+            seller_profile.latitude = seller_profile.longitude = None
         seller_profile.market_id = profile_data.market_id
     if profile_data.address is not None:
         seller_profile.address = profile_data.address
@@ -350,9 +390,13 @@ async def update_seller_profile(
         seller_profile.latitude = profile_data.latitude
     if profile_data.longitude is not None:
         seller_profile.longitude = profile_data.longitude
+    await fill_location_from_market(db, seller_profile)
 
+    await db.flush()  # City and seller type count in the catalog facets
+    await catalog_facets.record_change(db, facets_before, seller_products)
     await db.commit()
     await db.refresh(seller_profile)
+    await invalidate_storefront(current_user.id)
 
     return SellerProfileResponse(
         id=str(seller_profile.id),
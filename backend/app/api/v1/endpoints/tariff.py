@@ -1,17 +1,23 @@
 """
 Tariff Endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime, timedelta
 from decimal import Decimal
+from typing import Optional
 
 from app.database.session import get_db
 from app.models.user import User, SellerProfile
-from app.models.wallet import Wallet, Transaction
+from app.models.product import Product
 from app.core.dependencies import get_current_active_user
 from app.core.config import settings
+from app.services.ledger import LedgerEntry, InsufficientFundsError, post_entries, make_idempotency_key
+from app.services.realtime import publish_balances
+from app.services.partner_offers import sync_seller_tariff
+from app.services import catalog_facets
+from app.services.storefront import invalidate as invalidate_storefront
 from app.schemas.wallet import TariffUpgradeRequest
 
 router = APIRouter()
@@ -103,7 +109,8 @@ async def get_current_tariff(
 async def upgrade_tariff(
     request: TariffUpgradeRequest,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Upgrade user tariff
@@ -130,20 +137,33 @@ async def upgrade_tariff(
     monthly_price = TARIFF_PRICES[request.tariff]
     total_price = Decimal(monthly_price * request.duration_months)
 
-    # Get wallet
-    result = await db.execute(
-        select(Wallet).where(Wallet.user_id == current_user.id)
-    )
-    wallet = result.scalar_one_or_none()
-
-    if not wallet or wallet.main_balance < total_price:
+    # Deduct from wallet
+    try:
+        posting = await post_entries(
+            db,
+            [LedgerEntry(
+                user_id=current_user.id,
+                balance_type="main",
+                delta=-total_price,
+                type="tariff_upgrade",
+                description=f"Подписка {request.tariff.capitalize()} на {request.duration_months} мес."
+            )],
+            make_idempotency_key("tariff", current_user.id, client_key)
+        )
+    except InsufficientFundsError:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Insufficient balance. Required: {total_price} KGS"
         )
 
-    # Deduct from wallet
-    wallet.main_balance -= total_price
+    if posting.replayed:
+        return {
+            "message": "Tariff upgraded successfully",
+            "tariff": current_user.tariff,
+            "expires_at": current_user.tariff_expires_at,
+            "amount_paid": float(total_price)
+        }
 
     # Update user tariff
     if current_user.tariff_expires_at and current_user.tariff_expires_at > datetime.utcnow():
@@ -163,6 +183,10 @@ async def upgrade_tariff(
         existing_profile = seller_profile_result.scalar_one_or_none()
 
         if not existing_profile:
+            # The seller's products get the default seller type in the catalog facets
+            seller_products = Product.seller_id == current_user.id
+            facets_before = await catalog_facets.snapshot(db, seller_products)
+
             # Create default seller profile
             default_shop_name = current_user.full_name if current_user.full_name else f"Магазин {current_user.phone}"
             seller_profile = SellerProfile(
@@ -174,20 +198,14 @@ async def upgrade_tariff(
                 seller_type="shop"  # Default: shop (allowed: market, boutique, shop, office, home, mobile, warehouse)
             )
             db.add(seller_profile)
+            await db.flush()
+            await catalog_facets.record_change(db, facets_before, seller_products)
 
-    # Create transaction record
-    transaction = Transaction(
-        user_id=current_user.id,
-        type="tariff_upgrade",
-        amount=total_price,
-        balance_type="main",
-        description=f"Подписка {request.tariff.capitalize()} на {request.duration_months} мес.",
-        status="completed"
-    )
-    db.add(transaction)
-
+    await sync_seller_tariff(db, current_user.id, current_user.tariff)
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_storefront(current_user.id)
+    await publish_balances(posting.balances)
 
     return {
         "message": "Tariff upgraded successfully",
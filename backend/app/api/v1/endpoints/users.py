@@ -3,7 +3,7 @@ User Endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from typing import Optional
 from uuid import UUID
@@ -13,6 +13,9 @@ from app.database.session import get_db
 from app.models.user import User, SellerProfile
 from app.models.wallet import ReferralEarning, Wallet
 from app.core.dependencies import get_current_active_user
+from app.services.referral_stats import get_stats as get_referral_totals
+from app.services.partner_offers import sync_seller_tariff
+from app.services.storefront import invalidate as invalidate_storefront
 from app.schemas.user import UserProfileUpdate, SellerProfileUpdate, UserWithProfileResponse, SellerProfileResponse, TariffActivationRequest
 
 router = APIRouter()
@@ -206,29 +209,8 @@ async def get_referral_stats(
     """
     Get referral statistics - how many refs, total earned, active refs
     """
-    # Количество рефералов
-    referrals_result = await db.execute(
-        select(func.count(User.id))
-        .where(User.referred_by == current_user.id)
-    )
-    total_referrals = referrals_result.scalar()
-
-    # Активные рефералы (срок не истек)
-    active_referrals_result = await db.execute(
-        select(func.count(User.id))
-        .where(
-            User.referred_by == current_user.id,
-            User.referral_expires_at > datetime.utcnow()
-        )
-    )
-    active_referrals = active_referrals_result.scalar()
-
-    # Общая сумма заработка
-    earnings_result = await db.execute(
-        select(func.coalesce(func.sum(ReferralEarning.earning_amount), 0))
-        .where(ReferralEarning.referrer_id == current_user.id)
-    )
-    total_earned = float(earnings_result.scalar())
+    # Счётчики рефералов и кэшбек (app.services.referral_stats)
+    stats = await get_referral_totals(db, current_user.id)
 
     # Последние начисления
     recent_earnings = await db.execute(
@@ -240,9 +222,9 @@ async def get_referral_stats(
     earnings_list = recent_earnings.scalars().all()
 
     return {
-        "total_referrals": total_referrals,
-        "active_referrals": active_referrals,
-        "total_earned": total_earned,
+        "total_referrals": stats.referrals_count if stats else 0,
+        "active_referrals": stats.active_referrals if stats else 0,
+        "total_earned": float(stats.topup_earnings) if stats else 0.0,
         "recent_earnings": [
             {
                 "id": str(e.id),
@@ -368,8 +350,10 @@ async def activate_tariff(
         current_user.tariff_expires_at = datetime.utcnow() + timedelta(days=TARIFF_DURATION_DAYS)
         message = f"Тариф {tariff_name.upper()} успешно активирован! Требуется поддерживать баланс не ниже {price} сом для автоматического продления."
 
+    await sync_seller_tariff(db, current_user.id, tariff_name)
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_storefront(current_user.id)
 
     # Prepare response
     wallet = await get_user_wallet(db, current_user.id)
@@ -1,17 +1,28 @@
 """
 Wallet Endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, status, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from decimal import Decimal
 from datetime import datetime
+from typing import Optional
 
-from app.database.session import get_db
+from app.database.session import get_db, get_read_db
 from app.models.wallet import Wallet, Transaction, WithdrawalRequest as WithdrawalRequestModel, ReferralEarning
 from app.models.user import User
 from app.core.dependencies import get_current_active_user
 from app.core.config import settings
+from app.services.ledger import (
+    LedgerEntry,
+    InsufficientFundsError,
+    post_entries,
+    make_idempotency_key,
+    get_balance_at,
+)
+from app.services.realtime import publish_balances
+from app.services.referral_stats import record_topup_cashback
 from app.schemas.wallet import (
     WalletResponse,
     TopUpRequest,
@@ -52,11 +63,29 @@ async def get_balance(
     )
 
 
+@router.get("/balance/history")
+async def get_balance_history(
+    at: datetime,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Get wallet balance at a past moment (UTC)
+    """
+    main_balance, referral_balance = await get_balance_at(db, current_user.id, at)
+    return {
+        "at": at,
+        "main_balance": float(main_balance),
+        "referral_balance": float(referral_balance)
+    }
+
+
 @router.post("/topup")
 async def topup_wallet(
     request: TopUpRequest,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Top up wallet balance (main balance)
@@ -68,6 +97,8 @@ async def topup_wallet(
     - If user was referred by someone, the referrer receives 5% cashback
     - Cashback is credited to referrer's referral balance
     - Cashback applies to every top-up, regardless of referral expiry date
+
+    Repeating the request with the same Idempotency-Key header doesn't top up twice.
     """
     if request.amount < 100:
         raise HTTPException(
@@ -75,81 +106,51 @@ async def topup_wallet(
             detail="Minimum top-up amount is 100 KGS"
         )
 
-    # Get user with referrer info
-    user_result = await db.execute(
-        select(User).where(User.id == current_user.id)
-    )
-    user = user_result.scalar_one()
-
-    # Get wallet
-    result = await db.execute(
-        select(Wallet).where(Wallet.user_id == current_user.id)
-    )
-    wallet = result.scalar_one_or_none()
-
-    if not wallet:
-        wallet = Wallet(user_id=current_user.id)
-        db.add(wallet)
-        await db.flush()
-
-    # Add to main balance
-    wallet.main_balance += Decimal(str(request.amount))
-
-    # Create transaction record
-    transaction = Transaction(
+    amount = Decimal(str(request.amount))
+    topup = LedgerEntry(
         user_id=current_user.id,
-        type="topup",
-        amount=request.amount,
         balance_type="main",
-        description="Пополнение баланса",
-        status="completed"
+        delta=amount,
+        type="topup",
+        description="Пополнение баланса"
     )
-    db.add(transaction)
-    await db.flush()  # Flush to get transaction.id
+    entries = [topup]
 
     # Give 5% cashback to referrer on every top-up
-    if user.referred_by:
-        cashback_amount = Decimal(str(request.amount)) * Decimal('0.05')  # 5% cashback
-
-        # Get referrer wallet
-        referrer_wallet_result = await db.execute(
-            select(Wallet).where(Wallet.user_id == user.referred_by)
+    cashback = None
+    if current_user.referred_by:
+        cashback = LedgerEntry(
+            user_id=current_user.referred_by,
+            balance_type="referral",
+            delta=amount * Decimal('0.05'),  # 5% cashback
+            type="referral",
+            description=f"Реферальный кэшбек 5% от пополнения пользователя",
+            reference_id=topup.id
         )
-        referrer_wallet = referrer_wallet_result.scalar_one_or_none()
-
-        if referrer_wallet:
-            # Add to referrer's referral balance
-            referrer_wallet.referral_balance += cashback_amount
-
-            # Create referral earning record
-            earning = ReferralEarning(
-                referrer_id=user.referred_by,
-                referee_id=current_user.id,
-                transaction_id=transaction.id,
-                topup_amount=Decimal(str(request.amount)),
-                earning_amount=cashback_amount,
-                status="completed"
-            )
-            db.add(earning)
+        entries.append(cashback)
 
-            # Create transaction for referrer
-            referrer_transaction = Transaction(
-                user_id=user.referred_by,
-                type="referral",
-                amount=cashback_amount,
-                balance_type="referral",
-                description=f"Реферальный кэшбек 5% от пополнения пользователя",
-                reference_id=transaction.id,
-                status="completed"
-            )
-            db.add(referrer_transaction)
+    posting = await post_entries(
+        db, entries, make_idempotency_key("topup", current_user.id, client_key)
+    )
+
+    if cashback and not posting.replayed:
+        # Create referral earning record
+        db.add(ReferralEarning(
+            referrer_id=current_user.referred_by,
+            referee_id=current_user.id,
+            transaction_id=topup.id,
+            topup_amount=amount,
+            earning_amount=cashback.delta,
+            status="completed"
+        ))
+        await record_topup_cashback(db, current_user.referred_by, cashback.delta)
 
     await db.commit()
-    await db.refresh(wallet)
+    await publish_balances(posting.balances)
 
     return {
         "message": "Balance topped up successfully",
-        "transaction_id": str(transaction.id),
+        "transaction_id": str(posting.transaction_ids[0]),
         "amount": float(request.amount),
         "status": "pending",
         "payment_url": "https://payment.mbank.kg/..."  # Placeholder
@@ -160,7 +161,8 @@ async def topup_wallet(
 async def withdraw_funds(
     request: WithdrawalRequest,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Request withdrawal of referral balance
@@ -180,48 +182,52 @@ async def withdraw_funds(
             detail="MBank phone number is required"
         )
 
-    # Get wallet
-    result = await db.execute(
-        select(Wallet).where(Wallet.user_id == current_user.id)
-    )
-    wallet = result.scalar_one_or_none()
-
-    if not wallet or wallet.referral_balance < request.amount:
+    withdrawal_id = uuid.uuid4()
+    try:
+        posting = await post_entries(
+            db,
+            [LedgerEntry(
+                user_id=current_user.id,
+                balance_type="referral",
+                delta=-Decimal(str(request.amount)),
+                type="withdrawal",
+                description=f"Вывод средств на MBank {request.mbank_phone}",
+                reference_id=withdrawal_id,
+                status="pending"
+            )],
+            make_idempotency_key("withdraw", current_user.id, client_key)
+        )
+    except InsufficientFundsError:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Insufficient referral balance"
         )
 
-    # Deduct from referral balance
-    wallet.referral_balance -= Decimal(str(request.amount))
-
-    # Create withdrawal request
-    withdrawal = WithdrawalRequestModel(
-        user_id=current_user.id,
-        amount=request.amount,
-        method=request.method,
-        mbank_phone=request.mbank_phone,
-        account_number=request.account_number,
-        account_name=request.account_name,
-        balance_type="referral",
-        status="pending"
-    )
-    db.add(withdrawal)
-
-    # Create transaction
-    transaction = Transaction(
-        user_id=current_user.id,
-        type="withdrawal",
-        amount=request.amount,
-        balance_type="referral",
-        description=f"Вывод средств на MBank {request.mbank_phone}",
-        reference_id=withdrawal.id,
-        status="pending"
-    )
-    db.add(transaction)
+    if posting.replayed:
+        withdrawal = await db.scalar(
+            select(WithdrawalRequestModel)
+            .join(Transaction, Transaction.reference_id == WithdrawalRequestModel.id)
+            .where(Transaction.id == posting.transaction_ids[0])
+        )
+    else:
+        # Create withdrawal request
+        withdrawal = WithdrawalRequestModel(
+            id=withdrawal_id,
+            user_id=current_user.id,
+            amount=request.amount,
+            method=request.method,
+            mbank_phone=request.mbank_phone,
+            account_number=request.account_number,
+            account_name=request.account_name,
+            balance_type="referral",
+            status="pending"
+        )
+        db.add(withdrawal)
 
-    await db.commit()
-    await db.refresh(withdrawal)
+        await db.commit()
+        await db.refresh(withdrawal)
+        await publish_balances(posting.balances)
 
     return WithdrawalResponse(
         id=str(withdrawal.id),
@@ -241,7 +247,8 @@ async def transfer_between_balances(
     from_balance: str,  # "referral" or "main"
     to_balance: str,    # "referral" or "main"
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Transfer funds between main and referral balances
@@ -259,47 +266,40 @@ async def transfer_between_balances(
             detail="Amount must be greater than 0"
         )
 
-    # Get wallet
-    result = await db.execute(
-        select(Wallet).where(Wallet.user_id == current_user.id)
-    )
-    wallet = result.scalar_one_or_none()
-
-    if not wallet:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Wallet not found"
+    description = f"Перевод с реферального баланса на основной"
+    try:
+        # Two entries of one posting: debit referral, credit main
+        posting = await post_entries(
+            db,
+            [
+                LedgerEntry(user_id=current_user.id, balance_type="referral", delta=-amount,
+                            type="transfer", description=description),
+                LedgerEntry(user_id=current_user.id, balance_type="main", delta=amount,
+                            type="transfer", description=description),
+            ],
+            make_idempotency_key("transfer", current_user.id, client_key)
         )
-
-    if wallet.referral_balance < amount:
+    except InsufficientFundsError:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Insufficient referral balance"
         )
 
-    # Transfer
-    wallet.referral_balance -= amount
-    wallet.main_balance += amount
-
-    # Create transaction
-    transaction = Transaction(
-        user_id=current_user.id,
-        type="transfer",
-        amount=amount,
-        balance_type="main",
-        description=f"Перевод с реферального баланса на основной",
-        status="completed"
-    )
-    db.add(transaction)
-
     await db.commit()
-    await db.refresh(wallet)
+    await publish_balances(posting.balances)
+
+    if posting.replayed:
+        wallet = await db.scalar(select(Wallet).where(Wallet.user_id == current_user.id))
+        main_balance, referral_balance = wallet.main_balance, wallet.referral_balance
+    else:
+        main_balance, referral_balance = posting.balances[current_user.id]
 
     return {
         "message": "Transfer completed successfully",
         "amount": float(amount),
-        "main_balance": float(wallet.main_balance),
-        "referral_balance": float(wallet.referral_balance)
+        "main_balance": float(main_balance),
+        "referral_balance": float(referral_balance)
     }
 
 
@@ -307,15 +307,19 @@ async def transfer_between_balances(
 async def get_transactions(
     limit: int = 30,
     offset: int = 0,
+    type: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Get transaction history for current user
+    Get transaction history for current user, optionally of one type
     """
+    query = select(Transaction).where(Transaction.user_id == current_user.id)
+    if type:
+        query = query.where(Transaction.type == type)
+
     result = await db.execute(
-        select(Transaction)
-        .where(Transaction.user_id == current_user.id)
+        query
         .order_by(desc(Transaction.created_at))
         .limit(limit)
         .offset(offset)
@@ -2,6 +2,7 @@
 Celery Application Configuration
 """
 from celery import Celery
+from celery.schedules import crontab
 from app.core.config import settings
 
 # Create Celery app
@@ -26,11 +27,41 @@ celery_app.conf.update(
 # Auto-discover tasks from all registered apps
 celery_app.autodiscover_tasks(['app.tasks'])
 
+# Periodic tasks
+celery_app.conf.beat_schedule = {
+    'build-product-similarities': {
+        'task': 'app.tasks.build_product_similarities',
+        'schedule': crontab(hour=3, minute=0),  # Nightly
+    },
+    'settle-pending-referral-commissions': {
+        'task': 'app.tasks.settle_pending_referral_commissions',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
+    'recount-expired-referrals': {
+        'task': 'app.tasks.recount_expired_referrals',
+        'schedule': crontab(minute=40),  # Hourly (2-hour window)
+    },
+    'build-wallet-balance-snapshots': {
+        'task': 'app.tasks.build_wallet_balance_snapshots',
+        'schedule': crontab(minute=10),  # Hourly
+    },
+    'moderate-product-images': {
+        'task': 'app.tasks.moderate_product_images',
+        'schedule': crontab(),  # Every minute
+    },
+    'index-pending-duplicates': {
+        'task': 'app.tasks.index_pending_duplicates',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'reconcile-catalog-facets': {
+        'task': 'app.tasks.reconcile_catalog_facets',
+        'schedule': crontab(hour=4, minute=30),  # Nightly
+    },
+}
+
 
 # Example periodic tasks (commented out - uncomment when needed)
-# from celery.schedules import crontab
-#
-# celery_app.conf.beat_schedule = {
+# celery_app.conf.beat_schedule.update({
 #     'check-expired-promotions': {
 #         'task': 'app.tasks.check_expired_promotions',
 #         'schedule': crontab(minute='*/30'),  # Every 30 minutes
@@ -39,4 +70,4 @@ celery_app.autodiscover_tasks(['app.tasks'])
 #         'task': 'app.tasks.process_withdrawals',
 #         'schedule': crontab(hour='*/2'),  # Every 2 hours
 #     },
-# }
+# })
@@ -0,0 +1,33 @@
+"""
+Redis Client
+
+A single lazily created asyncio client per API worker. Callers treat Redis as
+a cache: on RedisError they fall back to the database.
+"""
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+
+_client: Optional[Redis] = None
+
+
+def get_redis() -> Redis:
+    """Return the shared Redis client"""
+    global _client
+    if _client is None:
+        _client = Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+async def close_redis():
+    """Close the shared client on shutdown"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
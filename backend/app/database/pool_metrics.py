@@ -0,0 +1,81 @@
+"""
+Connection Pool Metrics
+
+Per-process pool utilization and checkout wait time, rendered in the
+Prometheus text exposition format by the /metrics endpoint.
+"""
+from typing import Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PoolMetrics:
+    """Checkout wait histogram and pool gauges for the engines of this worker"""
+
+    def __init__(self):
+        self.engines: Dict[str, AsyncEngine] = {}
+        self.names: Dict[int, str] = {}
+        self.bucket_counts: Dict[str, List[int]] = {}
+        self.wait_sum: Dict[str, float] = {}
+        self.wait_count: Dict[str, int] = {}
+
+    def register(self, name: str, engine: AsyncEngine):
+        self.engines[name] = engine
+        self.names[id(engine)] = name
+        self.bucket_counts[name] = [0] * len(WAIT_BUCKETS)
+        self.wait_sum[name] = 0.0
+        self.wait_count[name] = 0
+
+    def observe_wait(self, engine: AsyncEngine, seconds: float):
+        """Record how long a session waited for a pooled connection"""
+        name = self.names.get(id(engine))
+        if name is None:
+            return
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[name][i] += 1
+        self.wait_sum[name] += seconds
+        self.wait_count[name] += 1
+
+    def snapshot(self) -> dict:
+        """Current pool gauges for every registered engine"""
+        data = {}
+        for name, engine in self.engines.items():
+            pool = engine.pool
+            if not hasattr(pool, "size"):
+                continue
+            size = pool.size()
+            checked_out = pool.checkedout()
+            capacity = size + max(getattr(pool, "_max_overflow", 0), 0)
+            data[name] = {
+                "size": size,
+                "checked_out": checked_out,
+                "overflow": max(pool.overflow(), 0),
+                "idle": pool.checkedin(),
+                "utilization": round(checked_out / capacity, 4) if capacity else 0.0,
+            }
+        return data
+
+    def render(self) -> str:
+        """Prometheus text format"""
+        lines = []
+        gauges = self.snapshot()
+        for metric in ("size", "checked_out", "overflow", "idle", "utilization"):
+            lines.append(f"# TYPE db_pool_{metric} gauge")
+            for name, values in gauges.items():
+                lines.append(f'db_pool_{metric}{{engine="{name}"}} {values[metric]}')
+
+        lines.append("# TYPE db_pool_checkout_wait_seconds histogram")
+        for name in self.engines:
+            for bound, count in zip(WAIT_BUCKETS, self.bucket_counts[name]):
+                lines.append(f'db_pool_checkout_wait_seconds_bucket{{engine="{name}",le="{bound}"}} {count}')
+            lines.append(f'db_pool_checkout_wait_seconds_bucket{{engine="{name}",le="+Inf"}} {self.wait_count[name]}')
+            lines.append(f'db_pool_checkout_wait_seconds_sum{{engine="{name}"}} {self.wait_sum[name]:.6f}')
+            lines.append(f'db_pool_checkout_wait_seconds_count{{engine="{name}"}} {self.wait_count[name]}')
+        return "\n".join(lines) + "\n"
+
+
+pool_metrics = PoolMetrics()
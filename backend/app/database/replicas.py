@@ -0,0 +1,111 @@
+"""
+Read Replica Routing
+
+Round-robin selection of read replicas with health and replication-lag guards.
+A replica is skipped while it is failing or lagging behind the primary by more
+than REPLICA_MAX_LAG_SECONDS; when no replica is usable the caller falls back
+to the primary engine.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+logger = logging.getLogger(__name__)
+
+# Replication lag in seconds. A replica that has replayed everything it has
+# received reports 0 even if the primary has been idle for a while.
+REPLICATION_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class Replica:
+    """Single read replica and its last known health state"""
+
+    def __init__(self, url: str, engine: AsyncEngine):
+        self.url = url
+        self.engine = engine
+        self.lag_seconds: float = 0.0
+        self.checked_at: float = 0.0
+        self.down_until: float = 0.0
+        self.lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"<Replica lag={self.lag_seconds:.1f}s down_until={self.down_until:.0f}>"
+
+
+class ReplicaRouter:
+    """Load-balances read-only sessions across healthy replicas"""
+
+    def __init__(
+        self,
+        urls: List[str],
+        max_lag_seconds: float,
+        check_interval: int,
+        retry_after: int,
+        **engine_kwargs
+    ):
+        self.replicas = [Replica(url, create_async_engine(url, **engine_kwargs)) for url in urls]
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._cycle = itertools.cycle(self.replicas)
+
+    async def pick(self) -> Optional[AsyncEngine]:
+        """
+        Return the engine of the next usable replica
+
+        Returns:
+            AsyncEngine or None if every replica is down or lagging
+        """
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            if await self._is_usable(replica):
+                return replica.engine
+        return None
+
+    def mark_failed(self, engine: AsyncEngine):
+        """Take a replica out of rotation after a connection error"""
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.down_until = time.monotonic() + self.retry_after
+                logger.warning(f"Replica {replica.engine.url.host} marked down for {self.retry_after}s")
+
+    async def dispose(self):
+        """Close all replica connection pools"""
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def _is_usable(self, replica: Replica) -> bool:
+        now = time.monotonic()
+        if replica.down_until > now:
+            return False
+
+        # Only one coroutine probes a replica at a time; the others use the cached state
+        if now - replica.checked_at >= self.check_interval and not replica.lock.locked():
+            async with replica.lock:
+                await self._probe(replica)
+
+        return replica.down_until <= time.monotonic() and replica.lag_seconds <= self.max_lag_seconds
+
+    async def _probe(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as conn:
+                lag = await conn.scalar(REPLICATION_LAG_SQL)
+            replica.lag_seconds = float(lag or 0)
+            if replica.lag_seconds > self.max_lag_seconds:
+                logger.warning(f"Replica {replica.engine.url.host} lagging by {replica.lag_seconds:.1f}s")
+        except Exception as e:
+            logger.error(f"Replica {replica.engine.url.host} health check failed: {e}")
+            replica.down_until = time.monotonic() + self.retry_after
+        replica.checked_at = time.monotonic()
@@ -0,0 +1,53 @@
+"""
+Schema Version Check
+
+The application never creates or alters tables itself. Schema changes live in
+backend/migrations/NNN_*.sql and each migration records its number in
+schema_migrations. On startup we run a single query to make sure the database
+is at least at REQUIRED_SCHEMA_VERSION.
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump together with every new migration the code depends on
+REQUIRED_SCHEMA_VERSION = 22
+
+
+class SchemaVersionError(RuntimeError):
+    """Database schema is older than the running code expects"""
+
+
+async def get_schema_version(engine: AsyncEngine) -> int:
+    """Return the latest applied migration number (0 if none)"""
+    try:
+        async with engine.connect() as conn:
+            version = await conn.scalar(text("SELECT MAX(version) FROM schema_migrations"))
+    except ProgrammingError:
+        # schema_migrations does not exist yet
+        return 0
+    return version or 0
+
+
+async def check_schema_version(engine: AsyncEngine) -> int:
+    """
+    Verify that all required migrations are applied
+
+    Raises SchemaVersionError when SCHEMA_CHECK_STRICT is on, otherwise logs a warning.
+    """
+    version = await get_schema_version(engine)
+    if version < REQUIRED_SCHEMA_VERSION:
+        message = (
+            f"Database schema version {version} is older than required {REQUIRED_SCHEMA_VERSION}. "
+            f"Apply pending migrations from backend/migrations."
+        )
+        if settings.SCHEMA_CHECK_STRICT:
+            raise SchemaVersionError(message)
+        logger.warning(message)
+    return version
@@ -1,17 +1,53 @@
 """
 Database Session Management
 """
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import time
+import uuid
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
+from app.database.replicas import ReplicaRouter
+from app.database.pool_metrics import pool_metrics
+
+
+def engine_options() -> dict:
+    """
+    Engine and pool options shared by the primary and replica engines
+
+    Behind PgBouncer in transaction mode a connection may land on a different
+    server backend for every transaction, so asyncpg's prepared statement
+    caches are disabled and statements get unique names to avoid collisions.
+    """
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    else:
+        connect_args = {
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+
+    return {
+        "echo": settings.DB_ECHO,
+        "future": True,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
 
 # Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True if settings.ENVIRONMENT == "development" else False,
-    future=True,
-    pool_pre_ping=True,
-)
+engine = create_async_engine(settings.DATABASE_URL, **engine_options())
+pool_metrics.register("primary", engine)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -22,11 +58,87 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+# Read replicas (optional). Sessions are bound per request to the chosen engine.
+replica_router = ReplicaRouter(
+    settings.DATABASE_REPLICA_URLS,
+    max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_HEALTH_CHECK_INTERVAL,
+    retry_after=settings.REPLICA_RETRY_AFTER_SECONDS,
+    **engine_options()
+) if settings.DATABASE_REPLICA_URLS else None
+
+if replica_router:
+    for i, replica in enumerate(replica_router.replicas, start=1):
+        pool_metrics.register(f"replica{i}", replica.engine)
+
+ReadSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
+# Read-your-writes: after a request writes to the primary the client gets this
+# cookie, and get_read_db keeps serving it from the primary until it expires.
+# API clients without cookies can send "X-Read-Consistency: strong" instead.
+READ_YOUR_WRITES_COOKIE = "db_primary_sticky"
+READ_CONSISTENCY_HEADER = "X-Read-Consistency"
+
+
+async def _checkout(session: AsyncSession, bind: AsyncEngine):
+    """Acquire the session connection up front and record the pool wait"""
+    started = time.perf_counter()
+    await session.connection()
+    pool_metrics.observe_wait(bind, time.perf_counter() - started)
+
+
+def set_read_your_writes_cookie(request: Request, response: Response):
+    """
+    Give the client the read-your-writes cookie if its request wrote
+
+    Called by the middleware in app.main once the endpoint (and the commit
+    after it) has run, so writes flushed by get_db's implicit commit count
+    too, and so do endpoints that return a Response themselves.
+    """
+    if getattr(request.state, "db_written", False):
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            "1",
+            max_age=settings.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
 
-async def get_db():
+
+def _track_writes(session: AsyncSession, request: Request):
+    """
+    Flag the request as soon as the session writes anything
+
+    Bookkeeping statements (view and impression counters) run with
+    execution_options(read_your_writes=False) and don't count, so browsing
+    doesn't pin the user to the primary.
+    """
+
+    def mark_written(*args):
+        request.state.db_written = True
+
+    def on_execute(orm_execute_state):
+        if orm_execute_state.execution_options.get("read_your_writes", True) is False:
+            return
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            mark_written()
+
+    event.listen(session.sync_session, "after_flush", mark_written)
+    event.listen(session.sync_session, "do_orm_execute", on_execute)
+
+
+async def get_db(request: Request):
     """Dependency for getting async database session"""
     async with AsyncSessionLocal() as session:
+        if replica_router:
+            _track_writes(session, request)
         try:
+            await _checkout(session, engine)
             yield session
             await session.commit()
         except Exception:
@@ -34,3 +146,45 @@ async def get_db():
             raise
         finally:
             await session.close()
+
+
+def _needs_primary(request: Request) -> bool:
+    return (
+        READ_YOUR_WRITES_COOKIE in request.cookies
+        or request.headers.get(READ_CONSISTENCY_HEADER, "").lower() == "strong"
+    )
+
+
+async def get_read_db(request: Request):
+    """
+    Dependency for read-only endpoints
+
+    Serves the session from a healthy replica when replicas are configured.
+    Falls back to the primary when no replica is usable, when the replica
+    fails on connect, or when the client has just written (read-your-writes).
+    Nothing is committed - use get_db for anything that writes.
+    """
+    replica_engine = None
+    if replica_router and not _needs_primary(request):
+        replica_engine = await replica_router.pick()
+
+    if replica_engine is None:
+        async with AsyncSessionLocal() as session:
+            await _checkout(session, engine)
+            yield session
+        return
+
+    async with ReadSessionLocal(bind=replica_engine) as session:
+        try:
+            await _checkout(session, replica_engine)
+        except (DBAPIError, OSError):
+            replica_router.mark_failed(replica_engine)
+            replica_engine = None
+
+        if replica_engine is not None:
+            yield session
+            return
+
+    async with AsyncSessionLocal() as session:
+        await _checkout(session, engine)
+        yield session
@@ -1,16 +1,21 @@
 """
 Bazarlar Online - Main FastAPI Application
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import os
 
 from app.core.config import settings
+from app.core.redis import close_redis
+from app.services.realtime import hub as realtime_hub
+from app.services.reference_data import registry as reference_registry
 from app.api.v1 import api_router
-from app.database.session import engine
-from app.database.base import Base
+from app.database.session import engine, replica_router, set_read_your_writes_cookie
+from app.database.pool_metrics import pool_metrics
+from app.database.schema_version import check_schema_version
 
 
 @asynccontextmanager
@@ -19,9 +24,11 @@ async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting Bazarlar Online...")
 
-    # Create database tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Schema is managed by backend/migrations; only verify it is up to date
+    await check_schema_version(engine)
+
+    # Cities, markets and categories are served from memory
+    await reference_registry.start()
 
     # Create uploads directory
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
@@ -32,6 +39,12 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     print("👋 Shutting down Bazarlar Online...")
+    if replica_router:
+        await replica_router.dispose()
+    await realtime_hub.close()
+    await reference_registry.close()
+    await engine.dispose()
+    await close_redis()
 
 
 # Initialize FastAPI app
@@ -53,6 +66,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """Read-your-writes cookie for requests that wrote to the primary"""
+    response = await call_next(request)
+    if replica_router:
+        set_read_your_writes_cookie(request, response)
+    return response
+
+
 # Mount static files (uploads)
 if os.path.exists(settings.UPLOAD_DIR):
     app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
@@ -78,3 +101,9 @@ async def health_check():
         "status": "healthy",
         "environment": settings.ENVIRONMENT
     }
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Connection pool metrics of this worker (Prometheus text format)"""
+    return pool_metrics.render()
@@ -2,35 +2,52 @@
 Database Models
 """
 from app.models.user import User, SellerProfile
-from app.models.product import Product, Category
+from app.models.product import Product, Category, PartnerOffer, ProductAttribute, CatalogFacetCount, CategoryPriceBucket
 from app.models.order import Order
-from app.models.wallet import Wallet, Transaction, WithdrawalRequest
+from app.models.wallet import Wallet, Transaction, WithdrawalRequest, WalletBalanceSnapshot, ReferralStats
 from app.models.chat import Chat, Message
 from app.models.review import Review
 from app.models.location import City, Market
-from app.models.notification import Notification
+from app.models.notification import Notification, NotificationCounter, NotificationFanout
 from app.models.favorite import Favorite, ViewHistory
-from app.models.report import Report
-from app.models.coupon import Coupon, CouponUsage
+from app.models.report import Report, ReportTarget
+from app.models.coupon import Coupon, CouponUsage, CouponUserUsage
+from app.models.recommendation import ProductSimilarity, UserCategoryAffinity
+from app.models.moderation import BannedImage, ProductFingerprint, ProductDuplicate
 
 __all__ = [
     "User",
     "SellerProfile",
     "Product",
     "Category",
+    "PartnerOffer",
+    "ProductAttribute",
+    "CatalogFacetCount",
+    "CategoryPriceBucket",
     "Order",
     "Wallet",
     "Transaction",
     "WithdrawalRequest",
+    "WalletBalanceSnapshot",
+    "ReferralStats",
     "Chat",
     "Message",
     "Review",
     "City",
     "Market",
     "Notification",
+    "NotificationCounter",
+    "NotificationFanout",
     "Favorite",
     "ViewHistory",
     "Report",
+    "ReportTarget",
     "Coupon",
     "CouponUsage",
+    "CouponUserUsage",
+    "ProductSimilarity",
+    "UserCategoryAffinity",
+    "BannedImage",
+    "ProductFingerprint",
+    "ProductDuplicate",
 ]
@@ -78,6 +78,7 @@ class CouponUsage(Base):
     order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
 
     discount_amount = Column(Integer, nullable=False)  # Actual discount applied in KGS
+    status = Column(String(20), default="committed", nullable=False)  # reserved, committed, released
     used_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
@@ -87,3 +88,15 @@ class CouponUsage(Base):
 
     def __repr__(self):
         return f"<CouponUsage {self.coupon_id} by {self.user_id}>"
+
+
+class CouponUserUsage(Base):
+    """Per-user redemption counter (incremented atomically on reservation)"""
+    __tablename__ = "coupon_user_usage"
+
+    coupon_id = Column(UUID(as_uuid=True), ForeignKey("coupons.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    used_count = Column(Integer, nullable=False, default=0)  # Reserved + committed redemptions
+
+    def __repr__(self):
+        return f"<CouponUserUsage {self.coupon_id} by {self.user_id}: {self.used_count}>"
@@ -0,0 +1,66 @@
+"""
+Moderation Models
+"""
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, BigInteger, Integer, Index
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from datetime import datetime
+import uuid
+
+from app.database.base import Base
+
+
+class BannedImage(Base):
+    """Perceptual hashes of images that must not appear in listings (app.services.image_hashing)"""
+    __tablename__ = "banned_images"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    phash = Column(BigInteger, nullable=False)  # Signed 64-bit pHash
+    dhash = Column(BigInteger, nullable=False)  # Signed 64-bit dHash
+    image_url = Column(String(500), nullable=True)
+    reason = Column(Text, nullable=True)
+    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BannedImage {self.phash:x}>"
+
+
+class ProductFingerprint(Base):
+    """Perceptual hashes of a product's images and title (app.services.duplicate_detection)"""
+    __tablename__ = "product_fingerprints"
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    image_phashes = Column(ARRAY(BigInteger), nullable=False, default=list)  # Signed 64-bit, one per readable image
+    image_dhashes = Column(ARRAY(BigInteger), nullable=False, default=list)  # Same order as image_phashes
+    title_simhash = Column(BigInteger, nullable=False)
+    content_hash = Column(String(32), nullable=True)  # md5 of the title and image URLs hashed
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_product_fingerprints_updated_at', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f"<ProductFingerprint {self.product_id}>"
+
+
+class ProductDuplicate(Base):
+    """
+    A pair of near-duplicate listings, stored once with product_id < duplicate_id
+
+    match: image, title or image+title
+    """
+    __tablename__ = "product_duplicates"
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    duplicate_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    match = Column(String(20), nullable=False)
+    distance = Column(Integer, nullable=False)  # Smallest Hamming distance found
+    detected_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_product_duplicates_duplicate', 'duplicate_id'),
+    )
+
+    def __repr__(self):
+        return f"<ProductDuplicate {self.product_id} ~ {self.duplicate_id} ({self.match})>"
@@ -1,7 +1,7 @@
 """
 Notification Model
 """
-from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -33,5 +33,48 @@ class Notification(Base):
     # Relationships
     user = relationship("User", back_populates="notifications")
 
+    __table_args__ = (
+        Index('idx_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<Notification {self.type} for user {self.user_id}>"
+
+
+class NotificationCounter(Base):
+    """Unread notifications per user, maintained by app.services.notifications"""
+    __tablename__ = "notification_counters"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<NotificationCounter user={self.user_id} unread={self.unread_count}>"
+
+
+class NotificationFanout(Base):
+    """
+    Bulk notification job: one template sent to an audience
+
+    Recipients are processed in user_id order and last_user_id is saved with
+    every committed chunk, so a retried job resumes without duplicates.
+    """
+    __tablename__ = "notification_fanouts"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    audience = Column(String(50), nullable=False)  # see app.services.notification_fanout.AUDIENCES
+    params = Column(JSONB, nullable=False, default=dict)
+    template = Column(JSONB, nullable=False)  # type, title, message, data
+
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    last_user_id = Column(UUID(as_uuid=True), nullable=True)
+    sent_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<NotificationFanout {self.audience} {self.status} sent={self.sent_count}>"
@@ -19,7 +19,9 @@ class Order(Base):
     buyer_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     seller_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     items = Column(JSONB, nullable=False)  # [{product_id, quantity, price, discount_price}]
-    total_amount = Column(Numeric(10, 2), nullable=False)
+    total_amount = Column(Numeric(10, 2), nullable=False)  # After coupon discount
+    coupon_id = Column(UUID(as_uuid=True), ForeignKey("coupons.id", ondelete="SET NULL"), nullable=True)
+    discount_amount = Column(Numeric(10, 2), default=0)  # Coupon discount
     delivery_address = Column(Text, nullable=True)
     phone_number = Column(String(20), nullable=True)
     payment_method = Column(String(20), nullable=True)  # wallet, mbank
@@ -1,7 +1,7 @@
 """
 Product and Category Models
 """
-from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, Text, Numeric, CheckConstraint
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, Text, Numeric, CheckConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -55,6 +55,9 @@ class Product(Base):
     images = Column(JSONB, nullable=True)  # ['url1', 'url2', ...]
     status = Column(String(20), default="moderation")  # moderation, active, inactive, rejected
     moderation_result = Column(JSONB, nullable=True)
+    # Moderation queue lease (app.services.moderation_queue)
+    moderation_claimed_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    moderation_lease_until = Column(DateTime, nullable=True)
 
     # New promotion system based on views
     promotion_views_total = Column(Integer, default=0)  # Total purchased promotion views
@@ -66,7 +69,7 @@ class Product(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
-    seller = relationship("User", back_populates="products")
+    seller = relationship("User", back_populates="products", foreign_keys=[seller_id])
     category = relationship("Category", back_populates="products")
     favorited_by = relationship("Favorite", back_populates="product", cascade="all, delete-orphan")
     views = relationship("ViewHistory", back_populates="product", cascade="all, delete-orphan")
@@ -74,6 +77,7 @@ class Product(Base):
     # Constraints
     __table_args__ = (
         CheckConstraint('referral_commission_percent IS NULL OR (referral_commission_percent >= 1 AND referral_commission_percent <= 50)', name='check_referral_commission'),
+        Index('idx_products_status_created', 'status', 'created_at'),
     )
 
     def __repr__(self):
@@ -101,3 +105,96 @@ class Product(Base):
     def is_promoted(self):
         """Check if product is currently promoted (has remaining promotion views)"""
         return self.promotion_views_remaining > 0
+
+
+class PartnerOffer(Base):
+    """
+    Active referral product with precomputed commission, maintained by
+    app.services.partner_offers for the partner catalog
+    """
+    __tablename__ = "partner_offers"
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    seller_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    category_id = Column(Integer, nullable=True)
+    effective_price = Column(Numeric(10, 2), nullable=False)  # discount_price, иначе price
+    commission_percent = Column(Numeric(5, 2), nullable=False)
+    commission_amount = Column(Numeric(10, 2), nullable=False)  # Комиссия партнёра в сомах
+    seller_is_business = Column(Boolean, nullable=False, default=False)  # Показывается только у Business
+    created_at = Column(DateTime, nullable=False)  # products.created_at
+
+    __table_args__ = (
+        Index(
+            'idx_partner_offers_commission_amount', commission_amount.desc(), 'product_id',
+            postgresql_where=seller_is_business
+        ),
+        Index(
+            'idx_partner_offers_commission_percent', commission_percent.desc(), commission_amount.desc(),
+            postgresql_where=seller_is_business
+        ),
+        Index(
+            'idx_partner_offers_created', created_at.desc(),
+            postgresql_where=seller_is_business
+        ),
+        Index(
+            'idx_partner_offers_category_commission', 'category_id', commission_amount.desc(),
+            postgresql_where=seller_is_business
+        ),
+    )
+
+    def __repr__(self):
+        return f"<PartnerOffer product={self.product_id} commission={self.commission_amount}>"
+
+
+class ProductAttribute(Base):
+    """
+    One characteristic of a product, normalized for filtering and facets;
+    maintained by app.services.product_attributes from products.characteristics
+    """
+    __tablename__ = "product_attributes"
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    name = Column(String(100), primary_key=True)  # Нормализованное имя: без пробелов по краям, в нижнем регистре
+    value = Column(String(200), primary_key=True)  # Нормализованное значение
+    name_label = Column(String(100), nullable=False)  # Как ввёл продавец, для отображения
+    value_label = Column(String(200), nullable=False)
+
+    __table_args__ = (
+        Index('idx_product_attributes_name_value', 'name', 'value', 'product_id'),
+    )
+
+    def __repr__(self):
+        return f"<ProductAttribute {self.product_id} {self.name}={self.value}>"
+
+
+class CatalogFacetCount(Base):
+    """
+    Active products per (category, seller city, seller type), maintained by
+    app.services.catalog_facets; 0 and '' stand for "not set"
+    """
+    __tablename__ = "catalog_facet_counts"
+
+    category_id = Column(Integer, primary_key=True, default=0)  # Категория товара, без родителей
+    city_id = Column(Integer, primary_key=True, default=0)  # Город из профиля продавца
+    seller_type = Column(String(50), primary_key=True, default="")
+    active_products = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogFacetCount {self.category_id}/{self.city_id}/{self.seller_type}: {self.active_products}>"
+
+
+class CategoryPriceBucket(Base):
+    """
+    Active products per category and price bucket, maintained with the
+    catalog facet counts; edges in app.services.price_stats
+    """
+    __tablename__ = "category_price_buckets"
+
+    category_id = Column(Integer, primary_key=True, default=0)  # Категория товара, без родителей; 0 - без категории
+    bucket = Column(Integer, primary_key=True)  # width_bucket(price, PRICE_BUCKET_EDGES)
+    active_products = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CategoryPriceBucket {self.category_id}/{self.bucket}: {self.active_products}>"
@@ -0,0 +1,35 @@
+"""
+Recommendation Models
+"""
+from sqlalchemy import Column, DateTime, ForeignKey, Float, Integer, SmallInteger
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+
+from app.database.base import Base
+
+
+class ProductSimilarity(Base):
+    """Precomputed top-K item-to-item neighbours (rebuilt by a periodic task)"""
+    __tablename__ = "product_similarities"
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(SmallInteger, primary_key=True)  # 1 = most similar
+    neighbor_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)  # Cosine similarity of co-view/co-favorite vectors
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ProductSimilarity {self.product_id} #{self.rank} -> {self.neighbor_id}>"
+
+
+class UserCategoryAffinity(Base):
+    """Per-user interest in a category, updated incrementally on every product view"""
+    __tablename__ = "user_category_affinity"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False, default=0)  # Exponentially decayed view count as of updated_at
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UserCategoryAffinity user={self.user_id} category={self.category_id} score={self.score:.2f}>"
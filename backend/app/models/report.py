@@ -1,8 +1,8 @@
 """
 Report Model
 """
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Enum as SQLEnum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Integer, Index, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -53,6 +53,7 @@ class Report(Base):
     reported_review_id = Column(UUID(as_uuid=True), ForeignKey("reviews.id", ondelete="CASCADE"), nullable=True)
     reported_user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     reported_order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), nullable=True)
+    target_id = Column(UUID(as_uuid=True), nullable=True)  # Id жалобы любого типа; ключ ReportTarget вместе с report_type
 
     # Reporter contact info (editable by user)
     reporter_phone = Column(String(20), nullable=True)
@@ -81,5 +82,50 @@ class Report(Base):
     reported_user = relationship("User", foreign_keys=[reported_user_id])
     reported_order = relationship("Order", foreign_keys=[reported_order_id])
 
+    __table_args__ = (
+        # One pending report per reporter and target (app.services.report_triage)
+        Index(
+            'uq_reports_pending_reporter_target', 'reporter_id', 'report_type', 'target_id',
+            unique=True, postgresql_where=status == ReportStatus.PENDING.value
+        ),
+        Index('idx_reports_target_status', 'report_type', 'target_id', 'status'),
+        Index('idx_reports_status_type', 'status', 'report_type'),
+    )
+
     def __repr__(self):
         return f"<Report {self.report_type} by {self.reporter_id}>"
+
+
+class ReportTarget(Base):
+    """
+    Reports aggregated per reported entity, maintained by
+    app.services.report_triage; moderators work through these
+    """
+    __tablename__ = "report_targets"
+
+    report_type = Column(SQLEnum(ReportType, name="report_type_enum", values_callable=lambda x: [e.value for e in x], create_type=False), primary_key=True)
+    target_id = Column(UUID(as_uuid=True), primary_key=True)
+    status = Column(SQLEnum(ReportStatus, name="report_status_enum", values_callable=lambda x: [e.value for e in x], create_type=False), nullable=False, default=ReportStatus.PENDING)
+    reports_count = Column(Integer, nullable=False, default=0)  # Все жалобы за всё время
+    pending_reports = Column(Integer, nullable=False, default=0)  # Жалобы с последнего рассмотрения
+    priority_score = Column(Integer, nullable=False, default=0)  # Сумма весов причин ожидающих жалоб
+    reasons = Column(JSONB, nullable=False, default=dict)  # {причина: число ожидающих жалоб}
+    last_report_id = Column(UUID(as_uuid=True), ForeignKey("reports.id", ondelete="SET NULL"), nullable=True)
+    first_reported_at = Column(DateTime, nullable=False)  # Первая жалоба с последнего рассмотрения
+    last_reported_at = Column(DateTime, nullable=False)
+    reviewed_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    reviewed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            'idx_report_targets_pending_priority', priority_score.desc(), last_reported_at.desc(),
+            postgresql_where=status == ReportStatus.PENDING.value
+        ),
+        Index(
+            'idx_report_targets_pending_type_priority', 'report_type', priority_score.desc(), last_reported_at.desc(),
+            postgresql_where=status == ReportStatus.PENDING.value
+        ),
+    )
+
+    def __repr__(self):
+        return f"<ReportTarget {self.report_type} {self.target_id} score={self.priority_score}>"
@@ -1,7 +1,7 @@
 """
 User and Seller Profile Models
 """
-from sqlalchemy import Column, String, Boolean, DateTime, Enum, Integer, ForeignKey, Text, Numeric
+from sqlalchemy import Column, String, Boolean, DateTime, Enum, Integer, ForeignKey, Text, Numeric, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -44,7 +44,7 @@ class User(Base):
 
     # Relationships
     seller_profile = relationship("SellerProfile", back_populates="user", uselist=False)
-    products = relationship("Product", back_populates="seller")
+    products = relationship("Product", back_populates="seller", foreign_keys="Product.seller_id")
     wallet = relationship("Wallet", back_populates="user", uselist=False)
     transactions = relationship("Transaction", back_populates="user")
     orders_as_buyer = relationship("Order", foreign_keys="Order.buyer_id", back_populates="buyer")
@@ -58,6 +58,25 @@ class User(Base):
     favorites = relationship("Favorite", back_populates="user", cascade="all, delete-orphan")
     view_history = relationship("ViewHistory", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index(
+            'idx_users_referred_by_expires', 'referred_by', 'referral_expires_at',
+            postgresql_where=referred_by.isnot(None)
+        ),
+        Index(
+            'idx_users_referral_expires_at', 'referral_expires_at',
+            postgresql_where=referred_by.isnot(None)
+        ),
+        # Admin user directory (app.services.user_directory)
+        Index('idx_users_email_trgm', 'email', postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
+        Index('idx_users_full_name_trgm', 'full_name', postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'}),
+        Index('idx_users_phone_trgm', 'phone', postgresql_using='gin', postgresql_ops={'phone': 'gin_trgm_ops'}),
+        Index('idx_users_created_id', created_at.desc(), id.desc()),
+        Index('idx_users_role_created_id', 'role', created_at.desc(), id.desc()),
+        Index('idx_users_tariff_created_id', 'tariff', created_at.desc(), id.desc()),
+        Index('idx_users_banned_created_id', 'is_banned', created_at.desc(), id.desc()),
+    )
+
     def __repr__(self):
         return f"<User {self.email}>"
 
@@ -1,7 +1,7 @@
 """
 Wallet, Transaction and Withdrawal Models
 """
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Numeric
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Numeric, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -30,19 +30,30 @@ class Wallet(Base):
 
 
 class Transaction(Base):
-    """Transaction model"""
+    """Transaction model - append-only wallet ledger (see app.services.ledger)"""
     __tablename__ = "transactions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     type = Column(String(50), nullable=False)  # topup, withdrawal, purchase, referral, promotion
     amount = Column(Numeric(10, 2), nullable=False)
+    balance_delta = Column(Numeric(10, 2), nullable=True)  # Signed change of balance_type (NULL - no balance change)
     balance_type = Column(String(20), nullable=True)  # main, referral
     description = Column(Text, nullable=True)
     reference_id = Column(UUID(as_uuid=True), nullable=True)  # link to order/withdrawal/etc
     status = Column(String(20), default="completed")  # pending, completed, failed
+    idempotency_key = Column(String(255), nullable=True)  # Unique per money movement entry
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
+    __table_args__ = (
+        Index('idx_transactions_user_type_created', 'user_id', 'type', 'created_at'),
+        Index('idx_transactions_user_created', 'user_id', 'created_at'),
+        Index(
+            'uq_transactions_idempotency_key', 'idempotency_key',
+            unique=True, postgresql_where=idempotency_key.isnot(None)
+        ),
+    )
+
     # Relationships
     user = relationship("User", back_populates="transactions")
 
@@ -50,6 +61,19 @@ class Transaction(Base):
         return f"<Transaction {self.type} {self.amount} {self.currency}>"
 
 
+class WalletBalanceSnapshot(Base):
+    """Wallet balances as of taken_at, built from the ledger by a periodic task"""
+    __tablename__ = "wallet_balance_snapshots"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    taken_at = Column(DateTime, primary_key=True)  # Covers ledger entries with created_at <= taken_at
+    main_balance = Column(Numeric(10, 2), nullable=False, default=0)
+    referral_balance = Column(Numeric(10, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<WalletBalanceSnapshot user_id={self.user_id} at={self.taken_at} main={self.main_balance}>"
+
+
 class WithdrawalRequest(Base):
     """Withdrawal Request model"""
     __tablename__ = "withdrawal_requests"
@@ -120,3 +144,19 @@ class ProductReferralPurchase(Base):
 
     def __repr__(self):
         return f"<ProductReferralPurchase referrer={self.referrer_id} amount={self.commission_amount} status={self.status}>"
+
+
+class ReferralStats(Base):
+    """Referral totals per referrer, maintained by app.services.referral_stats"""
+    __tablename__ = "referral_stats"
+
+    referrer_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    referrals_count = Column(Integer, nullable=False, default=0)  # Все приглашённые пользователи
+    active_referrals = Column(Integer, nullable=False, default=0)  # Реферальный срок не истёк
+    topup_earnings = Column(Numeric(12, 2), nullable=False, default=0)  # Кэшбек с пополнений рефералов
+    commission_earnings = Column(Numeric(12, 2), nullable=False, default=0)  # Выплаченные комиссии за товары
+    pending_earnings = Column(Numeric(12, 2), nullable=False, default=0)  # Комиссии по ещё не завершённым заказам
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ReferralStats referrer={self.referrer_id} referrals={self.referrals_count}>"
@@ -36,6 +36,7 @@ class OrderCreate(BaseModel):
     phone_number: str
     payment_method: str = "cash"  # Only cash payment on delivery
     notes: Optional[str] = None  # Additional notes for the order
+    coupon_code: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -57,6 +58,37 @@ class OrderCreate(BaseModel):
         }
 
 
+class CartCheckout(BaseModel):
+    """Checkout a cart with items from several sellers (one order per seller)"""
+    items: List[OrderItem]
+    delivery_address: Optional[str] = None
+    phone_number: str
+    payment_method: str = "cash"  # Only cash payment on delivery
+    notes: Optional[str] = None
+    coupon_code: Optional[str] = None  # Applied to one order (the seller's, or the largest)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {
+                        "product_id": "123e4567-e89b-12d3-a456-426614174001",
+                        "quantity": 2,
+                        "price": 1500.00
+                    },
+                    {
+                        "product_id": "123e4567-e89b-12d3-a456-426614174005",
+                        "quantity": 1,
+                        "price": 800.00
+                    }
+                ],
+                "delivery_address": "г. Бишкек, ул. Чуй 123",
+                "phone_number": "+996555123456",
+                "payment_method": "cash"
+            }
+        }
+
+
 class OrderStatusUpdate(BaseModel):
     """Update order status"""
     status: str  # pending, processing, completed, cancelled
@@ -77,6 +109,7 @@ class OrderResponse(BaseModel):
     seller_id: str
     items: List[Dict]
     total_amount: Decimal
+    discount_amount: Decimal = Decimal(0)
     delivery_address: Optional[str] = None
     phone_number: Optional[str] = None
     payment_method: Optional[str] = None
@@ -105,3 +138,9 @@ class OrderListItem(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class CartCheckoutResponse(BaseModel):
+    """Orders created from one cart checkout"""
+    orders: List[OrderResponse]
+    total_amount: Decimal
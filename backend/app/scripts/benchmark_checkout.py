@@ -0,0 +1,143 @@
+"""
+Бенчмарк конкурентного оформления заказов (проверка отсутствия overselling)
+
+Создаёт временного продавца, покупателя и товар с остатком --stock, затем
+одновременно запускает --checkouts оформлений по 1 шт. через
+app.services.order_placement (каждое в своей сессии/транзакции, как в API).
+
+Проверяет:
+- успешных заказов ровно min(stock, checkouts)
+- остаток на складе не ушёл в минус и равен stock - успешные
+- количество созданных заказов совпадает с успешными
+
+Запуск (из каталога backend/, нужна рабочая БД из DATABASE_URL):
+    python -m app.scripts.benchmark_checkout --stock 100 --checkouts 1000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import select, func, delete
+
+from app.database.session import AsyncSessionLocal, engine
+from app.models.order import Order
+from app.models.product import Product
+from app.models.user import User
+from app.schemas.order import OrderItem
+from app.services.order_placement import OrderDraft, OrderPlacementError, load_products, place_orders
+
+
+async def setup(stock: int):
+    async with AsyncSessionLocal() as session:
+        suffix = uuid.uuid4().hex[:8]
+        seller = User(email=f"bench-seller-{suffix}@example.com", full_name="Benchmark Seller")
+        buyer = User(email=f"bench-buyer-{suffix}@example.com", full_name="Benchmark Buyer")
+        session.add_all([seller, buyer])
+        await session.flush()
+
+        product = Product(
+            seller_id=seller.id,
+            title=f"Benchmark product {suffix}",
+            price=Decimal("100"),
+            stock_quantity=stock,
+            status="active",
+        )
+        session.add(product)
+        await session.commit()
+        return seller.id, buyer.id, product.id
+
+
+async def checkout(buyer_id, seller_id, product_id) -> tuple:
+    item = OrderItem(product_id=str(product_id), quantity=1, price=Decimal("100"))
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        try:
+            products = await load_products(session, [item])
+            await place_orders(
+                session,
+                buyer_id=buyer_id,
+                drafts=[OrderDraft(seller_id=seller_id, items=[item])],
+                products=products,
+                delivery_address=None,
+                phone_number="+996555000000",
+                payment_method="cash",
+                notes="benchmark",
+            )
+            await session.commit()
+            ok = True
+        except OrderPlacementError:
+            await session.rollback()
+            ok = False
+    return ok, time.perf_counter() - started
+
+
+async def cleanup(seller_id, buyer_id, product_id):
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Order).where(Order.buyer_id == buyer_id))
+        await session.execute(delete(Product).where(Product.id == product_id))
+        await session.execute(delete(User).where(User.id.in_([seller_id, buyer_id])))
+        await session.commit()
+
+
+async def run(stock: int, checkouts: int, concurrency: int) -> bool:
+    seller_id, buyer_id, product_id = await setup(stock)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await checkout(buyer_id, seller_id, product_id)
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[limited() for _ in range(checkouts)])
+        elapsed = time.perf_counter() - started
+
+        succeeded = sum(1 for ok, _ in results if ok)
+        latencies = sorted(latency for _, latency in results)
+
+        async with AsyncSessionLocal() as session:
+            remaining = await session.scalar(select(Product.stock_quantity).where(Product.id == product_id))
+            orders_created = await session.scalar(
+                select(func.count()).select_from(Order).where(Order.buyer_id == buyer_id)
+            )
+
+        print(f"Checkouts:    {checkouts} (concurrency {concurrency})")
+        print(f"Throughput:   {checkouts / elapsed:.1f} checkouts/s")
+        print(f"Latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+        print(f"Latency p95:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+        print(f"Succeeded:    {succeeded}, rejected (out of stock): {checkouts - succeeded}")
+        print(f"Stock left:   {remaining} (started with {stock})")
+        print(f"Orders:       {orders_created}")
+
+        expected = min(stock, checkouts)
+        return (
+            succeeded == expected
+            and remaining == stock - succeeded
+            and remaining >= 0
+            and orders_created == succeeded
+        )
+    finally:
+        await cleanup(seller_id, buyer_id, product_id)
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent checkout benchmark")
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--checkouts", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if asyncio.run(run(args.stock, args.checkouts, args.concurrency)):
+        print("✅ No oversell")
+    else:
+        print("❌ Oversell or lost orders detected")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
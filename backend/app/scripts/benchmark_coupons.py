@@ -0,0 +1,187 @@
+"""
+Бенчмарк флэш-распродажи по купону (проверка отсутствия перерасхода)
+
+Создаёт временного продавца, товар без учёта остатка, --users покупателей и
+купон с лимитом --max-uses (по 1 использованию на пользователя). Затем
+одновременно оформляет по заказу с купоном от каждого покупателя (плюс
+--repeat повторных попыток от тех же покупателей) через
+app.services.order_placement, каждое в своей сессии/транзакции, как в API.
+
+Проверяет:
+- used_count купона ровно min(max_uses, users) и не превышает лимит
+- записей coupon_usage и заказов со скидкой столько же, сколько успешных
+- ни один покупатель не использовал купон дважды
+
+Запуск (из каталога backend/, нужны рабочие БД и Redis):
+    python -m app.scripts.benchmark_coupons --users 10000 --max-uses 1000 --concurrency 100
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, func, delete, insert
+
+from app.core.redis import close_redis
+from app.database.session import AsyncSessionLocal, engine
+from app.models.coupon import Coupon, CouponType, CouponUsage, CouponUserUsage
+from app.models.order import Order
+from app.models.product import Product
+from app.models.user import User, generate_referral_id
+from app.schemas.order import OrderItem
+from app.services.coupons import invalidate_coupon
+from app.services.order_placement import OrderDraft, OrderPlacementError, load_products, place_orders
+
+
+async def setup(users: int, max_uses: int):
+    suffix = uuid.uuid4().hex[:8]
+    async with AsyncSessionLocal() as session:
+        seller = User(email=f"bench-seller-{suffix}@example.com", full_name="Benchmark Seller")
+        session.add(seller)
+        await session.flush()
+
+        product = Product(
+            seller_id=seller.id,
+            title=f"Benchmark product {suffix}",
+            price=Decimal("1000"),
+            stock_quantity=None,
+            status="active",
+        )
+        session.add(product)
+
+        buyer_ids = [uuid.uuid4() for _ in range(users)]
+        await session.execute(insert(User), [
+            {
+                "id": buyer_id,
+                "email": f"bench-buyer-{suffix}-{i}@example.com",
+                "referral_id": generate_referral_id(),
+                "full_name": "Benchmark Buyer",
+            }
+            for i, buyer_id in enumerate(buyer_ids)
+        ])
+
+        coupon = Coupon(
+            code=f"FLASH-{suffix.upper()}",
+            type=CouponType.PERCENTAGE,
+            value=10,
+            max_uses=max_uses,
+            max_uses_per_user=1,
+            valid_until=datetime.utcnow() + timedelta(days=1),
+            created_by=seller.id,
+        )
+        session.add(coupon)
+        await session.commit()
+        return seller.id, product.id, buyer_ids, coupon.id, coupon.code
+
+
+async def checkout(buyer_id, seller_id, product_id, code) -> tuple:
+    item = OrderItem(product_id=str(product_id), quantity=1, price=Decimal("1000"))
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        try:
+            products = await load_products(session, [item])
+            await place_orders(
+                session,
+                buyer_id=buyer_id,
+                drafts=[OrderDraft(seller_id=seller_id, items=[item])],
+                products=products,
+                delivery_address=None,
+                phone_number="+996555000000",
+                payment_method="cash",
+                notes="benchmark",
+                coupon_code=code,
+            )
+            await session.commit()
+            ok = True
+        except OrderPlacementError:
+            await session.rollback()
+            ok = False
+    return ok, time.perf_counter() - started
+
+
+async def cleanup(seller_id, product_id, buyer_ids, coupon_id, code):
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Order).where(Order.seller_id == seller_id))
+        await session.execute(delete(Coupon).where(Coupon.id == coupon_id))
+        await session.execute(delete(Product).where(Product.id == product_id))
+        await session.execute(delete(User).where(User.id.in_(buyer_ids + [seller_id])))
+        await session.commit()
+    await invalidate_coupon(code)
+
+
+async def run(users: int, max_uses: int, repeat: int, concurrency: int) -> bool:
+    seller_id, product_id, buyer_ids, coupon_id, code = await setup(users, max_uses)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(buyer_id):
+        async with semaphore:
+            return await checkout(buyer_id, seller_id, product_id, code)
+
+    attempts = buyer_ids + random.sample(buyer_ids, min(repeat, len(buyer_ids)))
+    random.shuffle(attempts)
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[limited(buyer_id) for buyer_id in attempts])
+        elapsed = time.perf_counter() - started
+
+        succeeded = sum(1 for ok, _ in results if ok)
+        latencies = sorted(latency for _, latency in results)
+
+        async with AsyncSessionLocal() as session:
+            used_count = await session.scalar(select(Coupon.used_count).where(Coupon.id == coupon_id))
+            usages = await session.scalar(
+                select(func.count()).select_from(CouponUsage).where(CouponUsage.coupon_id == coupon_id)
+            )
+            discounted = await session.scalar(
+                select(func.count()).select_from(Order).where(Order.coupon_id == coupon_id)
+            )
+            max_per_user = await session.scalar(
+                select(func.coalesce(func.max(CouponUserUsage.used_count), 0))
+                .where(CouponUserUsage.coupon_id == coupon_id)
+            )
+
+        print(f"Attempts:     {len(attempts)} ({users} users, {repeat} repeats, concurrency {concurrency})")
+        print(f"Throughput:   {len(attempts) / elapsed:.1f} checkouts/s")
+        print(f"Latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+        print(f"Latency p95:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+        print(f"Succeeded:    {succeeded}, rejected: {len(attempts) - succeeded}")
+        print(f"used_count:   {used_count} (limit {max_uses})")
+        print(f"Usages:       {usages}, discounted orders: {discounted}, max per user: {max_per_user}")
+
+        expected = min(max_uses, users)
+        return (
+            succeeded == expected
+            and used_count == expected
+            and usages == expected
+            and discounted == expected
+            and max_per_user <= 1
+        )
+    finally:
+        await cleanup(seller_id, product_id, buyer_ids, coupon_id, code)
+        await engine.dispose()
+        await close_redis()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coupon flash sale benchmark")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--max-uses", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=500, help="Extra attempts by users who already tried")
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    if asyncio.run(run(args.users, args.max_uses, args.repeat, args.concurrency)):
+        print("✅ Coupon limits held")
+    else:
+        print("❌ Coupon over-redeemed or lost redemptions")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
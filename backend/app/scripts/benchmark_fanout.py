@@ -0,0 +1,183 @@
+"""
+Бенчмарк массовой рассылки уведомлений (fan-out)
+
+Создаёт временного продавца с товаром и --recipients пользователей, добавивших
+товар в избранное (аудитория seller_followers). Затем выполняет задание
+рассылки через app.services.notification_fanout.run_fanout - тот же код,
+что и Celery-воркер, - и запускает его повторно, как при ретрае задачи.
+
+Проверяет:
+- уведомлений создано ровно по одному на получателя
+- счётчики непрочитанных (notification_counters) увеличены на столько же
+- повторный запуск ничего не дублирует
+
+Запуск (из каталога backend/, нужна рабочая БД из DATABASE_URL):
+    python -m app.scripts.benchmark_fanout --recipients 100000 --chunk-size 1000
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import select, func, delete, insert, update
+
+from app.core.redis import close_redis
+from app.database.session import AsyncSessionLocal, engine
+from app.models.favorite import Favorite
+from app.models.notification import Notification, NotificationCounter, NotificationFanout
+from app.models.product import Product
+from app.models.user import User, generate_referral_id
+from app.services.notification_fanout import create_fanout, run_fanout
+
+SEED_BATCH = 5000
+
+
+async def setup(recipients: int):
+    suffix = uuid.uuid4().hex[:8]
+    async with AsyncSessionLocal() as session:
+        seller = User(email=f"bench-seller-{suffix}@example.com", full_name="Benchmark Seller")
+        session.add(seller)
+        await session.flush()
+
+        product = Product(
+            seller_id=seller.id,
+            title=f"Benchmark product {suffix}",
+            price=Decimal("1000"),
+            status="active",
+        )
+        session.add(product)
+        await session.flush()
+
+        user_ids = [uuid.uuid4() for _ in range(recipients)]
+        for start in range(0, recipients, SEED_BATCH):
+            batch = user_ids[start:start + SEED_BATCH]
+            await session.execute(insert(User), [
+                {
+                    "id": user_id,
+                    "email": f"bench-follower-{suffix}-{start + i}@example.com",
+                    "referral_id": generate_referral_id(),
+                    "full_name": f"Follower {start + i}",
+                }
+                for i, user_id in enumerate(batch)
+            ])
+            await session.execute(insert(Favorite), [
+                {"id": uuid.uuid4(), "user_id": user_id, "product_id": product.id}
+                for user_id in batch
+            ])
+        await session.commit()
+        return seller.id, product.id, user_ids
+
+
+async def _count_batch(user_ids):
+    async with AsyncSessionLocal() as session:
+        notifications = await session.scalar(
+            select(func.count()).select_from(Notification).where(Notification.user_id.in_(user_ids))
+        )
+        unread = await session.scalar(
+            select(func.coalesce(func.sum(NotificationCounter.unread_count), 0))
+            .where(NotificationCounter.user_id.in_(user_ids))
+        )
+        per_user = await session.scalar(
+            select(func.count())
+            .select_from(Notification)
+            .where(Notification.user_id.in_(user_ids))
+            .group_by(Notification.user_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        )
+    return notifications, unread, per_user or 0
+
+
+async def count_delivered(user_ids):
+    notifications = unread = per_user = 0
+    for start in range(0, len(user_ids), SEED_BATCH):
+        batch_notifications, batch_unread, batch_per_user = await _count_batch(user_ids[start:start + SEED_BATCH])
+        notifications += batch_notifications
+        unread += batch_unread
+        per_user = max(per_user, batch_per_user)
+    return notifications, unread, per_user
+
+
+async def cleanup(seller_id, product_id, user_ids, fanout_id):
+    async with AsyncSessionLocal() as session:
+        for start in range(0, len(user_ids), SEED_BATCH):
+            batch = user_ids[start:start + SEED_BATCH]
+            await session.execute(delete(Notification).where(Notification.user_id.in_(batch)))
+        await session.execute(delete(NotificationFanout).where(NotificationFanout.id == fanout_id))
+        await session.execute(delete(Product).where(Product.id == product_id))
+        for start in range(0, len(user_ids), SEED_BATCH):
+            await session.execute(delete(User).where(User.id.in_(user_ids[start:start + SEED_BATCH])))
+        await session.execute(delete(User).where(User.id == seller_id))
+        await session.commit()
+
+
+async def run(recipients: int, chunk_size: int) -> bool:
+    print(f"Seeding {recipients} followers...")
+    seller_id, product_id, user_ids = await setup(recipients)
+    fanout_id = None
+    try:
+        async with AsyncSessionLocal() as session:
+            fanout = await create_fanout(
+                session,
+                audience="seller_followers",
+                params={"seller_id": str(seller_id)},
+                type="system",
+                title="Новинка у продавца",
+                message="{name}, у продавца, на которого вы подписаны, новый товар.",
+            )
+            fanout_id = fanout.id
+            await session.commit()
+
+        async with AsyncSessionLocal() as session:
+            started = time.perf_counter()
+            stats = await run_fanout(session, fanout_id, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - started
+
+        # A retried task: the job is re-opened and must not send anything again
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(NotificationFanout)
+                .where(NotificationFanout.id == fanout_id)
+                .values(status="running")
+            )
+            await session.commit()
+            rerun = await run_fanout(session, fanout_id, chunk_size=chunk_size)
+
+        notifications, unread, per_user = await count_delivered(user_ids)
+
+        print(f"Recipients:    {recipients} (chunk {chunk_size})")
+        print(f"Elapsed:       {elapsed:.2f} s")
+        print(f"Throughput:    {stats['sent'] / elapsed:.0f} notifications/s")
+        print(f"Sent:          {stats['sent']}, on rerun: {rerun['sent']}")
+        print(f"Notifications: {notifications}, unread counters: {unread}, max per user: {per_user}")
+
+        return (
+            stats["sent"] == recipients
+            and rerun["sent"] == 0
+            and notifications == recipients
+            and unread == recipients
+            and per_user == 1
+        )
+    finally:
+        await cleanup(seller_id, product_id, user_ids, fanout_id)
+        await engine.dispose()
+        await close_redis()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk notification fan-out benchmark")
+    parser.add_argument("--recipients", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if asyncio.run(run(args.recipients, args.chunk_size)):
+        print("✅ Every recipient notified exactly once")
+    else:
+        print("❌ Notifications lost or duplicated")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Бенчмарк холодного старта приложения
+
+Запускает `import app.main` в новых процессах Python несколько раз и сравнивает
+медиану времени с целевым значением. Код выхода 1, если цель превышена -
+можно использовать в CI, чтобы тяжёлые импорты не возвращались в endpoints.
+
+Запуск (из каталога backend/):
+    python -m app.scripts.benchmark_startup --runs 5 --target 1.5
+    python -m app.scripts.benchmark_startup --importtime   # топ самых медленных модулей
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_SNIPPET = "import app.main"
+
+
+def measure_once() -> float:
+    """Wall time of one cold interpreter importing the application"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], check=True)
+    return time.perf_counter() - started
+
+
+def slowest_imports(top: int) -> list:
+    """Parse `python -X importtime` output and return the slowest modules"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), module.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Количество запусков")
+    parser.add_argument("--target", type=float, default=1.5, help="Целевая медиана, секунды")
+    parser.add_argument("--importtime", action="store_true", help="Показать самые медленные импорты")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.importtime:
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for cumulative_us, self_us, module in slowest_imports(args.top):
+            print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+        return
+
+    # Первый запуск прогревает файловый кэш и .pyc, в статистику не входит
+    measure_once()
+    timings = [measure_once() for _ in range(args.runs)]
+    median = statistics.median(timings)
+
+    print(f"Runs:   {', '.join(f'{t:.3f}s' for t in timings)}")
+    print(f"Median: {median:.3f}s (target {args.target:.3f}s)")
+
+    if median > args.target:
+        print("❌ Cold start is over target")
+        sys.exit(1)
+    print("✅ Cold start within target")
+
+
+if __name__ == "__main__":
+    main()
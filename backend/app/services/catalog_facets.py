@@ -0,0 +1,203 @@
+"""
+Catalog Facet Counts
+
+The category tree and the filter sidebars show how many active products
+each category, city and seller type has. catalog_facet_counts keeps one row
+of active products per (category, seller city, seller type); that is a few
+thousand rows at most, so every facet is a sum over it:
+- categories: the direct counts rolled up through the hierarchy of the
+  reference registry, so a category includes its descendants
+- cities and seller types: plain sums
+- any of them within a city, seller type or category filter
+
+Counts are adjusted in the transaction of the change. Callers take a
+snapshot() of the affected products before the change and call
+record_change() with the same criteria after it (and after a flush); the
+difference is applied with one upsert. This covers status changes
+(moderation, admin), category and price edits, deletes and a seller's city
+or type changing. The same snapshots carry the price bucket, so the
+category price histograms (app.services.price_stats) move with them.
+reconcile() recounts everything periodically to repair drift, e.g. from
+products deleted with their seller.
+
+The rows are cached in Redis for CATALOG_FACETS_CACHE_TTL, so reads don't
+touch the database. Nothing here commits.
+"""
+import json
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, delete, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.product import Product, CatalogFacetCount
+from app.models.user import SellerProfile
+from app.services import price_stats
+from app.services.reference_data import current as current_reference_data
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "catalog_facets:rows"
+
+FacetKey = Tuple[int, int, str]
+SnapshotKey = Tuple[int, int, str, int]  # FacetKey + price bucket
+
+
+def _grouped(*criteria):
+    """Active products per snapshot key among products matching criteria"""
+    # Inline constants: GROUP BY must repeat the SELECT expressions exactly
+    key = (
+        func.coalesce(Product.category_id, literal_column("0")),
+        func.coalesce(SellerProfile.city_id, literal_column("0")),
+        func.coalesce(SellerProfile.seller_type, literal_column("''")),
+        price_stats.bucket_of(),
+    )
+    return (
+        select(*key, func.count())
+        .select_from(Product)
+        .outerjoin(SellerProfile, SellerProfile.user_id == Product.seller_id)
+        .where(Product.status == "active", *criteria)
+        .group_by(*key)
+    )
+
+
+async def snapshot(db: AsyncSession, *criteria) -> Counter:
+    """
+    Facet keys of the active products matching criteria, e.g.
+    Product.id.in_(ids) or Product.seller_id == seller_id
+    """
+    result = await db.execute(_grouped(*criteria))
+    return Counter({tuple(row[:-1]): row[-1] for row in result.all()})
+
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[FacetKey, int]):
+    """Add deltas to the counts (one upsert, rows in key order)"""
+    rows = [
+        {"category_id": category_id, "city_id": city_id, "seller_type": seller_type, "active_products": delta}
+        for (category_id, city_id, seller_type), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    stmt = insert(CatalogFacetCount).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[CatalogFacetCount.category_id, CatalogFacetCount.city_id, CatalogFacetCount.seller_type],
+        set_={
+            "active_products": CatalogFacetCount.active_products + stmt.excluded.active_products,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+async def record_change(db: AsyncSession, before: Counter, *criteria):
+    """Apply the difference between before and the current snapshot(criteria)"""
+    after = await snapshot(db, *criteria)
+    facet_deltas: Dict[FacetKey, int] = defaultdict(int)
+    price_deltas: Dict[Tuple[int, int], int] = defaultdict(int)
+    for snapshot_counts, sign in ((after, 1), (before, -1)):
+        for (category_id, city_id, seller_type, bucket), count in snapshot_counts.items():
+            facet_deltas[(category_id, city_id, seller_type)] += sign * count
+            price_deltas[(category_id, bucket)] += sign * count
+    await apply_deltas(db, facet_deltas)
+    await price_stats.apply_deltas(db, price_deltas)
+
+
+async def reconcile(db: AsyncSession) -> int:
+    """
+    Recount all facets and price buckets from products
+
+    A write committed while this runs can be overwritten until the next
+    run. Returns the number of facet rows.
+    """
+    per_key = _grouped().subquery()
+    category_id, city_id, seller_type, _, count = per_key.c
+    await db.execute(delete(CatalogFacetCount))
+    result = await db.execute(
+        insert(CatalogFacetCount)
+        .from_select(
+            ["category_id", "city_id", "seller_type", "active_products"],
+            select(category_id, city_id, seller_type, func.sum(count)).group_by(category_id, city_id, seller_type),
+        )
+        .returning(CatalogFacetCount.category_id)
+    )
+    await price_stats.reconcile(db)
+    return len(result.all())
+
+
+async def _rows(db: AsyncSession):
+    """[(category_id, city_id, seller_type, active_products)], from the cache when possible"""
+    redis = None
+    try:
+        redis = get_redis()
+        cached = await redis.get(CACHE_KEY)
+        if cached is not None:
+            return [tuple(row) for row in json.loads(cached)]
+    except RedisError as e:
+        logger.warning(f"Catalog facet cache unavailable: {e}")
+        redis = None
+
+    result = await db.execute(
+        select(
+            CatalogFacetCount.category_id,
+            CatalogFacetCount.city_id,
+            CatalogFacetCount.seller_type,
+            CatalogFacetCount.active_products,
+        ).where(CatalogFacetCount.active_products > 0)
+    )
+    rows = [tuple(row) for row in result.all()]
+
+    if redis is not None:
+        try:
+            await redis.set(CACHE_KEY, json.dumps(rows), ex=settings.CATALOG_FACETS_CACHE_TTL)
+        except RedisError as e:
+            logger.warning(f"Catalog facets not cached: {e}")
+    return rows
+
+
+async def get_facets(
+    db: AsyncSession,
+    category_id: Optional[int] = None,
+    city_id: Optional[int] = None,
+    seller_type: Optional[str] = None,
+) -> dict:
+    """
+    Active product counts per category (with descendants), city and seller type
+
+    Each facet is counted within the other filters, not its own, so the
+    sidebar can show what picking another value would give.
+    """
+    refs = await current_reference_data()
+    rows = await _rows(db)
+    subtree = set(refs.category_with_descendants(category_id)) if category_id else None
+
+    categories: Dict[int, int] = defaultdict(int)
+    cities: Dict[int, int] = defaultdict(int)
+    seller_types: Dict[str, int] = defaultdict(int)
+    total = 0
+    for row_category, row_city, row_type, count in rows:
+        in_category = subtree is None or row_category in subtree
+        in_city = not city_id or row_city == city_id
+        in_type = not seller_type or row_type == seller_type
+
+        if in_city and in_type and row_category:
+            # Every ancestor includes the products of its descendants
+            for category in refs.category_path(row_category):
+                categories[category.id] += count
+        if in_category and in_type and row_city:
+            cities[row_city] += count
+        if in_category and in_city and row_type:
+            seller_types[row_type] += count
+        if in_category and in_city and in_type:
+            total += count
+
+    return {
+        "categories": dict(categories),
+        "cities": dict(cities),
+        "seller_types": dict(seller_types),
+        "total": total,
+    }
@@ -0,0 +1,329 @@
+"""
+Coupon Engine
+
+Coupon lookups and redemptions built for flash sales:
+1. Lookup: coupons are cached in Redis by code (COUPON_CACHE_TTL), and
+   unknown codes for COUPON_MISS_TTL, so checkout validation on every
+   keystroke doesn't reach the database. Deactivating a coupon drops its
+   cache entry.
+2. Counters: redemptions are counted with conditional statements, never
+   read-modify-write:
+   - per user: INSERT ... ON CONFLICT DO UPDATE ... WHERE used_count < :limit
+     on coupon_user_usage
+   - globally: UPDATE coupons ... WHERE used_count < max_uses
+   The global update runs last, so the hot coupon row stays locked only
+   until the order transaction commits. Once a reservation finds the
+   coupon sold out, its cache entry is marked exhausted and later attempts
+   are refused without touching the row. Only a failed update marks it:
+   that reflects committed redemptions, while taking the last redemption
+   could still be rolled back with its order.
+3. Protocol, tied to the order lifecycle:
+   reserve (order placed) -> commit (order completed) or release (order cancelled)
+
+The database is the source of truth. Redis only spares it reads, and
+when Redis is unavailable lookups go straight to the database.
+"""
+import json
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi import status
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.coupon import Coupon, CouponUsage, CouponUserUsage, CouponType
+from app.models.order import Order
+
+logger = logging.getLogger(__name__)
+
+_MISSING = "missing"
+
+
+class CouponError(Exception):
+    """Coupon can't be applied; carries the HTTP status for the endpoint"""
+
+    def __init__(self, detail: str, status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class CachedCoupon:
+    """Coupon fields needed for validation, as stored in the cache"""
+    id: str
+    code: str
+    type: str
+    value: int
+    max_uses: Optional[int]
+    used_count: int
+    max_uses_per_user: int
+    min_order_amount: Optional[int]
+    valid_from: datetime
+    valid_until: datetime
+    is_active: bool
+    seller_id: Optional[str]
+    description: Optional[str]
+    created_at: datetime
+    exhausted: bool = False
+
+    @classmethod
+    def from_model(cls, coupon: Coupon) -> "CachedCoupon":
+        return cls(
+            id=str(coupon.id),
+            code=coupon.code,
+            type=coupon.type.value,
+            value=coupon.value,
+            max_uses=coupon.max_uses,
+            used_count=coupon.used_count or 0,
+            max_uses_per_user=coupon.max_uses_per_user or 1,
+            min_order_amount=coupon.min_order_amount,
+            valid_from=coupon.valid_from,
+            valid_until=coupon.valid_until,
+            is_active=coupon.is_active,
+            seller_id=str(coupon.seller_id) if coupon.seller_id else None,
+            description=coupon.description,
+            created_at=coupon.created_at,
+            exhausted=bool(coupon.max_uses and (coupon.used_count or 0) >= coupon.max_uses),
+        )
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        for key in ("valid_from", "valid_until", "created_at"):
+            data[key] = data[key].isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw) -> "CachedCoupon":
+        data = json.loads(raw)
+        for key in ("valid_from", "valid_until", "created_at"):
+            data[key] = datetime.fromisoformat(data[key])
+        return cls(**data)
+
+    def discount_for(self, order_amount: Decimal) -> Decimal:
+        """Discount in KGS for an order amount"""
+        if self.type == CouponType.PERCENTAGE.value:
+            return Decimal(int(order_amount * self.value / 100))
+        return min(Decimal(self.value), order_amount)  # Can't discount more than order amount
+
+
+def _cache_key(code: str) -> str:
+    return f"coupon:code:{code.upper()}"
+
+
+async def get_coupon(db: AsyncSession, code: str) -> Optional[CachedCoupon]:
+    """Coupon by code - from the cache, or loaded from the database and cached"""
+    redis = get_redis()
+    key = _cache_key(code)
+    try:
+        cached = await redis.get(key)
+        if cached is not None:
+            return None if cached == _MISSING.encode() else CachedCoupon.from_json(cached)
+    except RedisError as e:
+        logger.warning(f"Coupon cache unavailable: {e}")
+
+    result = await db.execute(
+        select(Coupon).where(Coupon.code == code.upper())
+    )
+    coupon = result.scalar_one_or_none()
+    cached_coupon = CachedCoupon.from_model(coupon) if coupon else None
+
+    try:
+        if cached_coupon:
+            await redis.set(key, cached_coupon.to_json(), ex=settings.COUPON_CACHE_TTL)
+        else:
+            await redis.set(key, _MISSING, ex=settings.COUPON_MISS_TTL)
+    except RedisError:
+        pass
+    return cached_coupon
+
+
+async def invalidate_coupon(code: str):
+    """Drop a coupon from the cache (deactivated, created, counters released)"""
+    try:
+        await get_redis().delete(_cache_key(code))
+    except RedisError as e:
+        logger.warning(f"Could not invalidate coupon {code}: {e}")
+
+
+async def _mark_exhausted(coupon: CachedCoupon):
+    """Cache the coupon as sold out; only after the database refused a redemption"""
+    coupon.exhausted = True
+    try:
+        await get_redis().set(_cache_key(coupon.code), coupon.to_json(), ex=settings.COUPON_CACHE_TTL)
+    except RedisError:
+        pass
+
+
+def check_coupon(
+    coupon: Optional[CachedCoupon],
+    order_amount: Decimal,
+    seller_id: Optional[UUID],
+    user_uses: int = 0,
+):
+    """Raise CouponError if the coupon can't be applied to the order"""
+    if not coupon:
+        raise CouponError("Coupon code not found", status.HTTP_404_NOT_FOUND)
+
+    if not coupon.is_active:
+        raise CouponError("Coupon is not active")
+
+    now = datetime.utcnow()
+    if now < coupon.valid_from:
+        raise CouponError(f"Coupon is not yet valid (starts from {coupon.valid_from.strftime('%Y-%m-%d')})")
+    if now > coupon.valid_until:
+        raise CouponError("Coupon has expired")
+
+    if coupon.exhausted or (coupon.max_uses and coupon.used_count >= coupon.max_uses):
+        raise CouponError("Coupon usage limit reached", status.HTTP_409_CONFLICT)
+
+    if coupon.seller_id and (not seller_id or coupon.seller_id != str(seller_id)):
+        raise CouponError("Coupon is only valid for specific seller")
+
+    if user_uses >= coupon.max_uses_per_user:
+        raise CouponError(f"You have already used this coupon {coupon.max_uses_per_user} time(s)")
+
+    if coupon.min_order_amount and order_amount < coupon.min_order_amount:
+        raise CouponError(f"Minimum order amount is {coupon.min_order_amount} KGS")
+
+
+async def get_user_uses(db: AsyncSession, coupon_id, user_id: UUID) -> int:
+    """Redemptions of a coupon by a user (primary key lookup)"""
+    used = await db.scalar(
+        select(CouponUserUsage.used_count).where(
+            CouponUserUsage.coupon_id == UUID(str(coupon_id)),
+            CouponUserUsage.user_id == user_id,
+        )
+    )
+    return used or 0
+
+
+def _pick_order(coupon: CachedCoupon, orders: List[Order]) -> Optional[Order]:
+    """Order of a checkout the coupon applies to"""
+    if coupon.seller_id:
+        return next((order for order in orders if str(order.seller_id) == coupon.seller_id), None)
+    # Platform-wide coupon: the largest order of a multi-seller cart
+    return max(orders, key=lambda order: order.total_amount, default=None)
+
+
+async def reserve_coupon(db: AsyncSession, code: str, user_id: UUID, orders: List[Order]) -> Order:
+    """
+    Reserve one redemption for a checkout and apply the discount
+
+    Call after the orders are flushed, as the last statement of the order
+    transaction. Does not commit - a rollback undoes the reservation.
+
+    Returns:
+        Order: The order the discount was applied to
+    """
+    coupon = await get_coupon(db, code)
+    order = _pick_order(coupon, orders) if coupon else None
+    check_coupon(
+        coupon,
+        order.total_amount if order else Decimal(0),
+        order.seller_id if order else None,
+    )
+    coupon_id = UUID(coupon.id)
+    now = datetime.utcnow()
+
+    # Per-user limit: only this user's counter row is locked
+    stmt = insert(CouponUserUsage).values(coupon_id=coupon_id, user_id=user_id, used_count=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CouponUserUsage.coupon_id, CouponUserUsage.user_id],
+        set_={"used_count": CouponUserUsage.used_count + 1},
+        where=CouponUserUsage.used_count < coupon.max_uses_per_user,
+    ).returning(CouponUserUsage.used_count)
+    if (await db.execute(stmt)).scalar_one_or_none() is None:
+        raise CouponError(f"You have already used this coupon {coupon.max_uses_per_user} time(s)")
+
+    # Global limit, re-checking activity and dates against the row itself
+    reserved = await db.execute(
+        update(Coupon)
+        .where(
+            Coupon.id == coupon_id,
+            Coupon.is_active.is_(True),
+            Coupon.valid_from <= now,
+            Coupon.valid_until >= now,
+            (Coupon.max_uses.is_(None)) | (Coupon.used_count < Coupon.max_uses),
+        )
+        .values(used_count=Coupon.used_count + 1)
+        .returning(Coupon.id)
+        .execution_options(synchronize_session=False)
+    )
+    if reserved.first() is None:
+        # Committed state: the update waited for any in-flight redemption
+        await _mark_exhausted(coupon)
+        raise CouponError("Coupon usage limit reached", status.HTTP_409_CONFLICT)
+
+    discount = coupon.discount_for(order.total_amount)
+    order.coupon_id = coupon_id
+    order.discount_amount = discount
+    order.total_amount = order.total_amount - discount
+
+    db.add(CouponUsage(
+        coupon_id=coupon_id,
+        user_id=user_id,
+        order_id=order.id,
+        discount_amount=int(discount),
+        status="reserved",
+    ))
+    return order
+
+
+async def commit_coupons(db: AsyncSession, order_ids: List[UUID]):
+    """Make reserved redemptions of completed orders final"""
+    await db.execute(
+        update(CouponUsage)
+        .where(CouponUsage.order_id.in_(order_ids), CouponUsage.status == "reserved")
+        .values(status="committed")
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def release_coupon(db: AsyncSession, order: Order) -> Optional[str]:
+    """
+    Give a cancelled order's redemption back to both counters
+
+    Returns:
+        str: Code to pass to invalidate_coupon() after commit, or None
+    """
+    if not order.coupon_id:
+        return None
+
+    released = await db.execute(
+        update(CouponUsage)
+        .where(
+            CouponUsage.order_id == order.id,
+            CouponUsage.status.in_(["reserved", "committed"]),
+        )
+        .values(status="released")
+        .returning(CouponUsage.coupon_id, CouponUsage.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    code = None
+    for coupon_id, user_id in released.all():
+        await db.execute(
+            update(CouponUserUsage)
+            .where(
+                CouponUserUsage.coupon_id == coupon_id,
+                CouponUserUsage.user_id == user_id,
+                CouponUserUsage.used_count > 0,
+            )
+            .values(used_count=CouponUserUsage.used_count - 1)
+        )
+        code = await db.scalar(
+            update(Coupon)
+            .where(Coupon.id == coupon_id, Coupon.used_count > 0)
+            .values(used_count=Coupon.used_count - 1)
+            .returning(Coupon.code)
+            .execution_options(synchronize_session=False)
+        )
+    return code
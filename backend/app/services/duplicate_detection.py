@@ -0,0 +1,423 @@
+"""
+Duplicate Listing Detection
+
+Sellers re-post the same product under new titles. Every listing in status
+active or moderation gets a fingerprint (product_fingerprints):
+- pHash + dHash of each image (app.services.image_hashing)
+- simhash of the title (character trigrams, so small edits move few bits)
+
+Fingerprints are kept in BK-trees (one for images, one for titles) inside
+the worker process. A BK-tree only descends into children whose edge
+distance can still be within the search radius, so a lookup visits a small
+part of the tree instead of comparing against every listing. The index is
+synced incrementally from product_fingerprints by updated_at; entries of
+changed products are skipped by version and the tree is rebuilt once they
+outnumber the live ones. A fingerprint is recomputed only when its
+content_hash (title and image URLs) no longer matches the product, not on
+every products.updated_at bump (views, promotion, moderation).
+
+Near-duplicates found by index_product() are stored as pairs in
+product_duplicates. An image match needs both pHash and dHash within
+DUPLICATE_IMAGE_DISTANCE bits. A title-only match counts only for the same
+seller: different sellers legitimately list "iPhone 13 128GB". The admin
+report joins the pairs into clusters.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, delete, func, cast, or_, and_, Text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.models.moderation import ProductFingerprint, ProductDuplicate
+from app.models.product import Product
+from app.services.image_hashing import HASH_BITS, dhash, hamming, open_image, phash, to_signed, to_unsigned
+from app.services.image_moderation import load_images
+
+logger = logging.getLogger(__name__)
+
+INDEXED_STATUSES = ("active", "moderation")
+
+# Fingerprints written by transactions that committed out of order
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def simhash(text: str) -> int:
+    """64-bit simhash of a title over character trigrams"""
+    normalized = " ".join(re.findall(r"\w+", text.lower()))
+    features = Counter(normalized[i:i + 3] for i in range(max(len(normalized) - 2, 1)))
+    weights = [0] * HASH_BITS
+    for feature, count in features.items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit in range(HASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit in range(HASH_BITS) if weights[bit] > 0)
+
+
+class _Node:
+    __slots__ = ("key", "items", "children")
+
+    def __init__(self, key: int, item):
+        self.key = key
+        self.items = [item]
+        self.children: Dict[int, "_Node"] = {}
+
+
+class BKTree:
+    """Metric tree over 64-bit hashes with Hamming distance"""
+
+    def __init__(self):
+        self.root: Optional[_Node] = None
+        self.size = 0
+
+    def add(self, key: int, item):
+        self.size += 1
+        if self.root is None:
+            self.root = _Node(key, item)
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node.key)
+            if distance == 0:
+                node.items.append(item)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _Node(key, item)
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, object]]:
+        """(distance, item) for every item within `radius` bits of key"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node.key)
+            if distance <= radius:
+                found.extend((distance, item) for item in node.items)
+            # Triangle inequality: only these subtrees can hold matches
+            for edge, child in node.children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+@dataclass
+class Fingerprint:
+    product_id: UUID
+    image_hashes: List[Tuple[int, int]]  # Unsigned (phash, dhash) per image
+    title_simhash: int
+    version: datetime
+
+    @classmethod
+    def from_row(cls, row) -> "Fingerprint":
+        return cls(
+            product_id=row.product_id,
+            image_hashes=[
+                (to_unsigned(image_phash), to_unsigned(image_dhash))
+                for image_phash, image_dhash in zip(row.image_phashes or [], row.image_dhashes or [])
+            ],
+            title_simhash=to_unsigned(row.title_simhash),
+            version=row.updated_at,
+        )
+
+
+class FingerprintIndex:
+    """BK-trees of every indexed listing, per worker process"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.images = BKTree()
+        self.titles = BKTree()
+        self.versions: Dict[UUID, datetime] = {}
+        self.synced_at: Optional[datetime] = None
+        self.stale = 0
+
+    def add(self, fingerprint: Fingerprint):
+        current = self.versions.get(fingerprint.product_id)
+        if current == fingerprint.version:
+            return
+        if current is not None:
+            self.stale += 1
+        self.versions[fingerprint.product_id] = fingerprint.version
+        for image_phash, image_dhash in fingerprint.image_hashes:
+            self.images.add(image_phash, (fingerprint.product_id, fingerprint.version, image_dhash))
+        self.titles.add(fingerprint.title_simhash, (fingerprint.product_id, fingerprint.version))
+
+    def _live(self, product_id: UUID, version: datetime) -> bool:
+        return self.versions.get(product_id) == version
+
+    async def sync(self, db: AsyncSession):
+        """Load fingerprints written since the last sync (everything on first use)"""
+        if self.stale > len(self.versions):
+            self.reset()
+
+        query = select(
+            ProductFingerprint.product_id,
+            ProductFingerprint.image_phashes,
+            ProductFingerprint.image_dhashes,
+            ProductFingerprint.title_simhash,
+            ProductFingerprint.updated_at,
+        ).order_by(ProductFingerprint.updated_at)
+        if self.synced_at is not None:
+            query = query.where(ProductFingerprint.updated_at > self.synced_at - SYNC_OVERLAP)
+
+        result = await db.stream(query.execution_options(yield_per=5000))
+        async for row in result:
+            self.add(Fingerprint.from_row(row))
+            self.synced_at = max(self.synced_at or row.updated_at, row.updated_at)
+
+    def find(self, fingerprint: Fingerprint) -> Dict[UUID, Tuple[set, int]]:
+        """Candidate duplicates: product_id -> (match kinds, smallest distance)"""
+        matches: Dict[UUID, Tuple[set, int]] = {}
+
+        def note(product_id: UUID, kind: str, distance: int):
+            kinds, best = matches.get(product_id, (set(), distance))
+            kinds.add(kind)
+            matches[product_id] = (kinds, min(best, distance))
+
+        image_radius = settings.DUPLICATE_IMAGE_DISTANCE
+        for image_phash, image_dhash in fingerprint.image_hashes:
+            for distance, (product_id, version, other_dhash) in self.images.search(image_phash, image_radius):
+                if (
+                    product_id != fingerprint.product_id
+                    and self._live(product_id, version)
+                    and hamming(image_dhash, other_dhash) <= image_radius
+                ):
+                    note(product_id, "image", distance)
+
+        for distance, (product_id, version) in self.titles.search(
+            fingerprint.title_simhash, settings.DUPLICATE_TITLE_DISTANCE
+        ):
+            if product_id != fingerprint.product_id and self._live(product_id, version):
+                note(product_id, "title", distance)
+
+        return matches
+
+
+index = FingerprintIndex()
+
+
+async def compute_fingerprint(product: Product) -> Fingerprint:
+    """Hash the product's readable images and its title"""
+    urls = [url for url in (product.images or []) if isinstance(url, str)]
+    images = [image for image in await load_images(urls) if image.content is not None]
+
+    def hash_images():
+        hashes = []
+        for image in images:
+            try:
+                picture = open_image(image.content)
+                hashes.append((phash(picture), dhash(picture)))
+            except (OSError, ValueError):
+                continue
+        return hashes
+
+    return Fingerprint(
+        product_id=product.id,
+        image_hashes=await asyncio.to_thread(hash_images),
+        title_simhash=simhash(product.title or ""),
+        version=datetime.utcnow(),
+    )
+
+
+def content_hash():
+    """md5 of what a fingerprint is computed from; migration 022 uses the same expression"""
+    return func.md5(func.concat(Product.title, "\n", cast(Product.images, Text)))
+
+
+async def _save_fingerprint(db: AsyncSession, fingerprint: Fingerprint):
+    values = {
+        "image_phashes": [to_signed(image_phash) for image_phash, _ in fingerprint.image_hashes],
+        "image_dhashes": [to_signed(image_dhash) for _, image_dhash in fingerprint.image_hashes],
+        "title_simhash": to_signed(fingerprint.title_simhash),
+        "content_hash": select(content_hash()).where(Product.id == fingerprint.product_id).scalar_subquery(),
+        "updated_at": fingerprint.version,
+    }
+    stmt = insert(ProductFingerprint).values(product_id=fingerprint.product_id, **values)
+    await db.execute(stmt.on_conflict_do_update(index_elements=[ProductFingerprint.product_id], set_=values))
+
+
+async def _forget_pairs(db: AsyncSession, product_id: UUID):
+    await db.execute(
+        delete(ProductDuplicate).where(
+            or_(ProductDuplicate.product_id == product_id, ProductDuplicate.duplicate_id == product_id)
+        )
+    )
+
+
+async def index_product(db: AsyncSession, product_id: UUID) -> List[dict]:
+    """
+    Fingerprint a listing and record its near-duplicates
+
+    Listings that are no longer active or in moderation lose their pairs.
+    Does not commit.
+
+    Returns:
+        list: {duplicate_id, match, distance} found for the product
+    """
+    product = await db.get(Product, product_id)
+    await _forget_pairs(db, product_id)
+    if product is None or product.status not in INDEXED_STATUSES:
+        return []
+
+    fingerprint = await compute_fingerprint(product)
+    await _save_fingerprint(db, fingerprint)
+    await index.sync(db)
+    index.add(fingerprint)
+
+    candidates = index.find(fingerprint)
+    if not candidates:
+        return []
+
+    # The index also holds deleted or hidden listings: check them here
+    result = await db.execute(
+        select(Product.id, Product.seller_id)
+        .where(Product.id.in_(list(candidates)), Product.status.in_(INDEXED_STATUSES))
+    )
+    duplicates = []
+    for candidate_id, seller_id in result.all():
+        kinds, distance = candidates[candidate_id]
+        if "image" not in kinds and seller_id != product.seller_id:
+            continue
+        first, second = sorted((product.id, candidate_id))
+        duplicates.append({
+            "product_id": first,
+            "duplicate_id": second,
+            "match": "+".join(sorted(kinds)),
+            "distance": distance,
+            "detected_at": fingerprint.version,
+        })
+
+    if duplicates:
+        await db.execute(insert(ProductDuplicate).on_conflict_do_nothing(), duplicates)
+        logger.info(f"Product {product_id}: {len(duplicates)} near-duplicate listings")
+
+    return [
+        {
+            "duplicate_id": row["duplicate_id"] if row["product_id"] == product.id else row["product_id"],
+            "match": row["match"],
+            "distance": row["distance"],
+        }
+        for row in duplicates
+    ]
+
+
+async def index_pending(db: AsyncSession, batch_size: Optional[int] = None) -> int:
+    """
+    Index listings without an up-to-date fingerprint (new, or title or
+    images edited since)
+
+    Commits after every product. Returns how many were indexed.
+    """
+    batch_size = batch_size or settings.DUPLICATE_INDEX_BATCH_SIZE
+    result = await db.execute(
+        select(Product.id)
+        .outerjoin(ProductFingerprint, ProductFingerprint.product_id == Product.id)
+        .where(
+            Product.status.in_(INDEXED_STATUSES),
+            or_(
+                ProductFingerprint.product_id.is_(None),
+                ProductFingerprint.content_hash.is_distinct_from(content_hash()),
+            ),
+        )
+        .order_by(Product.updated_at)
+        .limit(batch_size)
+    )
+    product_ids = result.scalars().all()
+    for product_id in product_ids:
+        await index_product(db, product_id)
+        await db.commit()
+    return len(product_ids)
+
+
+async def duplicate_clusters(db: AsyncSession, limit: int = 50, min_size: int = 2) -> List[dict]:
+    """
+    Groups of listings connected by duplicate pairs, largest first
+
+    Only pairs where both listings are still active or in moderation count.
+    """
+    first, second = aliased(Product), aliased(Product)
+    result = await db.execute(
+        select(ProductDuplicate.product_id, ProductDuplicate.duplicate_id, ProductDuplicate.match, ProductDuplicate.distance)
+        .join(first, and_(first.id == ProductDuplicate.product_id, first.status.in_(INDEXED_STATUSES)))
+        .join(second, and_(second.id == ProductDuplicate.duplicate_id, second.status.in_(INDEXED_STATUSES)))
+    )
+    pairs = result.all()
+
+    # Union-find over the pairs
+    parent: Dict[UUID, UUID] = {}
+
+    def root(product_id: UUID) -> UUID:
+        parent.setdefault(product_id, product_id)
+        while parent[product_id] != product_id:
+            parent[product_id] = parent[parent[product_id]]
+            product_id = parent[product_id]
+        return product_id
+
+    for product_id, duplicate_id, _, _ in pairs:
+        parent[root(product_id)] = root(duplicate_id)
+
+    members: Dict[UUID, List[UUID]] = {}
+    for product_id in list(parent):
+        members.setdefault(root(product_id), []).append(product_id)
+    edges: Dict[UUID, List] = {}
+    for pair in pairs:
+        edges.setdefault(root(pair.product_id), []).append(pair)
+
+    clusters = sorted(
+        (ids for ids in members.values() if len(ids) >= min_size),
+        key=len,
+        reverse=True,
+    )[:limit]
+    if not clusters:
+        return []
+
+    product_ids = [product_id for ids in clusters for product_id in ids]
+    result = await db.execute(
+        select(Product.id, Product.seller_id, Product.title, Product.status, Product.images, Product.created_at)
+        .where(Product.id.in_(product_ids))
+    )
+    products = {row.id: row for row in result.all()}
+
+    report = []
+    for ids in clusters:
+        listings = sorted((products[product_id] for product_id in ids if product_id in products), key=lambda p: p.created_at)
+        cluster_pairs = edges[root(ids[0])]
+        report.append({
+            "size": len(listings),
+            "sellers": len({listing.seller_id for listing in listings}),
+            "products": [
+                {
+                    "id": str(listing.id),
+                    "seller_id": str(listing.seller_id),
+                    "title": listing.title,
+                    "status": listing.status,
+                    "image": (listing.images or [None])[0],
+                    "created_at": listing.created_at,
+                }
+                for listing in listings
+            ],
+            "pairs": [
+                {
+                    "product_id": str(pair.product_id),
+                    "duplicate_id": str(pair.duplicate_id),
+                    "match": pair.match,
+                    "distance": pair.distance,
+                }
+                for pair in cluster_pairs
+            ],
+        })
+    return report
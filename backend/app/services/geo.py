@@ -0,0 +1,131 @@
+"""
+Geo Search ("near me")
+
+Sellers store their point in seller_profiles.latitude / longitude (copied
+from the market when the seller only picked a market). Products are found
+through their seller's point.
+
+A radius query is two predicates:
+1. Bounding box: latitude/longitude BETWEEN the corners of a box around the
+   circle. This is a plain range on the (latitude, longitude) B-tree index,
+   so only sellers in the box are read - no extension needed.
+2. Exact great-circle distance (haversine) <= radius on those rows; the
+   same expression is used for ORDER BY distance.
+"""
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Float, and_, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.location import Market
+from app.models.user import SellerProfile
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class InvalidLocationError(Exception):
+    """Raised when a near= value is not a valid "lat,lon" pair"""
+
+    def __init__(self, detail: str):
+        self.detail = detail
+        super().__init__(detail)
+
+
+@dataclass(frozen=True)
+class GeoPoint:
+    lat: float
+    lon: float
+
+
+def parse_near(value: str) -> GeoPoint:
+    """Parse "lat,lon" (raises InvalidLocationError)"""
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+    except ValueError:
+        raise InvalidLocationError("near must be \"lat,lon\", e.g. near=42.8746,74.5698")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidLocationError("near is out of range: lat -90..90, lon -180..180")
+    return GeoPoint(lat, lon)
+
+
+def bounding_box(point: GeoPoint, radius_km: float) -> Tuple[float, float, Optional[float], Optional[float]]:
+    """
+    (min_lat, max_lat, min_lon, max_lon) enclosing the circle
+
+    min_lon/max_lon are None when the box reaches a pole or crosses the
+    antimeridian; only the latitude band is usable then.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = point.lat - delta_lat, point.lat + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+
+    delta_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(point.lat))))
+    min_lon, max_lon = point.lon - delta_lon, point.lon + delta_lon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def haversine_km(a: GeoPoint, b: GeoPoint) -> float:
+    lat1, lat2 = math.radians(a.lat), math.radians(b.lat)
+    d_lat, d_lon = lat2 - lat1, math.radians(b.lon - a.lon)
+    h = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def distance_km(lat_column, lon_column, point: GeoPoint):
+    """SQL haversine distance from point to (lat_column, lon_column), in km"""
+    lat = func.radians(cast(lat_column, Float))
+    lon = func.radians(cast(lon_column, Float))
+    origin_lat, origin_lon = math.radians(point.lat), math.radians(point.lon)
+    h = (
+        func.power(func.sin((lat - origin_lat) / 2), 2)
+        + math.cos(origin_lat) * func.cos(lat) * func.power(func.sin((lon - origin_lon) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(h, 1.0)))
+
+
+def within_radius(lat_column, lon_column, point: GeoPoint, radius_km: float) -> List:
+    """WHERE clauses: index-friendly bounding box first, then the exact distance"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(point, radius_km)
+    clauses = [lat_column.between(min_lat, max_lat)]
+    if min_lon is not None:
+        clauses.append(lon_column.between(min_lon, max_lon))
+    clauses.append(distance_km(lat_column, lon_column, point) <= radius_km)
+    return clauses
+
+
+def seller_distance(point: GeoPoint):
+    return distance_km(SellerProfile.latitude, SellerProfile.longitude, point)
+
+
+def seller_within(point: GeoPoint, radius_km: float):
+    return and_(*within_radius(SellerProfile.latitude, SellerProfile.longitude, point, radius_km))
+
+
+def seller_point(profile: Optional[SellerProfile]) -> Optional[GeoPoint]:
+    if profile is None or profile.latitude is None or profile.longitude is None:
+        return None
+    return GeoPoint(float(profile.latitude), float(profile.longitude))
+
+
+def distance_from(point: Optional[GeoPoint], profile: Optional[SellerProfile]) -> Optional[float]:
+    """Distance for the response, km rounded to 10 m (None without both points)"""
+    other = seller_point(profile)
+    if point is None or other is None:
+        return None
+    return round(haversine_km(point, other), 2)
+
+
+async def fill_location_from_market(db: AsyncSession, profile: SellerProfile):
+    """Give a seller without its own point the coordinates of its market"""
+    if profile.market_id is None or (profile.latitude is not None and profile.longitude is not None):
+        return
+    row = (await db.execute(
+        select(Market.latitude, Market.longitude).where(Market.id == profile.market_id)
+    )).one_or_none()
+    if row and row.latitude is not None and row.longitude is not None:
+        profile.latitude, profile.longitude = row.latitude, row.longitude
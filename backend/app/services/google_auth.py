@@ -1,8 +1,6 @@
 """
 Google OAuth Service
 """
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from app.core.config import settings
 from typing import Optional, Dict
 
@@ -21,6 +19,10 @@ class GoogleAuthService:
         Returns:
             Dict with user info (email, name, google_id) or None if invalid
         """
+        # google-auth pulls in requests/urllib3 - import only when login is used
+        from google.oauth2 import id_token
+        from google.auth.transport import requests
+
         try:
             # Verify the token
             idinfo = id_token.verify_oauth2_token(
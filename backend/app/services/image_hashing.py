@@ -0,0 +1,148 @@
+"""
+Perceptual Image Hashing
+
+64-bit hashes that stay close for visually similar images (resized,
+recompressed, slightly cropped or recoloured copies):
+- dHash: sign of horizontal brightness gradients on a 9x8 thumbnail
+- pHash: signs of the low DCT frequencies of a 32x32 thumbnail
+
+Similarity is the Hamming distance between two hashes. Hashes are stored in
+BIGINT columns, so they are converted to signed 64-bit on the way in.
+
+Images are read from UPLOAD_DIR when the URL points at our /uploads/.
+Other URLs are seller input, so they are downloaded only from the
+IMAGE_REMOTE_HOSTS allowlist, never from private, loopback or link-local
+addresses, without following redirects, and streamed with a MAX_FILE_SIZE
+cut-off.
+"""
+import asyncio
+import io
+import ipaddress
+import os
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+HASH_BITS = 64
+
+_DCT_SIZE = 32
+# DCT-II basis, so a 2D DCT is two matrix products
+_DCT = np.array([
+    [np.cos(np.pi * (2 * x + 1) * u / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+    for u in range(_DCT_SIZE)
+])
+
+
+def _grayscale(image: Image.Image, size) -> np.ndarray:
+    return np.asarray(image.convert("L").resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image: Image.Image) -> int:
+    pixels = _grayscale(image, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image: Image.Image) -> int:
+    pixels = _grayscale(image, (_DCT_SIZE, _DCT_SIZE))
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8]
+    # The DC term is overall brightness, leave it out of the median
+    median = np.median(low.flatten()[1:])
+    return _bits_to_int(low > median)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << HASH_BITS) - 1)).count("1")
+
+
+def to_signed(value: int) -> int:
+    """Unsigned 64-bit hash -> BIGINT"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    """BIGINT -> unsigned 64-bit hash"""
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def open_image(content: bytes) -> Image.Image:
+    """Decode image bytes (raises OSError if unreadable)"""
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except Image.DecompressionBombError as e:
+        raise OSError(str(e))
+    return image
+
+
+def _local_path(url: str) -> Optional[str]:
+    marker = "/uploads/"
+    if marker not in url:
+        return None
+    filename = os.path.basename(url.split(marker, 1)[1].split("?", 1)[0])
+    return os.path.join(settings.UPLOAD_DIR, filename)
+
+
+async def _check_remote(url: str):
+    """Raise OSError unless url is http(s) on an allowed host with public addresses only"""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or host not in {h.lower() for h in settings.IMAGE_REMOTE_HOSTS}:
+        raise OSError(f"Image host not allowed: {url}")
+
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80))
+    except OSError as e:
+        raise OSError(f"Image host not resolved: {url} ({e})")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0])
+        if not address.is_global:
+            raise OSError(f"Image host resolves to a non-public address: {url}")
+
+
+async def read_image_bytes(url: str, client: Optional[httpx.AsyncClient] = None) -> bytes:
+    """
+    Bytes of a product image URL
+
+    Raises OSError / httpx.HTTPError if the image can't be read, isn't ours
+    or on an allowed host, or is larger than MAX_FILE_SIZE.
+    """
+    path = _local_path(url)
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            content = f.read(settings.MAX_FILE_SIZE + 1)
+        if len(content) > settings.MAX_FILE_SIZE:
+            raise OSError(f"Image too large: {url}")
+        return content
+
+    await _check_remote(url)
+    if client is None:
+        async with httpx.AsyncClient(timeout=10) as own_client:
+            return await _download(url, own_client)
+    return await _download(url, client)
+
+
+async def _download(url: str, client: httpx.AsyncClient) -> bytes:
+    """Stream the body, giving up as soon as it passes MAX_FILE_SIZE"""
+    async with client.stream("GET", url, follow_redirects=False) as response:
+        response.raise_for_status()  # Redirects included: they could point anywhere
+        length = response.headers.get("content-length", "")
+        if length.isdigit() and int(length) > settings.MAX_FILE_SIZE:
+            raise OSError(f"Image too large: {url}")
+        content = bytearray()
+        async for chunk in response.aiter_bytes():
+            content += chunk
+            if len(content) > settings.MAX_FILE_SIZE:
+                raise OSError(f"Image too large: {url}")
+    return bytes(content)
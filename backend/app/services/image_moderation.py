@@ -0,0 +1,368 @@
+"""
+Automated Image Moderation
+
+Runs the images of new products (status "moderation") through a classifier
+before a human sees them:
+1. moderate_pending() claims a batch of unchecked products with
+   FOR UPDATE SKIP LOCKED (products leased to a moderator are left alone)
+   and leases them for IMAGE_MODERATION_LEASE_MINUTES, without a
+   moderator, and commits. The images are downloaded concurrently and
+   classified in one classifier call with no row locks held; moderators
+   and other workers skip the leased products meanwhile.
+2. The per-image scores are written to moderation_result["classifier"]
+   of the products whose lease is still ours, and the lease is released.
+3. Confident products are decided through app.services.moderation_queue,
+   which also notifies the sellers:
+   - every image below IMAGE_MODERATION_APPROVE_BELOW: approved
+     (if IMAGE_MODERATION_AUTO_APPROVE and the classifier can_approve)
+   - any image above IMAGE_MODERATION_REJECT_ABOVE: rejected
+   Everything else (uncertain scores, unreadable images, no images) stays
+   in the human queue.
+
+Classifiers implement ImageClassifier and are picked by
+IMAGE_MODERATION_CLASSIFIER:
+- "banned_hash": local stand-in; perceptual hash match against
+  banned_images. It only recognizes known images, so it can reject or
+  flag but never approves
+- "google_vision": Cloud Vision SafeSearch (google-cloud-vision)
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from uuid import UUID
+
+import httpx
+from sqlalchemy import select, update, func, or_, not_, literal, literal_column, bindparam
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.moderation import BannedImage
+from app.models.product import Product
+from app.services import moderation_queue
+from app.services.image_hashing import dhash, hamming, open_image, phash, read_image_bytes, to_signed, to_unsigned
+from app.services.realtime import publish
+from app.services.storefront import invalidate as invalidate_storefront
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ImageInput:
+    url: str
+    content: Optional[bytes] = None  # None if the image couldn't be read
+    error: Optional[str] = None
+
+
+@dataclass
+class ImageVerdict:
+    """unsafe_score: 0 = certainly fine, 1 = certainly not allowed; None = couldn't check"""
+    url: str
+    unsafe_score: Optional[float]
+    labels: Dict[str, object] = field(default_factory=dict)
+
+
+class ImageClassifier:
+    """Scores a batch of images; subclasses override classify()"""
+    name = "base"
+    can_approve = True  # False: low scores go to a moderator instead of approval
+
+    async def prepare(self, db: AsyncSession):
+        """Load whatever the classifier needs from the database (once per batch)"""
+
+    async def classify(self, images: List[ImageInput]) -> List[ImageVerdict]:
+        raise NotImplementedError
+
+
+class BannedHashClassifier(ImageClassifier):
+    """
+    Local stand-in: pHash distance to the nearest banned image
+
+    Within IMAGE_BANNED_HASH_DISTANCE bits it is a copy of a banned image
+    (score 1.0); up to twice that it is suspicious (0.5); further away it
+    scores 0.0. A 0.0 only means "not a known banned image", so the product
+    still goes to a moderator.
+    """
+    name = "banned_hash"
+    can_approve = False
+
+    def __init__(self):
+        self.banned: List[tuple] = []
+
+    async def prepare(self, db: AsyncSession):
+        result = await db.execute(select(BannedImage.id, BannedImage.phash, BannedImage.dhash))
+        self.banned = [
+            (banned_id, to_unsigned(banned_phash), to_unsigned(banned_dhash))
+            for banned_id, banned_phash, banned_dhash in result.all()
+        ]
+
+    def _score(self, image: ImageInput) -> ImageVerdict:
+        picture = open_image(image.content)
+        image_phash, image_dhash = phash(picture), dhash(picture)
+        labels = {"phash": f"{image_phash:016x}", "dhash": f"{image_dhash:016x}"}
+
+        nearest = min(
+            ((hamming(image_phash, banned_phash), hamming(image_dhash, banned_dhash), banned_id)
+             for banned_id, banned_phash, banned_dhash in self.banned),
+            default=None,
+        )
+        threshold = settings.IMAGE_BANNED_HASH_DISTANCE
+        if nearest is None or nearest[0] > 2 * threshold:
+            return ImageVerdict(image.url, 0.0, labels)
+
+        phash_distance, dhash_distance, banned_id = nearest
+        labels.update(banned_image_id=str(banned_id), distance=phash_distance)
+        # Both hashes must agree before calling it a copy
+        if phash_distance <= threshold and dhash_distance <= threshold:
+            return ImageVerdict(image.url, 1.0, labels)
+        return ImageVerdict(image.url, 0.5, labels)
+
+    async def classify(self, images: List[ImageInput]) -> List[ImageVerdict]:
+        def run():
+            verdicts = []
+            for image in images:
+                try:
+                    verdicts.append(self._score(image))
+                except (OSError, ValueError) as e:
+                    verdicts.append(ImageVerdict(image.url, None, {"error": f"Unreadable image: {e}"}))
+            return verdicts
+
+        # Hashing is CPU work: keep it off the event loop
+        return await asyncio.to_thread(run)
+
+
+class GoogleVisionClassifier(ImageClassifier):
+    """Cloud Vision SafeSearch: the worst of adult / violence / racy likelihoods"""
+    name = "google_vision"
+
+    # Likelihood enum: UNKNOWN, VERY_UNLIKELY, UNLIKELY, POSSIBLE, LIKELY, VERY_LIKELY
+    LIKELIHOOD_SCORES = [0.5, 0.0, 0.1, 0.5, 0.9, 1.0]
+    BATCH_LIMIT = 16  # Images per batch_annotate_images request
+
+    def __init__(self):
+        from google.cloud import vision  # Optional dependency, only needed here
+
+        self.vision = vision
+        self.client = vision.ImageAnnotatorClient()
+
+    def _annotate(self, images: List[ImageInput]):
+        vision = self.vision
+        feature = vision.Feature(type_=vision.Feature.Type.SAFE_SEARCH_DETECTION)
+        response = self.client.batch_annotate_images(requests=[
+            vision.AnnotateImageRequest(image=vision.Image(content=image.content), features=[feature])
+            for image in images
+        ])
+        return response.responses
+
+    async def classify(self, images: List[ImageInput]) -> List[ImageVerdict]:
+        verdicts = []
+        for start in range(0, len(images), self.BATCH_LIMIT):
+            chunk = images[start:start + self.BATCH_LIMIT]
+            responses = await asyncio.to_thread(self._annotate, chunk)
+            for image, response in zip(chunk, responses):
+                if response.error.message:
+                    verdicts.append(ImageVerdict(image.url, None, {"error": response.error.message}))
+                    continue
+                safe = response.safe_search_annotation
+                labels = {
+                    "adult": self.LIKELIHOOD_SCORES[safe.adult],
+                    "violence": self.LIKELIHOOD_SCORES[safe.violence],
+                    "racy": self.LIKELIHOOD_SCORES[safe.racy],
+                }
+                verdicts.append(ImageVerdict(image.url, max(labels.values()), labels))
+        return verdicts
+
+
+CLASSIFIERS = {
+    BannedHashClassifier.name: BannedHashClassifier,
+    GoogleVisionClassifier.name: GoogleVisionClassifier,
+}
+
+
+def get_classifier(name: Optional[str] = None) -> ImageClassifier:
+    name = name or settings.IMAGE_MODERATION_CLASSIFIER
+    if name not in CLASSIFIERS:
+        raise ValueError(f"Unknown image classifier: {name}. Supported: {', '.join(CLASSIFIERS)}")
+    return CLASSIFIERS[name]()
+
+
+async def load_images(urls: List[str]) -> List[ImageInput]:
+    """Read images concurrently; failures are kept as ImageInput.error"""
+    async with httpx.AsyncClient(timeout=10) as client:
+        async def load(url: str) -> ImageInput:
+            try:
+                return ImageInput(url, await read_image_bytes(url, client))
+            except (OSError, httpx.HTTPError) as e:
+                return ImageInput(url, error=str(e) or type(e).__name__)
+
+        return await asyncio.gather(*[load(url) for url in urls])
+
+
+async def ban_image(db: AsyncSession, image_url: str, reason: Optional[str] = None, created_by: Optional[UUID] = None) -> BannedImage:
+    """
+    Add an image to banned_images by its perceptual hashes
+
+    Raises ValueError if the image can't be read. Does not commit.
+    """
+    try:
+        content = await read_image_bytes(image_url)
+        picture = await asyncio.to_thread(open_image, content)
+        image_phash, image_dhash = await asyncio.to_thread(lambda: (phash(picture), dhash(picture)))
+    except (OSError, ValueError, httpx.HTTPError) as e:
+        raise ValueError(f"Could not read image: {e}")
+
+    banned = BannedImage(
+        phash=to_signed(image_phash),
+        dhash=to_signed(image_dhash),
+        image_url=image_url,
+        reason=reason,
+        created_by=created_by,
+    )
+    db.add(banned)
+    await db.flush()
+    return banned
+
+
+def _product_decision(verdicts: List[ImageVerdict], can_approve: bool = True) -> str:
+    """approve, reject or review for one product"""
+    if not verdicts or any(verdict.unsafe_score is None for verdict in verdicts):
+        return "review"
+    worst = max(verdict.unsafe_score for verdict in verdicts)
+    if worst >= settings.IMAGE_MODERATION_REJECT_ABOVE:
+        return "reject"
+    if worst <= settings.IMAGE_MODERATION_APPROVE_BELOW and can_approve and settings.IMAGE_MODERATION_AUTO_APPROVE:
+        return "approve"
+    return "review"
+
+
+async def moderate_pending(db: AsyncSession, batch_size: Optional[int] = None, classifier: Optional[ImageClassifier] = None) -> dict:
+    """
+    Classify one batch of unchecked products and decide the confident ones
+
+    Commits. Returns statistics; run again until "checked" is 0.
+    """
+    batch_size = batch_size or settings.IMAGE_MODERATION_BATCH_SIZE
+    classifier = classifier or get_classifier()
+    now = datetime.utcnow()
+    lease_until = now + timedelta(minutes=settings.IMAGE_MODERATION_LEASE_MINUTES)
+
+    batch = (
+        select(Product.id)
+        .where(
+            Product.status == "moderation",
+            or_(Product.moderation_lease_until.is_(None), Product.moderation_lease_until < now),
+            # Same constant expression as the partial index idx_products_moderation_unchecked
+            not_(
+                func.coalesce(Product.moderation_result, literal_column("'{}'::jsonb", JSONB))
+                .has_key(literal_column("'classifier'"))
+            ),
+        )
+        .order_by(Product.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .cte("batch")
+    )
+    result = await db.execute(
+        update(Product)
+        .where(Product.id == batch.c.id)
+        .values(
+            moderation_claimed_by=None,
+            moderation_lease_until=lease_until,
+            updated_at=Product.updated_at,  # A lease is not an edit
+        )
+        .returning(Product.id, Product.images)
+        .execution_options(synchronize_session=False)
+    )
+    products = result.all()
+    if products:
+        await classifier.prepare(db)
+    # Downloads and classification run without holding the row locks
+    await db.commit()
+    if not products:
+        return {"checked": 0, "approved": 0, "rejected": 0, "review": 0}
+
+    urls = sorted({url for _, images in products for url in (images or []) if isinstance(url, str)})
+    inputs = await load_images(urls)
+    readable = [image for image in inputs if image.content is not None]
+    verdicts = {verdict.url: verdict for verdict in await classifier.classify(readable)}
+    for image in inputs:
+        if image.content is None:
+            verdicts[image.url] = ImageVerdict(image.url, None, {"error": image.error})
+
+    # Release the lease; products whose lease ran out meanwhile (and may be
+    # claimed by a moderator now) or that were edited away are skipped
+    result = await db.execute(
+        update(Product)
+        .where(
+            Product.id.in_([product_id for product_id, _ in products]),
+            Product.status == "moderation",
+            Product.moderation_claimed_by.is_(None),
+            Product.moderation_lease_until == lease_until,
+        )
+        .values(moderation_lease_until=None, updated_at=Product.updated_at)
+        .returning(Product.id)
+        .execution_options(synchronize_session=False)
+    )
+    held = set(result.scalars().all())
+
+    decisions = {"approve": [], "reject": [], "review": []}
+    rows = []
+    for product_id, images in products:
+        if product_id not in held:
+            continue
+        product_verdicts = [verdicts[url] for url in (images or []) if url in verdicts]
+        decision = _product_decision(product_verdicts, classifier.can_approve)
+        decisions[decision].append(product_id)
+        scores = [verdict.unsafe_score for verdict in product_verdicts if verdict.unsafe_score is not None]
+        rows.append({
+            "product_id": product_id,
+            "result": {
+                "classifier": {
+                    "name": classifier.name,
+                    "decision": decision,
+                    "unsafe_score": max(scores) if scores else None,
+                    "images": [asdict(verdict) for verdict in product_verdicts],
+                    "checked_at": now.isoformat(),
+                }
+            },
+        })
+
+    # One executemany UPDATE for the whole batch, merged into earlier results
+    products_table = Product.__table__
+    if rows:
+        await db.execute(
+            update(products_table)
+            .where(products_table.c.id == bindparam("product_id"))
+            .values(
+                moderation_result=func.coalesce(products_table.c.moderation_result, literal({}, JSONB))
+                .op("||")(bindparam("result", type_=JSONB)),
+                updated_at=products_table.c.updated_at,  # A classifier check is not an edit
+            ),
+            rows,
+        )
+    decided = await moderation_queue.decide(db, None, decisions["approve"], "active", source="auto")
+    decided += await moderation_queue.decide(
+        db, None, decisions["reject"], "rejected",
+        reason="Изображение нарушает правила площадки", source="auto",
+    )
+    await db.commit()
+    await invalidate_storefront(product["seller_id"] for product in decided)
+
+    for product in decided:
+        await publish(product["seller_id"], "moderation", "product_moderated", {
+            "product_id": product["id"],
+            "title": product["title"],
+            "status": product["status"],
+        })
+
+    stats = {
+        "checked": len(rows),
+        "approved": len(decisions["approve"]),
+        "rejected": len(decisions["reject"]),
+        "review": len(decisions["review"]),
+        "images": len(urls),
+    }
+    logger.info(f"Image moderation ({classifier.name}): {stats}")
+    return stats
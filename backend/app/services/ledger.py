@@ -0,0 +1,312 @@
+"""
+Wallet Ledger Service
+
+Every money movement is written to the transactions table as signed
+entries (balance_delta), and the matching wallet balances change in the
+same transaction:
+1. Entries are inserted first with INSERT ... ON CONFLICT DO NOTHING on
+   idempotency_key. If the key was already used, nothing is
+   inserted and the original entries are returned. A retried request
+   can't move money twice.
+2. Balances change with one conditional UPDATE ... RETURNING. Wallet rows
+   are locked in user_id order and a balance can't go below zero, so
+   concurrent movements neither lose updates nor overdraw.
+
+Balances are read without locks. wallets holds the live balance. For past
+balances, wallet_balance_snapshots keeps periodic checkpoints built from
+the ledger, so a query only sums the entries after the nearest checkpoint.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import status
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.wallet import Wallet, Transaction, WalletBalanceSnapshot
+
+logger = logging.getLogger(__name__)
+
+BALANCE_TYPES = ("main", "referral")
+
+# Lock wallets in a deterministic order, then apply the deltas only where no
+# debit would take a balance below zero (same pattern as stock reservation).
+# Credits always apply, even to a balance that is already negative.
+APPLY_BALANCE_DELTAS_SQL = text(
+    """
+    WITH deltas AS (
+        SELECT * FROM unnest(
+            CAST(:user_ids AS uuid[]),
+            CAST(:main_deltas AS numeric[]),
+            CAST(:referral_deltas AS numeric[])
+        ) AS d(user_id, main_delta, referral_delta)
+    ),
+    locked AS (
+        SELECT w.user_id FROM wallets w
+        JOIN deltas ON deltas.user_id = w.user_id
+        ORDER BY w.user_id
+        FOR UPDATE OF w
+    )
+    UPDATE wallets w
+    SET main_balance = w.main_balance + deltas.main_delta,
+        referral_balance = w.referral_balance + deltas.referral_delta,
+        updated_at = NOW()
+    FROM deltas, locked
+    WHERE w.user_id = deltas.user_id
+      AND locked.user_id = w.user_id
+      AND (deltas.main_delta >= 0 OR w.main_balance + deltas.main_delta >= 0)
+      AND (deltas.referral_delta >= 0 OR w.referral_balance + deltas.referral_delta >= 0)
+    RETURNING w.user_id, w.main_balance, w.referral_balance
+    """
+)
+
+# Checkpoint = previous checkpoint + ledger entries since it. Only users with
+# new entries get a row.
+BUILD_SNAPSHOTS_SQL = text(
+    """
+    INSERT INTO wallet_balance_snapshots (user_id, taken_at, main_balance, referral_balance)
+    SELECT
+        t.user_id,
+        :as_of,
+        COALESCE(prev.main_balance, 0)
+            + COALESCE(SUM(t.balance_delta) FILTER (WHERE t.balance_type = 'main'), 0),
+        COALESCE(prev.referral_balance, 0)
+            + COALESCE(SUM(t.balance_delta) FILTER (WHERE t.balance_type = 'referral'), 0)
+    FROM transactions t
+    LEFT JOIN LATERAL (
+        SELECT s.main_balance, s.referral_balance
+        FROM wallet_balance_snapshots s
+        WHERE s.user_id = t.user_id
+        ORDER BY s.taken_at DESC
+        LIMIT 1
+    ) prev ON TRUE
+    WHERE t.balance_delta IS NOT NULL
+      AND t.created_at > :since
+      AND t.created_at <= :as_of
+    GROUP BY t.user_id, prev.main_balance, prev.referral_balance
+    ON CONFLICT (user_id, taken_at) DO NOTHING
+    """
+)
+
+
+class InsufficientFundsError(Exception):
+    """A movement would take a balance below zero"""
+
+    def __init__(self, detail: str = "Insufficient balance", status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class LedgerEntry:
+    """One signed change of one balance"""
+    user_id: UUID
+    balance_type: str  # main, referral
+    delta: Decimal  # > 0 credit, < 0 debit
+    type: str
+    description: Optional[str] = None
+    reference_id: Optional[UUID] = None
+    status: str = "completed"
+    id: UUID = field(default_factory=uuid.uuid4)
+
+
+@dataclass
+class Posting:
+    """Result of post_entries"""
+    transaction_ids: List[UUID]
+    balances: Dict[UUID, Tuple[Decimal, Decimal]]  # user_id -> (main, referral); empty on replay
+    replayed: bool = False
+
+
+def make_idempotency_key(operation: str, scope, client_key: Optional[str]) -> Optional[str]:
+    """Global ledger key for a client-supplied Idempotency-Key (None if not sent)"""
+    if not client_key:
+        return None
+    return f"{operation}:{scope}:{client_key.strip()[:100]}"
+
+
+def entry_row(entry: LedgerEntry, idempotency_key: Optional[str], created_at: datetime) -> dict:
+    """transactions row for an entry (amount stays unsigned for the API)"""
+    if entry.balance_type not in BALANCE_TYPES:
+        raise ValueError(f"Unknown balance type: {entry.balance_type}")
+    return {
+        "id": entry.id,
+        "user_id": entry.user_id,
+        "type": entry.type,
+        "amount": abs(entry.delta),
+        "balance_delta": entry.delta,
+        "balance_type": entry.balance_type,
+        "description": entry.description,
+        "reference_id": entry.reference_id,
+        "status": entry.status,
+        "idempotency_key": idempotency_key,
+        "created_at": created_at,
+    }
+
+
+async def ensure_wallets(db: AsyncSession, user_ids):
+    """Create zero-balance wallets for users that don't have one yet"""
+    await db.execute(
+        insert(Wallet)
+        .values([
+            {"id": uuid.uuid4(), "user_id": user_id, "main_balance": 0, "referral_balance": 0}
+            for user_id in sorted(set(user_ids))
+        ])
+        .on_conflict_do_nothing(index_elements=[Wallet.user_id])
+    )
+
+
+async def apply_balance_deltas(
+    db: AsyncSession,
+    main_deltas: Dict[UUID, Decimal],
+    referral_deltas: Dict[UUID, Decimal],
+) -> Dict[UUID, Tuple[Decimal, Decimal]]:
+    """
+    Change several wallets in one statement
+
+    Raises InsufficientFundsError if a debit would take any wallet below
+    zero (credits always apply); the caller's transaction must then be
+    rolled back.
+
+    Returns:
+        dict: user_id -> (main_balance, referral_balance) after the change
+    """
+    user_ids = sorted(set(main_deltas) | set(referral_deltas))
+    if not user_ids:
+        return {}
+
+    result = await db.execute(
+        APPLY_BALANCE_DELTAS_SQL,
+        {
+            "user_ids": user_ids,
+            "main_deltas": [main_deltas.get(user_id, Decimal(0)) for user_id in user_ids],
+            "referral_deltas": [referral_deltas.get(user_id, Decimal(0)) for user_id in user_ids],
+        }
+    )
+    balances = {user_id: (main, referral) for user_id, main, referral in result.all()}
+
+    if len(balances) < len(user_ids):
+        raise InsufficientFundsError()
+    return balances
+
+
+async def post_entries(
+    db: AsyncSession,
+    entries: List[LedgerEntry],
+    idempotency_key: Optional[str] = None,
+) -> Posting:
+    """
+    Record entries and apply them to the wallets
+
+    Keys are global - build them with make_idempotency_key(). Entry i is stored
+    with key "{idempotency_key}:{i}". If the key was already
+    used, the earlier posting is returned with replayed=True and no balance
+    changes. Does not commit.
+    """
+    now = datetime.utcnow()
+    rows = [
+        entry_row(entry, f"{idempotency_key}:{i}" if idempotency_key else None, now)
+        for i, entry in enumerate(entries)
+    ]
+
+    if idempotency_key:
+        inserted = await db.execute(
+            insert(Transaction)
+            .values(rows)
+            .on_conflict_do_nothing(
+                index_elements=[Transaction.idempotency_key],
+                index_where=Transaction.idempotency_key.isnot(None),
+            )
+            .returning(Transaction.id)
+        )
+        if not inserted.all():
+            return await _replay(db, entries, idempotency_key)
+    else:
+        await db.execute(insert(Transaction).values(rows))
+
+    main_deltas: Dict[UUID, Decimal] = defaultdict(Decimal)
+    referral_deltas: Dict[UUID, Decimal] = defaultdict(Decimal)
+    for entry in entries:
+        deltas = main_deltas if entry.balance_type == "main" else referral_deltas
+        deltas[entry.user_id] += entry.delta
+
+    await ensure_wallets(db, [entry.user_id for entry in entries])
+    balances = await apply_balance_deltas(db, main_deltas, referral_deltas)
+
+    return Posting(transaction_ids=[entry.id for entry in entries], balances=balances)
+
+
+async def _replay(db: AsyncSession, entries: List[LedgerEntry], idempotency_key: str) -> Posting:
+    keys = [f"{idempotency_key}:{i}" for i in range(len(entries))]
+    result = await db.execute(
+        select(Transaction.id, Transaction.idempotency_key)
+        .where(Transaction.idempotency_key.in_(keys))
+    )
+    ids_by_key = {key: transaction_id for transaction_id, key in result.all()}
+    logger.info(f"Replayed ledger posting {idempotency_key}")
+    return Posting(
+        transaction_ids=[ids_by_key[key] for key in keys if key in ids_by_key],
+        balances={},
+        replayed=True,
+    )
+
+
+async def get_balance_at(db: AsyncSession, user_id: UUID, at: datetime) -> Tuple[Decimal, Decimal]:
+    """(main, referral) balance at a past moment: nearest checkpoint + later entries"""
+    snapshot_result = await db.execute(
+        select(WalletBalanceSnapshot)
+        .where(WalletBalanceSnapshot.user_id == user_id, WalletBalanceSnapshot.taken_at <= at)
+        .order_by(WalletBalanceSnapshot.taken_at.desc())
+        .limit(1)
+    )
+    snapshot = snapshot_result.scalar_one_or_none()
+
+    query = (
+        select(Transaction.balance_type, func.sum(Transaction.balance_delta))
+        .where(
+            Transaction.user_id == user_id,
+            Transaction.balance_delta.isnot(None),
+            Transaction.created_at <= at,
+        )
+        .group_by(Transaction.balance_type)
+    )
+    if snapshot:
+        query = query.where(Transaction.created_at > snapshot.taken_at)
+    sums = dict((await db.execute(query)).all())
+
+    main = (snapshot.main_balance if snapshot else Decimal(0)) + (sums.get("main") or Decimal(0))
+    referral = (snapshot.referral_balance if snapshot else Decimal(0)) + (sums.get("referral") or Decimal(0))
+    return main, referral
+
+
+async def build_balance_snapshots(db: AsyncSession) -> dict:
+    """
+    Add a checkpoint for every wallet with new entries
+
+    Checkpoints lag WALLET_SNAPSHOT_DELAY_MINUTES behind now, so entries of
+    transactions still in flight (created_at is set before commit) are
+    never skipped.
+    """
+    as_of = datetime.utcnow() - timedelta(minutes=settings.WALLET_SNAPSHOT_DELAY_MINUTES)
+    since = await db.scalar(select(func.max(WalletBalanceSnapshot.taken_at)))
+    if since is not None and since >= as_of:
+        return {"snapshots": 0}
+
+    result = await db.execute(
+        BUILD_SNAPSHOTS_SQL,
+        {"since": since or datetime.min, "as_of": as_of}
+    )
+    await db.commit()
+
+    stats = {"snapshots": result.rowcount, "as_of": as_of.isoformat()}
+    logger.info(f"Built wallet balance snapshots: {stats}")
+    return stats
@@ -0,0 +1,182 @@
+"""
+Product Moderation Queue
+
+Moderators lease batches of products waiting in status "moderation"
+instead of paging through the same list:
+1. claim_batch() picks the oldest unleased products with
+   SELECT ... FOR UPDATE SKIP LOCKED and stamps them with the moderator and
+   a lease deadline (MODERATION_LEASE_MINUTES). Concurrent claims skip each
+   other's rows, so two moderators never get the same product. An expired
+   lease (moderator left) makes the product claimable again.
+2. decide() approves or rejects many products with one UPDATE ... RETURNING
+   and notifies their sellers with one multi-row insert
+   (app.services.notifications), in the caller's transaction. Approved
+   referral products enter the partner catalog (app.services.partner_offers)
+   and approved products the catalog facet counts.
+
+The (status, created_at) index serves the claim query.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, update, func, or_, and_, literal
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.product import Product
+from app.services.catalog_facets import record_change as record_facet_change
+from app.services.notifications import create_notifications
+from app.services.partner_offers import sync_products as sync_partner_offers
+
+logger = logging.getLogger(__name__)
+
+DECISIONS = {
+    "active": ("Товар одобрен", "Ваш товар «{title}» прошёл модерацию и опубликован."),
+    "rejected": ("Товар отклонён", "Ваш товар «{title}» не прошёл модерацию."),
+}
+
+
+def _claimable(moderator_id: Optional[UUID], now: datetime):
+    """Waiting products that are unleased, lease-expired or already ours"""
+    free = [Product.moderation_lease_until.is_(None), Product.moderation_lease_until < now]
+    if moderator_id is not None:
+        free.append(Product.moderation_claimed_by == moderator_id)
+    return and_(Product.status == "moderation", or_(*free))
+
+
+async def claim_batch(db: AsyncSession, moderator_id: UUID, limit: int) -> List[Product]:
+    """
+    Lease up to `limit` of the oldest waiting products to a moderator
+
+    Products the moderator already holds are returned again (with the
+    lease extended), so a reload doesn't lose the batch. Does not commit.
+    """
+    now = datetime.utcnow()
+    batch = (
+        select(Product.id)
+        .where(_claimable(moderator_id, now))
+        .order_by(Product.created_at, Product.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .cte("batch")
+    )
+    result = await db.execute(
+        update(Product)
+        .where(Product.id == batch.c.id)
+        .values(
+            moderation_claimed_by=moderator_id,
+            moderation_lease_until=now + timedelta(minutes=settings.MODERATION_LEASE_MINUTES),
+            updated_at=Product.updated_at,  # A lease is not an edit
+        )
+        .returning(Product)
+        .execution_options(synchronize_session=False)
+    )
+    products = list(result.scalars().all())
+    products.sort(key=lambda product: (product.created_at, product.id))
+    return products
+
+
+async def release(db: AsyncSession, moderator_id: UUID, product_ids: Optional[List[UUID]] = None) -> int:
+    """Give the moderator's leased products (all, or the given ones) back to the queue"""
+    stmt = (
+        update(Product)
+        .where(Product.moderation_claimed_by == moderator_id, Product.status == "moderation")
+        .values(moderation_claimed_by=None, moderation_lease_until=None, updated_at=Product.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    if product_ids is not None:
+        stmt = stmt.where(Product.id.in_(product_ids))
+    result = await db.execute(stmt)
+    return result.rowcount
+
+
+async def decide(
+    db: AsyncSession,
+    moderator_id: Optional[UUID],
+    product_ids: List[UUID],
+    decision: str,
+    reason: Optional[str] = None,
+    source: str = "manual",
+) -> List[dict]:
+    """
+    Approve ("active") or reject ("rejected") products and notify sellers
+
+    Only products still waiting in moderation and not leased to another
+    moderator are changed. The verdict is added to moderation_result under
+    `source` ("manual", or "auto" for app.services.image_moderation with
+    moderator_id None). Does not commit.
+
+    Returns:
+        list: {id, seller_id, title, status} of the changed products
+    """
+    if decision not in DECISIONS:
+        raise ValueError(f"Unknown decision: {decision}")
+    if not product_ids:
+        return []
+
+    now = datetime.utcnow()
+    verdict = {
+        "decision": decision,
+        "reason": reason,
+        "moderator_id": str(moderator_id) if moderator_id else None,
+        "decided_at": now.isoformat(),
+    }
+    result = await db.execute(
+        update(Product)
+        .where(Product.id.in_(product_ids), _claimable(moderator_id, now))
+        .values(
+            status=decision,
+            # Keep earlier verdicts (e.g. the image classifier), add this one
+            moderation_result=func.coalesce(Product.moderation_result, literal({}, JSONB))
+            .op("||")(literal({source: verdict}, JSONB)),
+            moderation_claimed_by=None,
+            moderation_lease_until=None,
+            updated_at=now,
+        )
+        .returning(Product.id, Product.seller_id, Product.title, Product.status)
+        .execution_options(synchronize_session=False)
+    )
+    decided = [dict(row._mapping) for row in result.all()]
+    decided_ids = [product["id"] for product in decided]
+    await sync_partner_offers(db, decided_ids)
+    # Claimable products were waiting in "moderation", so none was counted
+    await record_facet_change(db, Counter(), Product.id.in_(decided_ids))
+
+    title, message = DECISIONS[decision]
+    suffix = f" Причина: {reason}" if reason else ""
+    await create_notifications(db, [
+        {
+            "user_id": product["seller_id"],
+            "type": "moderation",
+            "title": title,
+            "message": message.format(title=product["title"]) + suffix,
+            "data": {"product_id": str(product["id"]), "status": decision},
+        }
+        for product in decided
+    ])
+
+    logger.info(f"Moderator {moderator_id or source} set {len(decided)}/{len(product_ids)} products to {decision}")
+    return decided
+
+
+async def queue_stats(db: AsyncSession) -> dict:
+    """Waiting products, how many are leased, and the oldest wait"""
+    now = datetime.utcnow()
+    row = (await db.execute(
+        select(
+            func.count(),
+            func.count().filter(Product.moderation_lease_until >= now),
+            func.min(Product.created_at),
+        ).where(Product.status == "moderation")
+    )).one()
+    waiting, leased, oldest = row
+    return {
+        "waiting": waiting,
+        "leased": leased,
+        "available": waiting - leased,
+        "oldest_created_at": oldest,
+    }
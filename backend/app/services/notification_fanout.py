@@ -0,0 +1,254 @@
+"""
+Bulk Notification Fan-out Service
+
+Sends one template to an audience of any size (all followers of a seller,
+sellers whose tariff expires, referrers paid in a settlement batch):
+1. create_fanout() stores a notification_fanouts job. The audience is a
+   named query from AUDIENCES plus JSON params, never client SQL.
+2. run_fanout() (Celery worker, app.tasks.notifications) streams
+   recipients in user_id order through a server-side cursor on its own
+   connection, so memory stays flat whatever the audience size.
+3. Every chunk of NOTIFICATION_FANOUT_CHUNK_SIZE recipients is written with
+   one multi-row INSERT and one counter upsert (create_notifications), then
+   committed together with the job's last_user_id. A retried or restarted
+   job resumes after the last committed recipient, without duplicates.
+
+Templates may use {name} for the recipient's name, plus any str.format
+placeholder that the audience query selects.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, update, func, any_, bindparam, Select
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.favorite import Favorite
+from app.models.notification import NotificationFanout
+from app.models.product import Product
+from app.models.user import User
+from app.models.wallet import ProductReferralPurchase
+from app.services.notifications import create_notifications
+from app.services.realtime import publish
+
+logger = logging.getLogger(__name__)
+
+
+def _recipients(*where) -> Select:
+    """Active users as (user_id, name), the shape every audience returns"""
+    return select(
+        User.id.label("user_id"),
+        User.full_name.label("name"),
+    ).where(User.is_banned.isnot(True), *where)
+
+
+def _uuid_array(name: str, values) -> bindparam:
+    # One array parameter instead of one parameter per id
+    return bindparam(name, [UUID(str(value)) for value in values], type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+def _all_users(params: dict) -> Select:
+    return _recipients()
+
+
+def _users(params: dict) -> Select:
+    return _recipients(User.id == any_(_uuid_array("user_ids", params["user_ids"])))
+
+
+def _seller_followers(params: dict) -> Select:
+    """Users who added any product of the seller to favorites"""
+    followers = (
+        select(Favorite.user_id)
+        .join(Product, Product.id == Favorite.product_id)
+        .where(Product.seller_id == UUID(params["seller_id"]))
+    )
+    return _recipients(User.id.in_(followers))
+
+
+def _tariff_expiring(params: dict) -> Select:
+    """Paid tariffs that expire within params["days"] days"""
+    now = datetime.utcnow()
+    return _recipients(
+        User.tariff != "free",
+        User.tariff_expires_at > now,
+        User.tariff_expires_at <= now + timedelta(days=int(params.get("days", 3))),
+    ).add_columns(User.tariff.label("tariff"), User.tariff_expires_at.label("expires_at"))
+
+
+def _settlement_referrers(params: dict) -> Select:
+    """Referrers paid a commission for the given orders"""
+    referrers = select(ProductReferralPurchase.referrer_id).where(
+        ProductReferralPurchase.order_id == any_(_uuid_array("order_ids", params["order_ids"])),
+        ProductReferralPurchase.status == "completed",
+    )
+    return _recipients(User.id.in_(referrers))
+
+
+AUDIENCES: Dict[str, Callable[[dict], Select]] = {
+    "all_users": _all_users,
+    "users": _users,
+    "seller_followers": _seller_followers,
+    "tariff_expiring": _tariff_expiring,
+    "settlement_referrers": _settlement_referrers,
+}
+
+
+def audience_query(audience: str, params: dict) -> Select:
+    """Recipient query of a named audience (ValueError if unknown or params are wrong)"""
+    if audience not in AUDIENCES:
+        raise ValueError(f"Unknown audience: {audience}. Supported: {', '.join(AUDIENCES)}")
+    try:
+        return AUDIENCES[audience](params)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid params for audience {audience}: {e!r}")
+
+
+class _Fields(dict):
+    """Leaves unknown placeholders as they are instead of failing the job"""
+
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def render(template: str, fields: dict) -> str:
+    return template.format_map(_Fields({**fields, "name": fields.get("name") or ""}))
+
+
+async def create_fanout(
+    db: AsyncSession,
+    audience: str,
+    params: dict,
+    type: str,
+    title: str,
+    message: str,
+    data: Optional[dict] = None,
+    created_by: Optional[UUID] = None,
+) -> NotificationFanout:
+    """
+    Store a fan-out job; pass its id to enqueue_fanout() after commit
+
+    Raises ValueError for an unknown audience or bad params.
+    """
+    audience_query(audience, params)
+    fanout = NotificationFanout(
+        audience=audience,
+        params=params,
+        template={"type": type, "title": title, "message": message, "data": data},
+        status="pending",
+        sent_count=0,
+        created_by=created_by,
+    )
+    db.add(fanout)
+    await db.flush()
+    return fanout
+
+
+def _rows(template: dict, recipients) -> List[dict]:
+    rows = []
+    for recipient in recipients:
+        fields = dict(recipient._mapping)
+        rows.append({
+            "user_id": recipient.user_id,
+            "type": template["type"],
+            "title": render(template["title"], fields)[:200],
+            "message": render(template["message"], fields),
+            "data": template.get("data"),
+        })
+    return rows
+
+
+def _set(fanout_id: UUID, **values):
+    return (
+        update(NotificationFanout)
+        .where(NotificationFanout.id == fanout_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _deliver(db: AsyncSession, cursor_conn, fanout_id: UUID, chunk_size: int):
+    fanout = (await db.execute(
+        update(NotificationFanout)
+        .where(NotificationFanout.id == fanout_id, NotificationFanout.status != "completed")
+        .values(
+            status="running",
+            started_at=func.coalesce(NotificationFanout.started_at, datetime.utcnow()),
+            error=None,
+        )
+        .returning(NotificationFanout)
+    )).scalar_one_or_none()
+    await db.commit()
+    started = datetime.utcnow()
+    if fanout is None:
+        return None, 0, started
+
+    query = audience_query(fanout.audience, fanout.params).order_by(User.id)
+    if fanout.last_user_id:
+        query = query.where(User.id > fanout.last_user_id)
+
+    sent = 0
+    try:
+        result = await cursor_conn.stream(query.execution_options(yield_per=chunk_size))
+        async for recipients in result.partitions(chunk_size):
+            rows = _rows(fanout.template, recipients)
+            await create_notifications(db, rows)
+            await db.execute(_set(
+                fanout_id,
+                last_user_id=rows[-1]["user_id"],
+                sent_count=NotificationFanout.sent_count + len(rows),
+            ))
+            await db.commit()
+            sent += len(rows)
+
+            await publish(
+                [row["user_id"] for row in rows],
+                "notifications",
+                "created",
+                {"type": fanout.template["type"]},
+            )
+    except Exception as e:
+        await db.rollback()
+        await db.execute(_set(fanout_id, status="failed", error=repr(e)[:1000]))
+        await db.commit()
+        raise
+
+    await db.execute(_set(fanout_id, status="completed", completed_at=datetime.utcnow()))
+    await db.commit()
+    return fanout, sent, started
+
+
+async def run_fanout(db: AsyncSession, fanout_id: UUID, chunk_size: Optional[int] = None) -> dict:
+    """
+    Deliver a fan-out job, committing after every chunk
+
+    Safe to call again for a job that stopped halfway: it continues after
+    last_user_id. Completed jobs, and jobs another worker is running, are
+    skipped.
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+
+    # Own connection for the cursor: it stays in one transaction while the
+    # chunks are committed on the session's connection. It also holds the
+    # job's advisory lock for the whole run.
+    lock_key = func.hashtext(f"notification_fanout:{fanout_id}")
+    async with db.bind.connect() as cursor_conn:
+        if not await cursor_conn.scalar(select(func.pg_try_advisory_lock(lock_key))):
+            return {"sent": 0, "skipped": True}
+        try:
+            fanout, sent, started = await _deliver(db, cursor_conn, fanout_id, chunk_size)
+        finally:
+            # Pooled connections outlive the run: release the lock explicitly
+            await cursor_conn.rollback()
+            await cursor_conn.execute(select(func.pg_advisory_unlock(lock_key)))
+            await cursor_conn.commit()
+
+    if fanout is None:
+        return {"sent": 0, "skipped": True}
+
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    stats = {"sent": sent, "seconds": round(elapsed, 2)}
+    logger.info(f"Notification fan-out {fanout_id} ({fanout.audience}): {stats}")
+    return stats
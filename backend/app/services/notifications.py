@@ -0,0 +1,122 @@
+"""
+Notification Service
+
+Inserts, read-marking and deletes are set-based statements. Each one also
+adjusts notification_counters.unread_count in the same transaction, so the
+unread badge is one primary key lookup instead of a COUNT per poll.
+
+All writes to notifications should go through this module. A write that
+bypasses it leaves the counter wrong until recount_unread() is run for
+that user.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.notification import Notification, NotificationCounter
+
+
+async def _increment_unread(db: AsyncSession, counts: Dict[UUID, int]):
+    """Add new unread notifications to counters (one upsert, rows in user_id order)"""
+    if not counts:
+        return
+    stmt = insert(NotificationCounter).values([
+        {"user_id": user_id, "unread_count": count}
+        for user_id, count in sorted(counts.items())
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[NotificationCounter.user_id],
+        set_={"unread_count": NotificationCounter.unread_count + stmt.excluded.unread_count},
+    ))
+
+
+async def _decrement_unread(db: AsyncSession, user_id: UUID, count: int):
+    if not count:
+        return
+    await db.execute(
+        update(NotificationCounter)
+        .where(NotificationCounter.user_id == user_id)
+        .values(unread_count=func.greatest(NotificationCounter.unread_count - count, 0))
+    )
+
+
+async def create_notifications(db: AsyncSession, rows: List[dict]) -> List[UUID]:
+    """
+    Insert notifications in one statement and bump unread counters
+
+    rows: dicts with user_id, type, title, message and optionally data.
+    Does not commit.
+
+    Returns:
+        list: Ids of the new notifications
+    """
+    if not rows:
+        return []
+    result = await db.execute(
+        insert(Notification)
+        .values([{**row, "is_read": False} for row in rows])
+        .returning(Notification.id)
+    )
+    await _increment_unread(db, Counter(row["user_id"] for row in rows))
+    return [notification_id for (notification_id,) in result.all()]
+
+
+async def mark_read(db: AsyncSession, user_id: UUID, notification_ids: Optional[Iterable[UUID]] = None) -> int:
+    """Mark the user's unread notifications (all, or the given ones) as read; returns how many"""
+    stmt = (
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read.is_(False))
+        .values(is_read=True, read_at=datetime.utcnow())
+        .returning(Notification.id)
+        .execution_options(synchronize_session=False)
+    )
+    if notification_ids is not None:
+        stmt = stmt.where(Notification.id.in_(list(notification_ids)))
+
+    count = len((await db.execute(stmt)).all())
+    await _decrement_unread(db, user_id, count)
+    return count
+
+
+async def delete_notifications(db: AsyncSession, user_id: UUID, notification_ids: Optional[Iterable[UUID]] = None) -> int:
+    """Delete the user's notifications (all, or the given ones); returns how many"""
+    stmt = (
+        delete(Notification)
+        .where(Notification.user_id == user_id)
+        .returning(Notification.is_read)
+        .execution_options(synchronize_session=False)
+    )
+    if notification_ids is not None:
+        stmt = stmt.where(Notification.id.in_(list(notification_ids)))
+
+    deleted = (await db.execute(stmt)).all()
+    await _decrement_unread(db, user_id, sum(1 for (is_read,) in deleted if not is_read))
+    return len(deleted)
+
+
+async def get_unread_count(db: AsyncSession, user_id: UUID) -> int:
+    """Unread notifications of a user (primary key lookup)"""
+    count = await db.scalar(
+        select(NotificationCounter.unread_count).where(NotificationCounter.user_id == user_id)
+    )
+    return count or 0
+
+
+async def recount_unread(db: AsyncSession, user_id: UUID) -> int:
+    """Rebuild a user's counter from the notifications table"""
+    count = await db.scalar(
+        select(func.count())
+        .select_from(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    )
+    stmt = insert(NotificationCounter).values(user_id=user_id, unread_count=count)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[NotificationCounter.user_id],
+        set_={"unread_count": stmt.excluded.unread_count},
+    ))
+    return count
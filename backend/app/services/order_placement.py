@@ -0,0 +1,288 @@
+"""
+Order Placement Service
+
+Places one or more orders (one per seller) in the caller's transaction:
+1. Loads every line item's product with one WHERE id = ANY(...) query
+2. Reserves stock for all stock-tracked products with one conditional
+   UPDATE ... RETURNING. Rows are locked in id order, so concurrent carts
+   can't deadlock, and a product can't go below zero.
+3. Inserts the orders, then all ProductReferralPurchase rows in one INSERT
+   (their commission is added to the referrers' pending earnings)
+4. Reserves a coupon redemption, if a code was given (app.services.coupons)
+
+Products with stock_quantity NULL are not stock-tracked and never block an order.
+Stock reserved here is returned by release_stock() when an order is cancelled.
+"""
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from fastapi import status
+from sqlalchemy import select, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.order import Order
+from app.models.product import Product
+from app.models.wallet import ProductReferralPurchase
+from app.schemas.order import OrderItem
+from app.services.coupons import CouponError, reserve_coupon
+from app.services.referral_stats import record_pending_purchases
+
+logger = logging.getLogger(__name__)
+
+# Lock the requested rows in a deterministic order, then decrement only where
+# enough stock is left. Under READ COMMITTED the WHERE clause is re-evaluated
+# against the latest row version after waiting for a concurrent checkout.
+RESERVE_STOCK_SQL = text(
+    """
+    WITH requested AS (
+        SELECT * FROM unnest(CAST(:product_ids AS uuid[]), CAST(:quantities AS integer[])) AS r(id, qty)
+    ),
+    locked AS (
+        SELECT p.id FROM products p
+        JOIN requested ON requested.id = p.id
+        WHERE p.stock_quantity IS NOT NULL
+        ORDER BY p.id
+        FOR UPDATE OF p
+    )
+    UPDATE products p
+    SET stock_quantity = p.stock_quantity - requested.qty
+    FROM requested, locked
+    WHERE p.id = requested.id
+      AND locked.id = p.id
+      AND p.stock_quantity >= requested.qty
+    RETURNING p.id
+    """
+)
+
+RELEASE_STOCK_SQL = text(
+    """
+    UPDATE products p
+    SET stock_quantity = p.stock_quantity + released.qty
+    FROM unnest(CAST(:product_ids AS uuid[]), CAST(:quantities AS integer[])) AS released(id, qty)
+    WHERE p.id = released.id AND p.stock_quantity IS NOT NULL
+    """
+)
+
+
+class OrderPlacementError(Exception):
+    """Order can't be placed; carries the HTTP status for the endpoint"""
+
+    def __init__(self, detail: str, status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class OrderDraft:
+    """Line items of one seller's order"""
+    seller_id: UUID
+    items: List[OrderItem] = field(default_factory=list)
+
+
+def _parse_uuid(value: str, what: str) -> UUID:
+    try:
+        return UUID(value)
+    except (ValueError, AttributeError, TypeError):
+        raise OrderPlacementError(f"Invalid {what}: {value}")
+
+
+async def load_products(db: AsyncSession, items: List[OrderItem]) -> Dict[UUID, Product]:
+    """Load all line item products in one query and check they can be ordered"""
+    product_ids = {_parse_uuid(item.product_id, "product_id") for item in items}
+    result = await db.execute(
+        select(Product).where(Product.id.in_(product_ids))
+    )
+    products = {product.id: product for product in result.scalars().all()}
+
+    for product_id in product_ids:
+        product = products.get(product_id)
+        if not product:
+            raise OrderPlacementError(f"Product {product_id} not found", status.HTTP_404_NOT_FOUND)
+        if product.status != "active":
+            raise OrderPlacementError(f"Product {product.title} is not available")
+
+    return products
+
+
+async def reserve_stock(db: AsyncSession, items: List[OrderItem], products: Dict[UUID, Product]):
+    """Atomically decrement stock for every stock-tracked product in the checkout"""
+    quantities: Dict[UUID, int] = OrderedDict()
+    for item in items:
+        if item.quantity <= 0:
+            raise OrderPlacementError("Quantity must be positive")
+        product_id = UUID(item.product_id)
+        quantities[product_id] = quantities.get(product_id, 0) + item.quantity
+
+    tracked = {
+        product_id: quantity
+        for product_id, quantity in quantities.items()
+        if products[product_id].stock_quantity is not None
+    }
+    if not tracked:
+        return
+
+    result = await db.execute(
+        RESERVE_STOCK_SQL,
+        {"product_ids": list(tracked.keys()), "quantities": list(tracked.values())}
+    )
+    reserved = {product_id for (product_id,) in result.all()}
+
+    missing = [product_id for product_id in tracked if product_id not in reserved]
+    if missing:
+        # The caller's transaction is rolled back, undoing the partial reservation
+        titles = ", ".join(products[product_id].title for product_id in missing)
+        raise OrderPlacementError(f"Недостаточно товара на складе: {titles}", status.HTTP_409_CONFLICT)
+
+
+async def release_stock(db: AsyncSession, order: Order):
+    """
+    Return reserved stock of a cancelled order
+
+    Only items flagged stock_reserved are released, and the flag is cleared,
+    so orders placed before reservation existed and repeated cancellations
+    don't inflate stock. The flags are read from the loaded order: the
+    caller must have loaded it FOR UPDATE.
+    """
+    quantities: Dict[UUID, int] = {}
+    items = []
+    for item in order.items or []:
+        if item.get("stock_reserved"):
+            product_id = UUID(item["product_id"])
+            quantities[product_id] = quantities.get(product_id, 0) + int(item["quantity"])
+            item = {**item, "stock_reserved": False}
+        items.append(item)
+
+    if quantities:
+        await db.execute(
+            RELEASE_STOCK_SQL,
+            {"product_ids": list(quantities.keys()), "quantities": list(quantities.values())}
+        )
+        order.items = items
+
+
+def split_by_seller(items: List[OrderItem], products: Dict[UUID, Product]) -> List[OrderDraft]:
+    """Group cart items into one draft per seller, keeping cart order"""
+    drafts: Dict[UUID, OrderDraft] = OrderedDict()
+    for item in items:
+        seller_id = products[UUID(item.product_id)].seller_id
+        drafts.setdefault(seller_id, OrderDraft(seller_id=seller_id)).items.append(item)
+    return list(drafts.values())
+
+
+async def place_orders(
+    db: AsyncSession,
+    buyer_id: UUID,
+    drafts: List[OrderDraft],
+    products: Dict[UUID, Product],
+    delivery_address: Optional[str],
+    phone_number: Optional[str],
+    payment_method: Optional[str],
+    notes: Optional[str],
+    coupon_code: Optional[str] = None,
+) -> List[Order]:
+    """
+    Create orders for validated drafts and reserve their stock
+
+    Does not commit - all orders, the stock reservation, the referral
+    records and the coupon redemption succeed or fail together with the
+    caller's transaction.
+    """
+    for draft in drafts:
+        for item in draft.items:
+            if products[UUID(item.product_id)].seller_id != draft.seller_id:
+                raise OrderPlacementError(f"Product {item.product_id} does not belong to seller")
+
+    all_items = [item for draft in drafts for item in draft.items]
+    await reserve_stock(db, all_items, products)
+
+    orders = []
+    referral_rows = []
+    for draft in drafts:
+        total_amount = Decimal(0)
+        order_items = []
+        for item in draft.items:
+            product = products[UUID(item.product_id)]
+
+            # Use discount price if available, otherwise regular price
+            item_price = item.discount_price if item.discount_price else item.price
+            total_amount += item_price * item.quantity
+
+            order_items.append({
+                "product_id": str(product.id),
+                "product_title": product.title,
+                "quantity": item.quantity,
+                "price": float(item.price),
+                "discount_price": float(item.discount_price) if item.discount_price else None,
+                "stock_reserved": product.stock_quantity is not None
+            })
+
+        order = Order(
+            order_number=Order.generate_order_number(),
+            buyer_id=buyer_id,
+            seller_id=draft.seller_id,
+            items=order_items,
+            total_amount=total_amount,
+            delivery_address=delivery_address,
+            phone_number=phone_number,
+            payment_method=payment_method,
+            notes=notes,
+            status="pending"  # Cash orders start as pending
+        )
+        orders.append((order, draft))
+
+    db.add_all([order for order, _ in orders])
+    await db.flush()  # One batched INSERT, gives order ids
+
+    for order, draft in orders:
+        for item in draft.items:
+            referral_row = _referral_purchase_row(item, products[UUID(item.product_id)], buyer_id, order.id)
+            if referral_row:
+                referral_rows.append(referral_row)
+
+    if referral_rows:
+        await db.execute(insert(ProductReferralPurchase), referral_rows)
+        await record_pending_purchases(db, referral_rows)
+
+    placed = [order for order, _ in orders]
+    if coupon_code:
+        # Last, to hold the coupon row lock for as short as possible
+        try:
+            await reserve_coupon(db, coupon_code, buyer_id, placed)
+        except CouponError as e:
+            raise OrderPlacementError(e.detail, e.status_code)
+
+    return placed
+
+
+def _referral_purchase_row(item: OrderItem, product: Product, buyer_id: UUID, order_id: UUID) -> Optional[dict]:
+    """ProductReferralPurchase values for a referred line item, or None"""
+    if not item.product_referrer_id or not item.product_referrer_id.strip():
+        return None
+    try:
+        referrer_uuid = UUID(item.product_referrer_id)
+    except (ValueError, AttributeError):
+        # Skip invalid referrer_id (not a valid UUID)
+        return None
+
+    if not product.is_referral_enabled or not product.referral_commission_percent:
+        return None
+
+    item_price = item.discount_price if item.discount_price else item.price
+    total_item_price = item_price * item.quantity
+    commission_amount = (total_item_price * product.referral_commission_percent) / Decimal('100')
+
+    return {
+        "referrer_id": referrer_uuid,
+        "buyer_id": buyer_id,
+        "product_id": product.id,
+        "order_id": order_id,
+        "commission_percent": product.referral_commission_percent,
+        "commission_amount": commission_amount,
+        "product_price": total_item_price,
+        "status": "pending",  # Will be completed when order is confirmed
+    }
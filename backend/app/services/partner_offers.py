@@ -0,0 +1,105 @@
+"""
+Partner Offer Index
+
+The partner catalog (/products/referral/products, /partners/top-products)
+lists active referral products of Business sellers sorted by the commission
+a partner earns. partner_offers keeps one row per active referral product
+with the effective price and commission amount precomputed, and whether
+its seller is on Business, so the catalog is an index scan over partial
+indexes (WHERE seller_is_business) instead of a join to users and a sort
+by a computed expression.
+
+Rows are kept in sync in the transaction of the change:
+- sync_products() after a product's price, referral settings or status
+  change (update, moderation); a product that no longer qualifies is removed
+- sync_seller_tariff() after a seller's tariff changes (one UPDATE)
+- remove_seller() when a downgrade switches the seller's referrals off
+Deleted products go with ON DELETE CASCADE. Nothing here commits.
+"""
+from typing import Iterable
+from uuid import UUID
+
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.product import Product, PartnerOffer
+from app.models.user import User
+
+
+def _effective_price():
+    return func.coalesce(func.nullif(Product.discount_price, 0), Product.price)
+
+
+def _offer_rows(product_ids):
+    """SELECT of the partner_offers rows for qualifying products among product_ids"""
+    effective_price = _effective_price()
+    return (
+        select(
+            Product.id,
+            Product.seller_id,
+            Product.category_id,
+            effective_price,
+            Product.referral_commission_percent,
+            func.round(effective_price * Product.referral_commission_percent / 100, 2),
+            User.tariff == "business",
+            Product.created_at,
+        )
+        .join(User, User.id == Product.seller_id)
+        .where(
+            Product.id.in_(product_ids),
+            Product.status == "active",
+            Product.is_referral_enabled.is_(True),
+            Product.referral_commission_percent >= 1,
+        )
+    )
+
+
+async def sync_products(db: AsyncSession, product_ids: Iterable[UUID]):
+    """Rewrite the offers of these products from their current state"""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    await db.execute(
+        delete(PartnerOffer)
+        .where(PartnerOffer.product_id.in_(product_ids))
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        insert(PartnerOffer)
+        .from_select(
+            [
+                "product_id", "seller_id", "category_id", "effective_price",
+                "commission_percent", "commission_amount", "seller_is_business", "created_at",
+            ],
+            _offer_rows(product_ids),
+        )
+        .on_conflict_do_nothing(index_elements=[PartnerOffer.product_id])
+    )
+
+
+async def sync_seller_tariff(db: AsyncSession, seller_id: UUID, tariff: str):
+    """Show or hide all offers of a seller after a tariff change"""
+    await db.execute(
+        update(PartnerOffer)
+        .where(
+            PartnerOffer.seller_id == seller_id,
+            PartnerOffer.seller_is_business.is_distinct_from(tariff == "business"),
+        )
+        .values(seller_is_business=tariff == "business")
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def remove_seller(db: AsyncSession, seller_id: UUID):
+    """Drop all offers of a seller whose referral program was switched off"""
+    await db.execute(
+        delete(PartnerOffer)
+        .where(PartnerOffer.seller_id == seller_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def listed():
+    """WHERE clause matching the partial indexes (plain column, not IS TRUE)"""
+    return PartnerOffer.seller_is_business
@@ -0,0 +1,167 @@
+"""
+Category Price Statistics
+
+Price range sliders need the price distribution of a category before the
+user picks a range. category_price_buckets keeps active products per
+(category, price bucket) on fixed log-scale edges (10, 15, 20, 30, 50, 70,
+100, ... som), so a category's histogram is at most len(PRICE_BUCKET_EDGES)
+rows and its descendants are summed through the reference registry, like
+the facet counts.
+
+The buckets are on products.price, the column the min_price/max_price
+filters compare. They are maintained together with the catalog facet
+counts (app.services.catalog_facets: same snapshots, same nightly
+reconcile); this module owns the edges, the upsert and the reading side.
+Quantiles are interpolated within buckets, so they are approximate to
+one bucket. Rows are cached in Redis for CATALOG_FACETS_CACHE_TTL.
+Nothing here commits.
+"""
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, delete, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.product import Product, CategoryPriceBucket
+from app.services.reference_data import current as current_reference_data
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "price_stats:rows"
+
+# 0, then 1-1.5-2-3-5-7 per decade; bucket b is [edges[b-1], edges[b]),
+# the last one is open-ended. Migration 021 backfills with the same edges.
+PRICE_BUCKET_EDGES: Tuple[int, ...] = (0,) + tuple(
+    int(step * 10 ** decade) for decade in range(1, 7) for step in (1, 1.5, 2, 3, 5, 7)
+)
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def bucket_of():
+    """Bucket number of Product.price (an inline array, so GROUP BY can repeat it)"""
+    edges = ",".join(str(edge) for edge in PRICE_BUCKET_EDGES)
+    return func.width_bucket(Product.price, literal_column(f"ARRAY[{edges}]::numeric[]"))
+
+
+def bucket_range(bucket: int) -> Tuple[int, Optional[int]]:
+    """(from, to) of a bucket; to is None for the last one"""
+    lower = PRICE_BUCKET_EDGES[max(bucket, 1) - 1]
+    upper = PRICE_BUCKET_EDGES[bucket] if bucket < len(PRICE_BUCKET_EDGES) else None
+    return lower, upper
+
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[Tuple[int, int], int]):
+    """Add deltas to the counts; deltas: {(category_id, bucket): delta} (one upsert)"""
+    rows = [
+        {"category_id": category_id, "bucket": bucket, "active_products": delta}
+        for (category_id, bucket), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    stmt = insert(CategoryPriceBucket).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[CategoryPriceBucket.category_id, CategoryPriceBucket.bucket],
+        set_={
+            "active_products": CategoryPriceBucket.active_products + stmt.excluded.active_products,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+async def reconcile(db: AsyncSession) -> int:
+    """Recount all buckets from products. Returns the number of rows."""
+    category = func.coalesce(Product.category_id, literal_column("0"))
+    bucket = bucket_of()
+    await db.execute(delete(CategoryPriceBucket))
+    result = await db.execute(
+        insert(CategoryPriceBucket)
+        .from_select(
+            ["category_id", "bucket", "active_products"],
+            select(category, bucket, func.count())
+            .where(Product.status == "active")
+            .group_by(category, bucket),
+        )
+        .returning(CategoryPriceBucket.bucket)
+    )
+    return len(result.all())
+
+
+async def _rows(db: AsyncSession):
+    """[(category_id, bucket, active_products)], from the cache when possible"""
+    redis = None
+    try:
+        redis = get_redis()
+        cached = await redis.get(CACHE_KEY)
+        if cached is not None:
+            return [tuple(row) for row in json.loads(cached)]
+    except RedisError as e:
+        logger.warning(f"Price stats cache unavailable: {e}")
+        redis = None
+
+    result = await db.execute(
+        select(
+            CategoryPriceBucket.category_id,
+            CategoryPriceBucket.bucket,
+            CategoryPriceBucket.active_products,
+        ).where(CategoryPriceBucket.active_products > 0)
+    )
+    rows = [tuple(row) for row in result.all()]
+
+    if redis is not None:
+        try:
+            await redis.set(CACHE_KEY, json.dumps(rows), ex=settings.CATALOG_FACETS_CACHE_TTL)
+        except RedisError as e:
+            logger.warning(f"Price stats not cached: {e}")
+    return rows
+
+
+def _quantile(buckets: List[Tuple[int, int]], total: int, q: float) -> float:
+    """Price below which a share q of the products is, interpolated within its bucket"""
+    target = q * total
+    seen = 0
+    for bucket, count in buckets:
+        if seen + count >= target:
+            lower, upper = bucket_range(bucket)
+            if upper is None:
+                return float(lower)
+            return round(lower + (upper - lower) * (target - seen) / count, 2)
+        seen += count
+    return float(bucket_range(buckets[-1][0])[0])
+
+
+async def get_price_facets(db: AsyncSession, category_id: Optional[int] = None) -> dict:
+    """
+    Price histogram and approximate quantiles of the active products of a
+    category and its subcategories (all products without category_id)
+    """
+    rows = await _rows(db)
+    if category_id:
+        subtree = set((await current_reference_data()).category_with_descendants(category_id))
+        rows = [row for row in rows if row[0] in subtree]
+
+    per_bucket: Dict[int, int] = defaultdict(int)
+    for _, bucket, count in rows:
+        per_bucket[bucket] += count
+    buckets = sorted(per_bucket.items())
+    total = sum(per_bucket.values())
+    if not total:
+        return {"total": 0, "min": None, "max": None, "buckets": [], "quantiles": {}}
+
+    return {
+        "total": total,
+        "min": bucket_range(buckets[0][0])[0],
+        "max": bucket_range(buckets[-1][0])[1],
+        "buckets": [
+            {"from": bucket_range(bucket)[0], "to": bucket_range(bucket)[1], "count": count}
+            for bucket, count in buckets
+        ],
+        "quantiles": {f"p{int(q * 100)}": _quantile(buckets, total, q) for q in QUANTILES},
+    }
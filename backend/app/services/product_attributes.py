@@ -0,0 +1,147 @@
+"""
+Product Attribute Filters
+
+products.characteristics is free-form JSONB ([{name, value}]) typed in by
+sellers, so "Цвет: Черный" and " цвет :  черный" must be the same filter.
+product_attributes keeps one row per (product, name, value) with both
+normalized (whitespace collapsed, lower case) and, for display, as entered:
+- filters: attr=name:value query parameters; values of one name are OR'ed,
+  different names AND'ed. Each name is one IN (subquery) on the
+  (name, value, product_id) index.
+- facets: value counts of the current result set, one grouped query over
+  the attributes of the matching products with the top values per name.
+
+sync_products() rewrites the rows of products whose characteristics were
+set (create, update); deleted products go with ON DELETE CASCADE. Nothing
+here commits.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.product import Product, ProductAttribute
+
+NAME_LENGTH = ProductAttribute.name.type.length
+VALUE_LENGTH = ProductAttribute.value.type.length
+
+
+class InvalidAttributeFilterError(Exception):
+    """Raised when an attr filter is not "name:value" or there are too many"""
+
+    def __init__(self, detail: str = "Invalid attribute filter"):
+        self.detail = detail
+        super().__init__(detail)
+
+
+def normalize(text: str, length: int) -> str:
+    return " ".join(str(text).split()).lower()[:length]
+
+
+def _rows(product_id: UUID, characteristics) -> List[dict]:
+    rows = {}
+    for item in characteristics or []:
+        if not isinstance(item, dict):
+            continue
+        name, value = item.get("name"), item.get("value")
+        if name is None or value is None:
+            continue
+        key = (normalize(name, NAME_LENGTH), normalize(value, VALUE_LENGTH))
+        if key[0] and key[1] and key not in rows:
+            rows[key] = {
+                "product_id": product_id,
+                "name": key[0],
+                "value": key[1],
+                "name_label": str(name).strip()[:NAME_LENGTH],
+                "value_label": str(value).strip()[:VALUE_LENGTH],
+            }
+    return list(rows.values())
+
+
+async def sync_products(db: AsyncSession, product_ids: Iterable[UUID]):
+    """Rewrite the attributes of these products from their characteristics"""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    result = await db.execute(
+        select(Product.id, Product.characteristics).where(Product.id.in_(product_ids))
+    )
+    rows = [row for product_id, characteristics in result.all() for row in _rows(product_id, characteristics)]
+
+    await db.execute(
+        delete(ProductAttribute)
+        .where(ProductAttribute.product_id.in_(product_ids))
+        .execution_options(synchronize_session=False)
+    )
+    if rows:
+        await db.execute(insert(ProductAttribute).values(rows).on_conflict_do_nothing())
+
+
+def parse_filters(attrs: Optional[List[str]]) -> Dict[str, Set[str]]:
+    """["Цвет:Черный", "цвет:белый", "Память:256GB"] -> {name: {values}}"""
+    filters: Dict[str, Set[str]] = defaultdict(set)
+    for attr in attrs or []:
+        name, separator, value = attr.partition(":")
+        name, value = normalize(name, NAME_LENGTH), normalize(value, VALUE_LENGTH)
+        if not separator or not name or not value:
+            raise InvalidAttributeFilterError(f"Attribute filter must be name:value, got '{attr}'")
+        filters[name].add(value)
+    if sum(len(values) for values in filters.values()) > settings.ATTRIBUTE_FILTERS_MAX:
+        raise InvalidAttributeFilterError(f"At most {settings.ATTRIBUTE_FILTERS_MAX} attribute filters")
+    return dict(filters)
+
+
+def filter_clauses(filters: Dict[str, Set[str]]) -> list:
+    """WHERE clauses on Product for parsed filters (one per attribute name)"""
+    return [
+        Product.id.in_(
+            select(ProductAttribute.product_id).where(
+                ProductAttribute.name == name,
+                ProductAttribute.value.in_(sorted(values)),
+            )
+        )
+        for name, values in sorted(filters.items())
+    ]
+
+
+async def facet_counts(db: AsyncSession, product_ids_query) -> List[dict]:
+    """
+    Value counts of the attributes of the products product_ids_query selects
+
+    product_ids_query: a SELECT of Product.id (the filtered listing without
+    ordering and pagination). Returns the names with the most products
+    first, each with its top ATTRIBUTE_FACET_VALUES values.
+    """
+    count = func.count()
+    per_value = (
+        select(
+            ProductAttribute.name,
+            ProductAttribute.value,
+            func.min(ProductAttribute.name_label).label("name_label"),
+            func.min(ProductAttribute.value_label).label("value_label"),
+            count.label("product_count"),
+            func.row_number().over(partition_by=ProductAttribute.name, order_by=count.desc()).label("rank"),
+        )
+        .where(ProductAttribute.product_id.in_(product_ids_query))
+        .group_by(ProductAttribute.name, ProductAttribute.value)
+        .subquery()
+    )
+    result = await db.execute(
+        select(per_value)
+        .where(per_value.c.rank <= settings.ATTRIBUTE_FACET_VALUES)
+        .order_by(per_value.c.name, per_value.c.rank)
+    )
+
+    facets: Dict[str, dict] = {}
+    for row in result.all():
+        facet = facets.setdefault(row.name, {"name": row.name, "label": row.name_label, "total": 0, "values": []})
+        facet["total"] += row.product_count
+        facet["values"].append({"value": row.value, "label": row.value_label, "count": row.product_count})
+    ranked = sorted(facets.values(), key=lambda facet: -facet["total"])
+    for facet in ranked:
+        del facet["total"]
+    return ranked[:settings.ATTRIBUTE_FACET_NAMES]
@@ -0,0 +1,196 @@
+"""
+Realtime Event Bus
+
+Pushes per-user events to long-lived client connections instead of having
+clients poll:
+1. Write paths call publish() after their transaction commits. The event
+   goes to one Redis pub/sub channel, so it reaches the user no matter
+   which API worker holds their connection.
+2. Every worker runs one listener on that channel (started with the first
+   local connection) and hands each event to the local subscriptions of
+   the event's user.
+3. A subscription is a bounded queue with a set of topics. The SSE and
+   WebSocket endpoints (app.api.v1.endpoints.realtime) and the chat socket
+   drain their queue into the connection. A slow client loses events
+   instead of holding memory.
+
+Topics: notifications, orders, moderation, wallet, chat.
+
+Events are a best-effort hint: if Redis is unavailable they are delivered
+only to connections on the publishing worker. Clients resync with the
+regular REST endpoints after reconnecting.
+"""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "realtime:events"
+TOPICS = frozenset({"notifications", "orders", "moderation", "wallet", "chat"})
+
+
+def _json_default(value):
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def encode_event(event: dict) -> str:
+    """Event as sent to clients (without the routing user_id)"""
+    return json.dumps(
+        {key: value for key, value in event.items() if key != "user_id"},
+        default=_json_default,
+    )
+
+
+@dataclass(eq=False)
+class Subscription:
+    """One client connection: the user, wanted topics and pending events"""
+    user_id: str
+    topics: Set[str]
+    queue: asyncio.Queue = field(
+        default_factory=lambda: asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+    )
+
+    def wants(self, topic: str) -> bool:
+        return topic in self.topics
+
+
+class RealtimeHub:
+    """Subscriptions of this worker and the Redis listener feeding them"""
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id, topics: Optional[Iterable[str]] = None) -> Subscription:
+        """Register a connection (all topics by default)"""
+        wanted = TOPICS if topics is None else TOPICS & set(topics)
+        subscription = Subscription(user_id=str(user_id), topics=set(wanted))
+        self._subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+
+    def deliver(self, event: dict):
+        """Queue an event for the local connections of its user"""
+        for subscription in self._subscriptions.get(event["user_id"], ()):
+            if not subscription.wants(event["topic"]):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Realtime queue full for user {event['user_id']}, dropping {event['topic']} event")
+
+    async def _listen(self):
+        # Own connection: pub/sub blocks on reads, which the shared client's
+        # short socket timeout doesn't allow
+        client = Redis.from_url(settings.REDIS_URL, health_check_interval=30)
+        try:
+            while True:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.deliver(json.loads(message["data"]))
+                except (RedisError, OSError) as e:
+                    logger.warning(f"Realtime listener lost Redis, retrying: {e}")
+                    await asyncio.sleep(settings.REALTIME_RECONNECT_SECONDS)
+                finally:
+                    await pubsub.aclose()
+        finally:
+            await client.aclose()
+
+    async def close(self):
+        """Stop the listener on shutdown"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+hub = RealtimeHub()
+
+
+async def publish(user_ids: Union[UUID, str, Iterable], topic: str, type: str, data: Optional[dict] = None):
+    """
+    Send an event to every connection of the given users
+
+    Call after commit - an event for a rolled back change can't be taken back.
+    Never raises on Redis errors.
+    """
+    if topic not in TOPICS:
+        raise ValueError(f"Unknown realtime topic: {topic}")
+    if isinstance(user_ids, (UUID, str)):
+        user_ids = [user_ids]
+
+    now = datetime.utcnow()
+    events = [
+        {"user_id": str(user_id), "topic": topic, "type": type, "data": data or {}, "sent_at": now}
+        for user_id in dict.fromkeys(str(user_id) for user_id in user_ids)
+    ]
+    if not events:
+        return
+
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.publish(CHANNEL, json.dumps(event, default=_json_default))
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Realtime publish failed, delivering locally only: {e}")
+        for event in json.loads(json.dumps(events, default=_json_default)):
+            hub.deliver(event)
+
+
+async def publish_orders(orders: Iterable, type: str):
+    """Order event to the buyer and the seller of each order"""
+    for order in orders:
+        await publish(
+            [order.buyer_id, order.seller_id],
+            "orders",
+            type,
+            {
+                "order_id": order.id,
+                "order_number": order.order_number,
+                "status": order.status,
+                "total_amount": order.total_amount,
+            },
+        )
+
+
+async def publish_balances(balances: Dict[UUID, Tuple[Decimal, Decimal]]):
+    """Wallet balances after a ledger posting (Posting.balances)"""
+    for user_id, (main_balance, referral_balance) in balances.items():
+        await publish(
+            user_id,
+            "wallet",
+            "balance",
+            {"main_balance": main_balance, "referral_balance": referral_balance},
+        )
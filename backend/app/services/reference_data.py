@@ -0,0 +1,263 @@
+"""
+Reference Data Registry
+
+Cities, markets and categories change maybe once a month but are read on
+almost every request (filters, names in listings, category subtrees). Each
+API worker keeps them in memory:
+1. load() reads the three tables into an immutable ReferenceSnapshot at
+   startup (lifespan); requests read `registry.snapshot` without touching
+   the database.
+2. After an admin change, request_reload() bumps the version in Redis and
+   publishes it on CHANNEL. Every worker's listener reloads and swaps in the
+   new snapshot atomically.
+3. A listener that lost Redis reloads once it is back if the version moved,
+   so a missed message only delays a reload.
+
+Callers outside the API (Celery, scripts) use `await current()`, which
+loads on first use.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.database.session import AsyncSessionLocal
+from app.models.location import City, Market
+from app.models.product import Category
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "reference_data:reload"
+VERSION_KEY = "reference_data:version"
+
+
+@dataclass(frozen=True)
+class CityRef:
+    id: int
+    name: str
+    slug: str
+    region: Optional[str]
+    sort_order: int
+
+
+@dataclass(frozen=True)
+class MarketRef:
+    id: int
+    city_id: int
+    name: str
+    address: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+@dataclass(frozen=True)
+class CategoryRef:
+    id: int
+    parent_id: Optional[int]
+    name: str
+    slug: str
+    level: int
+    icon: Optional[str]
+    sort_order: int
+    is_active: bool
+
+
+@dataclass(frozen=True)
+class ReferenceSnapshot:
+    """One consistent copy of the reference tables; never mutated after load"""
+    version: int
+    loaded_at: datetime
+    cities: Dict[int, CityRef] = field(default_factory=dict)
+    markets: Dict[int, MarketRef] = field(default_factory=dict)
+    categories: Dict[int, CategoryRef] = field(default_factory=dict)
+    children: Dict[int, Tuple[int, ...]] = field(default_factory=dict)
+
+    def city_name(self, city_id: Optional[int]) -> Optional[str]:
+        city = self.cities.get(city_id)
+        return city.name if city else None
+
+    def market_name(self, market_id: Optional[int]) -> Optional[str]:
+        market = self.markets.get(market_id)
+        return market.name if market else None
+
+    def category_ref(self, category_id: Optional[int]) -> Optional[dict]:
+        """{id, name} for listing responses"""
+        category = self.categories.get(category_id)
+        return {"id": category.id, "name": category.name} if category else None
+
+    def sorted_cities(self) -> List[CityRef]:
+        return sorted(self.cities.values(), key=lambda city: (city.sort_order, city.name))
+
+    def sorted_markets(self, city_id: Optional[int] = None) -> List[MarketRef]:
+        markets = [market for market in self.markets.values() if city_id is None or market.city_id == city_id]
+        return sorted(markets, key=lambda market: market.name)
+
+    def sorted_categories(self) -> List[CategoryRef]:
+        return sorted(self.categories.values(), key=lambda category: (category.sort_order, category.name))
+
+    def category_path(self, category_id: Optional[int]) -> List[CategoryRef]:
+        """Root ... category, for breadcrumbs"""
+        path = []
+        category = self.categories.get(category_id)
+        while category is not None and len(path) <= len(self.categories):
+            path.insert(0, category)
+            category = self.categories.get(category.parent_id)
+        return path
+
+    def category_with_descendants(self, category_id: int) -> List[int]:
+        """The category and every category below it (active or not)"""
+        ids, stack = [], [category_id]
+        while stack:
+            current = stack.pop()
+            ids.append(current)
+            stack.extend(self.children.get(current, ()))
+        return ids
+
+
+def _float(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+async def load(db, version: int = 0) -> ReferenceSnapshot:
+    """Read cities, markets and categories into a new snapshot"""
+    cities = (await db.execute(select(City))).scalars().all()
+    markets = (await db.execute(select(Market))).scalars().all()
+    categories = (await db.execute(select(Category))).scalars().all()
+
+    children: Dict[int, List[int]] = {}
+    for category in sorted(categories, key=lambda c: (c.sort_order or 0, c.name)):
+        if category.parent_id is not None:
+            children.setdefault(category.parent_id, []).append(category.id)
+
+    return ReferenceSnapshot(
+        version=version,
+        loaded_at=datetime.utcnow(),
+        cities={
+            city.id: CityRef(city.id, city.name, city.slug, city.region, city.sort_order or 0)
+            for city in cities
+        },
+        markets={
+            market.id: MarketRef(
+                market.id, market.city_id, market.name, market.address,
+                _float(market.latitude), _float(market.longitude),
+            )
+            for market in markets
+        },
+        categories={
+            category.id: CategoryRef(
+                category.id, category.parent_id, category.name, category.slug, category.level,
+                category.icon, category.sort_order or 0, bool(category.is_active),
+            )
+            for category in categories
+        },
+        children={parent_id: tuple(ids) for parent_id, ids in children.items()},
+    )
+
+
+async def _remote_version() -> int:
+    try:
+        return int(await get_redis().get(VERSION_KEY) or 0)
+    except RedisError as e:
+        logger.warning(f"Reference data version unavailable: {e}")
+        return 0
+
+
+class ReferenceRegistry:
+    """The current snapshot of this worker and the Redis listener reloading it"""
+
+    def __init__(self):
+        self.snapshot: Optional[ReferenceSnapshot] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def reload(self, version: Optional[int] = None) -> ReferenceSnapshot:
+        if version is None:
+            version = await _remote_version()
+        async with AsyncSessionLocal() as db:
+            snapshot = await load(db, version)
+        self.snapshot = snapshot
+        logger.info(
+            f"Reference data v{version} loaded: {len(snapshot.cities)} cities, "
+            f"{len(snapshot.markets)} markets, {len(snapshot.categories)} categories"
+        )
+        return snapshot
+
+    async def start(self):
+        """Load at startup and follow reload messages"""
+        await self.reload()
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        # Own connection: pub/sub blocks on reads (see app.services.realtime)
+        client = Redis.from_url(settings.REDIS_URL, health_check_interval=30)
+        try:
+            while True:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    await pubsub.subscribe(CHANNEL)
+                    # Catch up on a reload published while we weren't listening
+                    version = int(await client.get(VERSION_KEY) or 0)
+                    if self.snapshot is None or version != self.snapshot.version:
+                        await self.reload(version)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        version = int(message["data"])
+                        # The worker that requested the reload already has it
+                        if self.snapshot is None or version != self.snapshot.version:
+                            await self.reload(version)
+                except (RedisError, OSError) as e:
+                    logger.warning(f"Reference data listener lost Redis, retrying: {e}")
+                    await asyncio.sleep(settings.REALTIME_RECONNECT_SECONDS)
+                except Exception as e:
+                    # A failed reload keeps the previous snapshot
+                    logger.error(f"Reference data reload failed: {e}")
+                    await asyncio.sleep(settings.REALTIME_RECONNECT_SECONDS)
+                finally:
+                    await pubsub.aclose()
+        finally:
+            await client.aclose()
+
+    async def close(self):
+        """Stop the listener on shutdown"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+registry = ReferenceRegistry()
+
+
+async def current() -> ReferenceSnapshot:
+    """The loaded snapshot (loads it if this process hasn't yet)"""
+    if registry.snapshot is None:
+        await registry.reload()
+    return registry.snapshot
+
+
+async def request_reload() -> int:
+    """
+    Make every worker reload the reference tables; call after commit
+
+    Without Redis only this worker reloads. Returns the new version.
+    """
+    try:
+        redis = get_redis()
+        version = await redis.incr(VERSION_KEY)
+        await redis.publish(CHANNEL, version)
+    except RedisError as e:
+        logger.warning(f"Reference data reload not broadcast, reloading locally only: {e}")
+        version = (registry.snapshot.version if registry.snapshot else 0) + 1
+    await registry.reload(version)
+    return version
@@ -0,0 +1,203 @@
+"""
+Referral Commission Settlement Service
+
+Settles pending ProductReferralPurchase rows of completed orders. For each
+purchase the product owner pays the commission from the main balance and
+the referrer gets it on the referral balance. If the owner can't cover it,
+the purchase fails.
+
+A batch of any number of orders takes a fixed number of statements:
+1. Claim the pending purchases (FOR UPDATE SKIP LOCKED, so concurrent
+   settlers never take the same purchase)
+2. Create missing wallets (INSERT ... ON CONFLICT DO NOTHING)
+3. Lock all involved wallets in user_id order, so settlers can't deadlock
+4. Apply every balance delta with one UPDATE (app.services.ledger)
+5. Insert all ledger entries with one multi-row INSERT, keyed by purchase
+6. Mark purchases completed / failed with one UPDATE each
+7. Move the amounts from pending to earned in referral_stats (one upsert)
+
+Purchases are applied in created_at order and an owner's running balance is
+checked before each one, matching the old per-purchase loop.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List
+from uuid import UUID
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.order import Order
+from app.models.product import Product
+from app.models.wallet import Wallet, Transaction, ProductReferralPurchase
+from app.services.ledger import LedgerEntry, apply_balance_deltas, ensure_wallets, entry_row
+from app.services.referral_stats import record_settlement
+
+logger = logging.getLogger(__name__)
+
+
+async def settle_orders(db: AsyncSession, order_ids: List[UUID]) -> dict:
+    """
+    Settle referral commissions of completed orders
+
+    Does not commit - runs in the caller's transaction.
+
+    Returns:
+        dict: Statistics (completed, failed, amount)
+    """
+    stats = {"completed": 0, "failed": 0, "amount": Decimal(0)}
+    if not order_ids:
+        return stats
+
+    # 1. Claim pending purchases with their product owner and order number
+    claimed = await db.execute(
+        select(
+            ProductReferralPurchase.id,
+            ProductReferralPurchase.referrer_id,
+            ProductReferralPurchase.commission_amount,
+            ProductReferralPurchase.order_id,
+            Product.seller_id,
+            Order.order_number,
+        )
+        .join(Product, Product.id == ProductReferralPurchase.product_id)
+        .join(Order, Order.id == ProductReferralPurchase.order_id)
+        .where(
+            ProductReferralPurchase.order_id.in_(order_ids),
+            ProductReferralPurchase.status == "pending",
+            Order.status == "completed",
+        )
+        .order_by(ProductReferralPurchase.created_at, ProductReferralPurchase.id)
+        .with_for_update(of=ProductReferralPurchase, skip_locked=True)
+    )
+    purchases = claimed.all()
+    if not purchases:
+        return stats
+
+    user_ids = sorted({p.seller_id for p in purchases} | {p.referrer_id for p in purchases})
+
+    # 2. Wallets that don't exist yet start at zero
+    await ensure_wallets(db, user_ids)
+
+    # 3. Lock wallets in a deterministic order
+    wallets_result = await db.execute(
+        select(Wallet.user_id, Wallet.main_balance)
+        .where(Wallet.user_id.in_(user_ids))
+        .order_by(Wallet.user_id)
+        .with_for_update()
+    )
+    main_balances: Dict[UUID, Decimal] = {
+        user_id: Decimal(balance or 0) for user_id, balance in wallets_result.all()
+    }
+
+    main_deltas: Dict[UUID, Decimal] = defaultdict(Decimal)
+    referral_deltas: Dict[UUID, Decimal] = defaultdict(Decimal)
+    completed_ids, failed_ids, ledger = [], [], []
+    now = datetime.utcnow()
+
+    for purchase in purchases:
+        amount = Decimal(purchase.commission_amount)
+        owner_id = purchase.seller_id
+
+        # Check if owner has enough balance to pay commission
+        if main_balances[owner_id] + main_deltas[owner_id] < amount:
+            failed_ids.append(purchase.id)
+            continue
+
+        main_deltas[owner_id] -= amount
+        referral_deltas[purchase.referrer_id] += amount
+        completed_ids.append(purchase.id)
+
+        ledger.append(entry_row(
+            LedgerEntry(
+                user_id=owner_id,
+                balance_type="main",
+                delta=-amount,
+                type="product_referral_commission_deducted",
+                description=f"Комиссия реферальной программы за товар (заказ {purchase.order_number})",
+                reference_id=purchase.order_id,
+            ),
+            f"referral-purchase:{purchase.id}:debit",
+            now,
+        ))
+        ledger.append(entry_row(
+            LedgerEntry(
+                user_id=purchase.referrer_id,
+                balance_type="referral",
+                delta=amount,
+                type="product_referral_commission",
+                description=f"Комиссия за реферальную покупку товара (заказ {purchase.order_number})",
+                reference_id=purchase.order_id,
+            ),
+            f"referral-purchase:{purchase.id}:credit",
+            now,
+        ))
+        stats["amount"] += amount
+
+    # 4. All balance changes in one statement
+    if completed_ids:
+        await apply_balance_deltas(db, main_deltas, referral_deltas)
+
+        # 5. Ledger rows in bulk
+        await db.execute(insert(Transaction), ledger)
+
+    # 6. Purchase statuses
+    if completed_ids:
+        await db.execute(
+            update(ProductReferralPurchase)
+            .where(ProductReferralPurchase.id.in_(completed_ids))
+            .values(status="completed", completed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    if failed_ids:
+        await db.execute(
+            update(ProductReferralPurchase)
+            .where(ProductReferralPurchase.id.in_(failed_ids))
+            .values(status="failed", completed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+    # 7. Referrer totals
+    await record_settlement(db, purchases, completed_ids)
+
+    stats["completed"] = len(completed_ids)
+    stats["failed"] = len(failed_ids)
+    logger.info(f"Settled referral commissions for {len(order_ids)} orders: {stats}")
+    return stats
+
+
+async def settle_pending_orders(db: AsyncSession, batch_size: int = 500) -> dict:
+    """
+    Settle every completed order that still has pending referral purchases
+
+    Safety net for orders whose settlement task was never enqueued or failed.
+    Commits after each batch.
+    """
+    totals = {"orders": 0, "completed": 0, "failed": 0, "amount": Decimal(0)}
+    while True:
+        result = await db.execute(
+            select(ProductReferralPurchase.order_id)
+            .join(Order, Order.id == ProductReferralPurchase.order_id)
+            .where(
+                ProductReferralPurchase.status == "pending",
+                Order.status == "completed",
+            )
+            .distinct()
+            .limit(batch_size)
+        )
+        order_ids = [order_id for (order_id,) in result.all()]
+        if not order_ids:
+            break
+
+        stats = await settle_orders(db, order_ids)
+        await db.commit()
+
+        totals["orders"] += len(order_ids)
+        for key in ("completed", "failed", "amount"):
+            totals[key] += stats[key]
+        if not stats["completed"] and not stats["failed"]:
+            # Everything left is locked by another settler
+            break
+
+    return totals
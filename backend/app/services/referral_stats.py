@@ -0,0 +1,149 @@
+"""
+Referral Statistics Service
+
+referral_stats keeps one row of totals per referrer, so the partner and
+profile pages read their numbers by primary key instead of aggregating
+users, referral_earnings and transactions on every call.
+
+Counters are adjusted in the transaction of the event that changes them:
+- signup with a referral code: referrals_count and active_referrals + 1
+- top-up of a referred user: topup_earnings + cashback
+- order placed with referral links: pending_earnings + commission
+- settlement: pending_earnings - commission, commission_earnings + paid part
+- order cancelled: its pending purchases are cancelled, pending_earnings -
+
+Referrals become inactive by time (referral_expires_at), not by an event;
+recount_expired() fixes active_referrals of referrers whose referrals
+expired recently and runs periodically.
+
+All adjustments are one upsert with rows in referrer_id order. Nothing here
+commits.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+from app.models.wallet import ProductReferralPurchase, ReferralStats
+
+COUNTERS = ("referrals_count", "active_referrals", "topup_earnings", "commission_earnings", "pending_earnings")
+
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[UUID, Dict[str, object]]):
+    """
+    Add deltas to the referrers' counters (one upsert)
+
+    deltas: {referrer_id: {counter: delta}}; missing counters are 0.
+    """
+    rows = [
+        {"referrer_id": referrer_id, **{name: counters.get(name, 0) for name in COUNTERS}}
+        for referrer_id, counters in sorted(deltas.items())
+        if referrer_id is not None and any(counters.values())
+    ]
+    if not rows:
+        return
+    stmt = insert(ReferralStats).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[ReferralStats.referrer_id],
+        set_={
+            **{name: getattr(ReferralStats, name) + getattr(stmt.excluded, name) for name in COUNTERS},
+            "updated_at": func.now(),
+        },
+    ))
+
+
+async def record_signup(db: AsyncSession, referrer_id: Optional[UUID]):
+    """A user signed up with referrer_id's code"""
+    if referrer_id:
+        await apply_deltas(db, {referrer_id: {"referrals_count": 1, "active_referrals": 1}})
+
+
+async def record_topup_cashback(db: AsyncSession, referrer_id: UUID, amount: Decimal):
+    await apply_deltas(db, {referrer_id: {"topup_earnings": amount}})
+
+
+async def record_pending_purchases(db: AsyncSession, purchase_rows: Iterable[dict]):
+    """New ProductReferralPurchase rows (insert values) are pending commission"""
+    deltas: Dict[UUID, Dict[str, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+    for row in purchase_rows:
+        deltas[row["referrer_id"]]["pending_earnings"] += Decimal(row["commission_amount"])
+    await apply_deltas(db, deltas)
+
+
+async def record_settlement(db: AsyncSession, purchases: List, completed_ids: Iterable[UUID]):
+    """
+    Settled purchases leave pending; the completed ones become earnings
+
+    purchases: rows with id, referrer_id and commission_amount.
+    """
+    completed_ids = set(completed_ids)
+    deltas: Dict[UUID, Dict[str, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+    for purchase in purchases:
+        amount = Decimal(purchase.commission_amount)
+        deltas[purchase.referrer_id]["pending_earnings"] -= amount
+        if purchase.id in completed_ids:
+            deltas[purchase.referrer_id]["commission_earnings"] += amount
+    await apply_deltas(db, deltas)
+
+
+async def cancel_order_purchases(db: AsyncSession, order_id: UUID) -> int:
+    """Cancel the pending referral purchases of a cancelled order"""
+    result = await db.execute(
+        update(ProductReferralPurchase)
+        .where(
+            ProductReferralPurchase.order_id == order_id,
+            ProductReferralPurchase.status == "pending",
+        )
+        .values(status="cancelled", completed_at=datetime.utcnow())
+        .returning(ProductReferralPurchase.referrer_id, ProductReferralPurchase.commission_amount)
+        .execution_options(synchronize_session=False)
+    )
+    cancelled = result.all()
+    deltas: Dict[UUID, Dict[str, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+    for referrer_id, amount in cancelled:
+        deltas[referrer_id]["pending_earnings"] -= Decimal(amount)
+    await apply_deltas(db, deltas)
+    return len(cancelled)
+
+
+async def get_stats(db: AsyncSession, referrer_id: UUID) -> Optional[ReferralStats]:
+    """The referrer's totals (primary key lookup), None before the first referral"""
+    return await db.get(ReferralStats, referrer_id)
+
+
+async def recount_expired(db: AsyncSession, window: timedelta = timedelta(hours=2)) -> int:
+    """
+    Recount active_referrals of referrers with referrals expired within window
+
+    The recount is idempotent, so overlapping windows are harmless; run it
+    more often than window. Returns the number of referrers updated.
+    """
+    now = datetime.utcnow()
+    referrers = (
+        select(User.referred_by)
+        .where(
+            User.referred_by.isnot(None),
+            User.referral_expires_at > now - window,
+            User.referral_expires_at <= now,
+        )
+        .distinct()
+    )
+    active = (
+        select(func.count())
+        .select_from(User)
+        .where(User.referred_by == ReferralStats.referrer_id, User.referral_expires_at > now)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(ReferralStats)
+        .where(ReferralStats.referrer_id.in_(referrers))
+        .values(active_referrals=active, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
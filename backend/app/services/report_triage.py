@@ -0,0 +1,187 @@
+"""
+Report Triage
+
+Every report is still stored in `reports` (reporter contact, description),
+but moderators work per reported entity. report_targets keeps one row per
+(report_type, target_id) with:
+- reports_count (all time) and pending_reports (since the last review)
+- priority_score: the sum of REASON_WEIGHTS of the pending reports, so a
+  fraud complaint outranks a pile of "other"
+- reasons: pending reports per reason, and the latest report for display
+
+file_report() inserts the report and upserts its target in two statements.
+A reporter has at most one pending report per target (partial unique
+index), so repeating a complaint during a spam wave neither adds rows nor
+raises the score. close_target() settles a target and all its pending
+reports; the next report reopens it.
+
+The pending list is an index scan of report_targets by priority_score.
+Nothing here commits.
+"""
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, update, func, case, cast, literal, literal_column, Integer
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.report import Report, ReportTarget, ReportType, ReportReason, ReportStatus
+
+REASON_WEIGHTS = {
+    ReportReason.FRAUD: 5,
+    ReportReason.FAKE: 3,
+    ReportReason.COPYRIGHT: 3,
+    ReportReason.OFFENSIVE: 3,
+    ReportReason.INAPPROPRIATE: 2,
+    ReportReason.SPAM: 1,
+    ReportReason.OTHER: 1,
+}
+
+
+# Inline, not a bind parameter: the partial indexes (and ON CONFLICT
+# inference of the unique one) need to see the predicate in the plan
+PENDING = literal_column("'pending'")
+
+
+def _empty_reasons():
+    return literal({}, JSONB)
+
+
+async def file_report(db: AsyncSession, report_type: ReportType, target_id: UUID, **values) -> Tuple[Report, bool]:
+    """
+    Store a report and count it on its target
+
+    values: the remaining Report columns (reporter_id, reason, description, ...).
+
+    Returns:
+        tuple: (report, created). created is False when the reporter already
+        has a pending report on this target; that report is returned instead.
+    """
+    now = datetime.utcnow()
+    reason = values["reason"]
+    inserted = await db.execute(
+        insert(Report)
+        .values(
+            id=uuid.uuid4(),
+            report_type=report_type,
+            target_id=target_id,
+            status=ReportStatus.PENDING,
+            created_at=now,
+            updated_at=now,
+            **values,
+        )
+        .on_conflict_do_nothing(
+            index_elements=[Report.reporter_id, Report.report_type, Report.target_id],
+            index_where=Report.status == PENDING,
+        )
+        .returning(Report.id)
+    )
+    report_id = inserted.scalar_one_or_none()
+
+    if report_id is None:
+        existing = await db.execute(
+            select(Report).where(
+                Report.reporter_id == values["reporter_id"],
+                Report.report_type == report_type,
+                Report.target_id == target_id,
+                Report.status == ReportStatus.PENDING,
+            )
+        )
+        return existing.scalar_one(), False
+
+    weight = REASON_WEIGHTS[reason]
+    pending = ReportTarget.status == ReportStatus.PENDING
+    stmt = insert(ReportTarget).values(
+        report_type=report_type,
+        target_id=target_id,
+        status=ReportStatus.PENDING,
+        reports_count=1,
+        pending_reports=1,
+        priority_score=weight,
+        reasons={reason.value: 1},
+        last_report_id=report_id,
+        first_reported_at=now,
+        last_reported_at=now,
+    )
+    # SET expressions see the row before the update: a closed target reopens
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[ReportTarget.report_type, ReportTarget.target_id],
+        set_={
+            "reports_count": ReportTarget.reports_count + 1,
+            "pending_reports": case((pending, ReportTarget.pending_reports + 1), else_=1),
+            "priority_score": case((pending, ReportTarget.priority_score + weight), else_=weight),
+            "reasons": case(
+                (
+                    pending,
+                    ReportTarget.reasons.op("||")(func.jsonb_build_object(
+                        reason.value,
+                        func.coalesce(cast(ReportTarget.reasons[reason.value].astext, Integer), 0) + 1,
+                    )),
+                ),
+                else_=stmt.excluded.reasons,
+            ),
+            "first_reported_at": case((pending, ReportTarget.first_reported_at), else_=now),
+            "last_reported_at": now,
+            "last_report_id": report_id,
+            "status": ReportStatus.PENDING,
+            "reviewed_by": None,
+            "reviewed_at": None,
+        },
+    ))
+
+    report = await db.get(Report, report_id)
+    return report, True
+
+
+async def close_target(
+    db: AsyncSession,
+    report_type: ReportType,
+    target_id: UUID,
+    new_status: ReportStatus,
+    reviewer_id: UUID,
+    admin_notes: Optional[str] = None,
+) -> int:
+    """
+    Settle a target and all of its pending reports
+
+    Returns:
+        int: Number of reports settled
+    """
+    now = datetime.utcnow()
+    values = {"status": new_status, "reviewed_by": reviewer_id, "reviewed_at": now, "updated_at": now}
+    if admin_notes:
+        values["admin_notes"] = admin_notes
+    result = await db.execute(
+        update(Report)
+        .where(
+            Report.report_type == report_type,
+            Report.target_id == target_id,
+            Report.status == ReportStatus.PENDING,
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(ReportTarget)
+        .where(ReportTarget.report_type == report_type, ReportTarget.target_id == target_id)
+        .values(
+            status=new_status,
+            pending_reports=0,
+            priority_score=0,
+            reasons=_empty_reasons(),
+            reviewed_by=reviewer_id,
+            reviewed_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def pending_targets(report_type: Optional[ReportType] = None):
+    """Pending targets, highest priority first (served by the partial indexes)"""
+    query = select(ReportTarget).where(ReportTarget.status == PENDING)
+    if report_type is not None:
+        query = query.where(ReportTarget.report_type == report_type)
+    return query.order_by(ReportTarget.priority_score.desc(), ReportTarget.last_reported_at.desc())
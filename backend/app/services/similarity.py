@@ -0,0 +1,143 @@
+"""
+Item-to-Item Similarity Service
+
+Builds a sparse user x product interaction matrix from view_history and
+favorites, computes cosine similarity between product columns and keeps the
+top-K neighbours of every product in product_similarities.
+
+NumPy/SciPy are imported inside build_product_similarities so the API
+workers never load them - only the Celery worker running the job does.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, func, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.product import Product
+from app.models.favorite import Favorite, ViewHistory
+from app.models.recommendation import ProductSimilarity
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT when saving neighbours
+INSERT_CHUNK_SIZE = 5000
+# Products per block of the X^T X product (bounds peak memory)
+SIMILARITY_BLOCK_SIZE = 2000
+
+
+async def _load_interactions(db: AsyncSession, since: datetime) -> Dict[Tuple, float]:
+    """Aggregate (user_id, product_id) -> weight from views and favorites"""
+    weights: Dict[Tuple, float] = {}
+
+    views = await db.stream(
+        select(ViewHistory.user_id, ViewHistory.product_id, func.count().label("views"))
+        .where(ViewHistory.viewed_at >= since)
+        .group_by(ViewHistory.user_id, ViewHistory.product_id)
+    )
+    async for user_id, product_id, count in views:
+        weights[(user_id, product_id)] = float(count)
+
+    favorites = await db.stream(
+        select(Favorite.user_id, Favorite.product_id)
+    )
+    async for user_id, product_id in favorites:
+        key = (user_id, product_id)
+        weights[key] = weights.get(key, 0.0) + settings.SIMILARITY_FAVORITE_WEIGHT
+
+    return weights
+
+
+def _top_k_neighbours(weights: Dict[Tuple, float], product_ids: List, active: set, top_k: int) -> List[dict]:
+    """Cosine top-K over the sparse interaction matrix"""
+    import numpy as np
+    from scipy import sparse
+
+    product_index = {product_id: i for i, product_id in enumerate(product_ids)}
+    user_index: Dict = {}
+    rows, cols, data = [], [], []
+    for (user_id, product_id), weight in weights.items():
+        rows.append(user_index.setdefault(user_id, len(user_index)))
+        cols.append(product_index[product_id])
+        data.append(weight)
+
+    # log1p dampens repeated views of the same product by one user
+    matrix = sparse.csr_matrix(
+        (np.log1p(np.asarray(data, dtype=np.float32)), (rows, cols)),
+        shape=(len(user_index), len(product_ids)),
+    )
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = (matrix @ sparse.diags(inverse)).tocsc()
+    normalized_t = normalized.T.tocsr()
+
+    is_active = np.array([product_id in active for product_id in product_ids], dtype=bool)
+    computed_at = datetime.utcnow()
+    neighbours = []
+
+    for start in range(0, len(product_ids), SIMILARITY_BLOCK_SIZE):
+        block = (normalized_t[start:start + SIMILARITY_BLOCK_SIZE] @ normalized).tocsr()
+        for offset in range(block.shape[0]):
+            item = start + offset
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            indices = block.indices[lo:hi]
+            scores = block.data[lo:hi]
+
+            keep = (indices != item) & is_active[indices] & (scores > 0)
+            indices, scores = indices[keep], scores[keep]
+            if not len(indices):
+                continue
+
+            if len(indices) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                indices, scores = indices[best], scores[best]
+            order = np.argsort(-scores)
+
+            for rank, position in enumerate(order, start=1):
+                neighbours.append({
+                    "product_id": product_ids[item],
+                    "rank": rank,
+                    "neighbor_id": product_ids[indices[position]],
+                    "score": float(scores[position]),
+                    "computed_at": computed_at,
+                })
+
+    return neighbours
+
+
+async def build_product_similarities(db: AsyncSession) -> dict:
+    """
+    Rebuild product_similarities from recent interactions
+
+    The table is replaced inside one transaction, so readers keep seeing the
+    previous neighbours until the new set is committed.
+
+    Returns:
+        dict: Statistics about the build
+    """
+    since = datetime.utcnow() - timedelta(days=settings.SIMILARITY_LOOKBACK_DAYS)
+    weights = await _load_interactions(db, since)
+
+    product_ids = sorted({product_id for _, product_id in weights})
+    active_result = await db.execute(
+        select(Product.id).where(Product.status == "active")
+    )
+    active = {product_id for (product_id,) in active_result.all()}
+
+    neighbours = _top_k_neighbours(weights, product_ids, active, settings.SIMILARITY_TOP_K) if product_ids else []
+
+    await db.execute(delete(ProductSimilarity))
+    for i in range(0, len(neighbours), INSERT_CHUNK_SIZE):
+        await db.execute(insert(ProductSimilarity), neighbours[i:i + INSERT_CHUNK_SIZE])
+    await db.commit()
+
+    stats = {
+        "interactions": len(weights),
+        "products": len(product_ids),
+        "neighbours": len(neighbours),
+    }
+    logger.info(f"Rebuilt product similarities: {stats}")
+    return stats
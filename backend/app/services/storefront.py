@@ -0,0 +1,272 @@
+"""
+Seller Storefront
+
+Everything the storefront page shows, in two queries:
+1. Header: profile, user, active product count, rating average and the
+   0-10 distribution (scalar subqueries of one SELECT).
+2. Lists: the newest products and reviews, each aggregated to JSON by a
+   scalar subquery of one SELECT.
+City and market names come from the reference registry.
+
+Responses are cached in Redis per seller and parameters, keyed by the
+seller's storefront version. invalidate() bumps the version after product,
+review and profile writes, so stale entries are never read again and simply
+expire (STOREFRONT_CACHE_TTL). The ETag is a hash of the body; a matching
+If-None-Match is answered from the cache without a query. The endpoint
+reads through get_read_db, so with replicas configured cache hits and
+misses stay off the primary (a miss right after a write may be built from
+a replica up to REPLICA_MAX_LAG_SECONDS behind).
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Iterable, Optional, Tuple, Union
+from uuid import UUID
+
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+from sqlalchemy import select, func, literal_column
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.order import Order
+from app.models.product import Product
+from app.models.review import Review
+from app.models.user import User, SellerProfile
+from app.services.reference_data import current as current_reference_data
+
+logger = logging.getLogger(__name__)
+
+
+def _version_key(seller_id) -> str:
+    return f"storefront:version:{seller_id}"
+
+
+def _body_key(seller_id, version: int, products_limit: int, reviews_limit: int) -> str:
+    return f"storefront:{seller_id}:{version}:{products_limit}:{reviews_limit}"
+
+
+def _empty_json_array():
+    return literal_column("'[]'::json", JSON)
+
+
+async def _header(db: AsyncSession, seller_id: UUID):
+    active_products = (
+        select(func.count())
+        .where(Product.seller_id == seller_id, Product.status == "active")
+        .scalar_subquery()
+    )
+    seller_reviews = Review.seller_id == seller_id
+    average_rating = select(func.avg(Review.rating)).where(seller_reviews).scalar_subquery()
+    total_reviews = select(func.count()).where(seller_reviews).scalar_subquery()
+    per_rating = (
+        select(Review.rating.label("rating"), func.count().label("count"))
+        .where(seller_reviews)
+        .group_by(Review.rating)
+        .subquery()
+    )
+    distribution = select(
+        func.json_object_agg(per_rating.c.rating, per_rating.c.count, type_=JSON)
+    ).scalar_subquery()
+
+    result = await db.execute(
+        select(
+            SellerProfile,
+            User.tariff,
+            active_products.label("products_count"),
+            average_rating.label("average_rating"),
+            total_reviews.label("total_reviews"),
+            distribution.label("distribution"),
+        )
+        .join(User, User.id == SellerProfile.user_id)
+        .where(SellerProfile.user_id == seller_id)
+    )
+    return result.one_or_none()
+
+
+async def _lists(db: AsyncSession, seller_id: UUID, products_limit: int, reviews_limit: int):
+    promoted = func.coalesce(Product.promotion_views_remaining, 0)
+    recent_products = (
+        select(
+            Product.id, Product.title, Product.price, Product.discount_price, Product.images,
+            Product.views_count, Product.created_at, promoted.label("promotion_views"),
+        )
+        .where(Product.seller_id == seller_id, Product.status == "active")
+        .order_by(promoted.desc(), Product.created_at.desc())
+        .limit(products_limit)
+        .subquery()
+    )
+    products_json = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "id", recent_products.c.id,
+                        "title", recent_products.c.title,
+                        "price", recent_products.c.price,
+                        "discount_price", recent_products.c.discount_price,
+                        "images", func.coalesce(recent_products.c.images, literal_column("'[]'::jsonb")),
+                        "is_promoted", recent_products.c.promotion_views > 0,
+                        "views_count", recent_products.c.views_count,
+                    ),
+                    recent_products.c.promotion_views.desc(),
+                    recent_products.c.created_at.desc(),
+                ),
+                type_=JSON,
+            ),
+            _empty_json_array(),
+        )
+    ).scalar_subquery()
+
+    recent_reviews = (
+        select(
+            Review.id, Review.buyer_id, Review.order_id, Review.rating, Review.comment, Review.created_at,
+            User.full_name.label("buyer_name"), Order.order_number,
+        )
+        .outerjoin(User, User.id == Review.buyer_id)
+        .outerjoin(Order, Order.id == Review.order_id)
+        .where(Review.seller_id == seller_id)
+        .order_by(Review.created_at.desc())
+        .limit(reviews_limit)
+        .subquery()
+    )
+    reviews_json = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "id", recent_reviews.c.id,
+                        "buyer_id", recent_reviews.c.buyer_id,
+                        "buyer_name", recent_reviews.c.buyer_name,
+                        "order_id", recent_reviews.c.order_id,
+                        "order_number", recent_reviews.c.order_number,
+                        "rating", recent_reviews.c.rating,
+                        "comment", recent_reviews.c.comment,
+                        "created_at", recent_reviews.c.created_at,
+                    ),
+                    recent_reviews.c.created_at.desc(),
+                ),
+                type_=JSON,
+            ),
+            _empty_json_array(),
+        )
+    ).scalar_subquery()
+
+    return (await db.execute(select(products_json, reviews_json))).one()
+
+
+async def build_storefront(db: AsyncSession, seller_id: UUID, products_limit: int, reviews_limit: int) -> Optional[dict]:
+    """The storefront of a seller, or None if there is no seller profile"""
+    header = await _header(db, seller_id)
+    if header is None:
+        return None
+    profile, tariff, products_count, average_rating, total_reviews, distribution = header
+    products, reviews = await _lists(db, seller_id, products_limit, reviews_limit)
+    refs = await current_reference_data()
+
+    rating_distribution = {str(i): 0 for i in range(11)}
+    rating_distribution.update({str(rating): count for rating, count in (distribution or {}).items()})
+
+    return {
+        "profile": {
+            "id": str(profile.id),
+            "user_id": str(profile.user_id),
+            "shop_name": profile.shop_name,
+            "description": profile.description,
+            "banner_url": profile.banner_url,
+            "logo_url": profile.logo_url,
+            "city_id": profile.city_id,
+            "city_name": refs.city_name(profile.city_id),
+            "seller_type": profile.seller_type,
+            "market_id": profile.market_id,
+            "market_name": refs.market_name(profile.market_id),
+            "address": profile.address,
+            "latitude": float(profile.latitude) if profile.latitude is not None else None,
+            "longitude": float(profile.longitude) if profile.longitude is not None else None,
+            "is_verified": profile.is_verified,
+            "created_at": profile.created_at,
+            "user_tariff": tariff,
+        },
+        "rating": {
+            "average_rating": float(average_rating) if average_rating else 0.0,
+            "total_reviews": total_reviews or 0,
+            "rating_distribution": rating_distribution,
+        },
+        "products": {
+            "items": products,
+            "total": products_count or 0,
+        },
+        "reviews": {
+            "items": reviews,
+            "total": total_reviews or 0,
+        },
+    }
+
+
+def _etag(body: bytes) -> str:
+    return f'W/"{hashlib.sha1(body).hexdigest()}"'
+
+
+async def _current_version(redis, seller_id) -> int:
+    key = _version_key(seller_id)
+    version = await redis.get(key)
+    if version is None:
+        # Start from the clock, not 0: after a Redis flush old cache keys
+        # must not come back under a reused version
+        await redis.set(key, time.time_ns(), nx=True)
+        version = await redis.get(key)
+    return int(version)
+
+
+async def get_storefront(
+    db: AsyncSession, seller_id: UUID, products_limit: int, reviews_limit: int
+) -> Optional[Tuple[bytes, str]]:
+    """
+    (JSON body, ETag) of a storefront, from the cache when possible
+
+    Returns None if the seller has no profile. Works without Redis (no cache).
+    """
+    redis, key = None, None
+    try:
+        redis = get_redis()
+        version = await _current_version(redis, seller_id)
+        key = _body_key(seller_id, version, products_limit, reviews_limit)
+        cached = await redis.get(key)
+        if cached is not None:
+            cached = json.loads(cached)
+            return cached["body"].encode(), cached["etag"]
+    except RedisError as e:
+        logger.warning(f"Storefront cache unavailable: {e}")
+        redis = None
+
+    storefront = await build_storefront(db, seller_id, products_limit, reviews_limit)
+    if storefront is None:
+        return None
+    body = json.dumps(jsonable_encoder(storefront), ensure_ascii=False, separators=(",", ":"))
+    etag = _etag(body.encode())
+
+    if redis is not None:
+        try:
+            await redis.set(key, json.dumps({"etag": etag, "body": body}), ex=settings.STOREFRONT_CACHE_TTL)
+        except RedisError as e:
+            logger.warning(f"Storefront not cached: {e}")
+    return body.encode(), etag
+
+
+async def invalidate(seller_ids: Union[UUID, str, Iterable]):
+    """Drop the cached storefronts of the sellers; call after commit. Never raises."""
+    if isinstance(seller_ids, (UUID, str)):
+        seller_ids = [seller_ids]
+    keys = [_version_key(seller_id) for seller_id in dict.fromkeys(str(seller_id) for seller_id in seller_ids)]
+    if not keys:
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(key)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Storefront cache not invalidated: {e}")
@@ -17,12 +17,14 @@ import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, and_
 from sqlalchemy.orm import selectinload
 
 from app.models.user import User
 from app.models.wallet import Wallet, Transaction
 from app.models.product import Product
+from app.services.partner_offers import remove_seller as remove_seller_offers
+from app.services.storefront import invalidate as invalidate_storefront
 
 logger = logging.getLogger(__name__)
 
@@ -76,7 +78,9 @@ async def check_and_renew_tariffs(db: AsyncSession) -> dict:
                 logger.error(f"Error processing tariff renewal for user {user.id}: {e}")
                 stats["errors"] += 1
 
+        downgraded_ids = [user.id for user in expired_users if user.tariff == "free"]
         await db.commit()
+        await invalidate_storefront(downgraded_ids)  # Storefronts show the tariff
 
     except Exception as e:
         logger.error(f"Error in check_and_renew_tariffs: {e}")
@@ -143,25 +147,21 @@ async def disable_business_features(db: AsyncSession, user: User):
     Disable Business tariff features when user is downgraded
 
     - Disable is_referral_enabled on all user's products
-    - Set referral_commission_percent to 0
+    - Clear referral_commission_percent
+    - Drop the products from the partner catalog
     """
     # Disable referral program on all user's products
     result = await db.execute(
-        select(Product).where(
-            and_(
-                Product.seller_id == user.id,
-                Product.is_referral_enabled == True
-            )
+        update(Product)
+        .where(
+            Product.seller_id == user.id,
+            Product.is_referral_enabled == True
         )
+        .values(is_referral_enabled=False, referral_commission_percent=None)
+        .execution_options(synchronize_session=False)
     )
-    products = result.scalars().all()
-
-    disabled_count = 0
-    for product in products:
-        product.is_referral_enabled = False
-        product.referral_commission_percent = None
-        product.referral_commission_amount = None
-        disabled_count += 1
+    disabled_count = result.rowcount
+    await remove_seller_offers(db, user.id)
 
     logger.info(f"Disabled referral program on {disabled_count} products for user {user.id}")
 
@@ -0,0 +1,144 @@
+"""
+Admin User Directory
+
+Search and filters for the admin user list:
+- q matches email, full name or phone as a substring (ILIKE '%q%'); the
+  trigram GIN indexes on the three columns serve it from 3 characters on
+- role, tariff and ban status are equality filters on composite indexes
+  that end in the listing order (created_at DESC, id DESC)
+
+Pages are keyset-paginated: the cursor is the (created_at, id) of the last
+row, so page N costs the same as page 1 and rows don't shift between pages
+while users sign up. export_rows() streams the same selection through a
+server-side cursor for CSV export.
+"""
+import base64
+import csv
+import io
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.config import settings
+from app.models.user import User
+
+EXPORT_COLUMNS = [
+    "id", "email", "full_name", "phone", "role", "tariff", "tariff_expires_at",
+    "is_banned", "ban_reason", "referral_id", "created_at",
+]
+
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class InvalidCursorError(Exception):
+    """Raised when a pagination cursor can't be decoded"""
+
+    def __init__(self, detail: str = "Invalid cursor"):
+        self.detail = detail
+        super().__init__(detail)
+
+
+@dataclass(frozen=True)
+class UserFilter:
+    q: Optional[str] = None
+    role: Optional[str] = None
+    tariff: Optional[str] = None
+    is_banned: Optional[bool] = None
+
+
+def encode_cursor(user: User) -> str:
+    raw = f"{user.created_at.isoformat()}|{user.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, user_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(user_id)
+    except ValueError:
+        raise InvalidCursorError()
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _query(filters: UserFilter):
+    query = select(User)
+    if filters.q and filters.q.strip():
+        pattern = f"%{_escape_like(filters.q.strip())}%"
+        query = query.where(or_(
+            User.email.ilike(pattern, escape="\\"),
+            User.full_name.ilike(pattern, escape="\\"),
+            User.phone.ilike(pattern, escape="\\"),
+        ))
+    if filters.role:
+        query = query.where(User.role == filters.role)
+    if filters.tariff:
+        query = query.where(User.tariff == filters.tariff)
+    if filters.is_banned is not None:
+        query = query.where(User.is_banned == filters.is_banned)
+    return query.order_by(User.created_at.desc(), User.id.desc())
+
+
+async def search_users(
+    db: AsyncSession, filters: UserFilter, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[User], Optional[str]]:
+    """
+    One page of users, newest first
+
+    Returns:
+        tuple: (users, cursor of the next page or None on the last page)
+    """
+    query = _query(filters)
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        query = query.where(tuple_(User.created_at, User.id) < (created_at, user_id))
+
+    users = (await db.execute(query.limit(limit + 1))).scalars().all()
+    if len(users) <= limit:
+        return list(users), None
+    users = users[:limit]
+    return list(users), encode_cursor(users[-1])
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Names and emails are user input: don't let spreadsheets run them as formulas
+        return "'" + value
+    return value
+
+
+async def export_rows(bind: AsyncEngine, filters: UserFilter) -> AsyncIterator[str]:
+    """
+    CSV of every matching user, chunk by chunk
+
+    Runs on its own connection from bind: the response streams after the
+    request's session is closed. Rows come through a server-side cursor,
+    ADMIN_USERS_EXPORT_CHUNK_SIZE at a time, so memory use doesn't grow
+    with the number of users.
+    """
+    chunk_size = settings.ADMIN_USERS_EXPORT_CHUNK_SIZE
+    columns = [getattr(User, name) for name in EXPORT_COLUMNS]
+    query = _query(filters).with_only_columns(*columns)
+
+    yield _csv_line(EXPORT_COLUMNS)
+    async with bind.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions(chunk_size):
+            yield "".join(_csv_line([_csv_value(value) for value in row]) for row in rows)
@@ -1,7 +1,11 @@
 """
 Background Tasks for Celery
 """
+from app.tasks.recommendations import build_product_similarities_task
+from app.tasks.referrals import settle_referral_commissions_task, settle_pending_referral_commissions_task, recount_expired_referrals_task
+from app.tasks.wallet import build_wallet_balance_snapshots_task
+from app.tasks.notifications import run_notification_fanout_task
+from app.tasks.moderation import moderate_product_images_task, index_product_duplicates_task, index_pending_duplicates_task
+from app.tasks.catalog import reconcile_catalog_facets_task
 # from app.tasks.promotions import check_expired_promotions
 # from app.tasks.withdrawals import process_withdrawals
-
-# Example tasks (create as needed)
@@ -0,0 +1,30 @@
+"""
+Helpers for running async service code from Celery tasks
+"""
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+
+
+def run_with_session(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """
+    Run `func(session, *args, **kwargs)` in a fresh event loop
+
+    Celery tasks are synchronous and every asyncio.run() creates a new loop, so
+    the API's pooled engine can't be reused here - asyncpg connections are bound
+    to the loop that opened them. Each task run gets its own unpooled engine.
+    """
+    async def runner():
+        engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with session_factory() as session:
+                return await func(session, *args, **kwargs)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(runner())
@@ -0,0 +1,18 @@
+"""
+Catalog Tasks
+"""
+from app.celery_app import celery_app
+from app.services.catalog_facets import reconcile as reconcile_facets
+from app.tasks.base import run_with_session
+
+
+async def _reconcile_facets_and_commit(db) -> int:
+    rows = await reconcile_facets(db)
+    await db.commit()
+    return rows
+
+
+@celery_app.task(name="app.tasks.reconcile_catalog_facets")
+def reconcile_catalog_facets_task():
+    """Periodic full recount of the catalog facet counts and price buckets"""
+    return {"facets": run_with_session(_reconcile_facets_and_commit)}
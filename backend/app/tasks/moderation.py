@@ -0,0 +1,71 @@
+"""
+Moderation Tasks
+"""
+import logging
+from uuid import UUID
+
+from app.celery_app import celery_app
+from app.core.redis import close_redis
+from app.services.image_moderation import get_classifier, moderate_pending
+from app.services.duplicate_detection import index_pending, index_product
+from app.tasks.base import run_with_session
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCHES_PER_RUN = 20
+
+
+async def _moderate_images(db) -> dict:
+    totals = {"checked": 0, "approved": 0, "rejected": 0, "review": 0}
+    classifier = get_classifier()
+    try:
+        for _ in range(MAX_BATCHES_PER_RUN):
+            stats = await moderate_pending(db, classifier=classifier)
+            if not stats["checked"]:
+                break
+            for key in totals:
+                totals[key] += stats[key]
+    finally:
+        # The shared Redis client is bound to this task's event loop
+        await close_redis()
+    return totals
+
+
+@celery_app.task(name="app.tasks.moderate_product_images")
+def moderate_product_images_task():
+    """Run new products' images through the image classifier"""
+    return run_with_session(_moderate_images)
+
+
+def enqueue_image_moderation():
+    """Check new products right away instead of waiting for the beat run"""
+    try:
+        moderate_product_images_task.delay()
+    except Exception as e:
+        logger.error(f"Could not enqueue image moderation: {e}")
+
+
+async def _index_product(db, product_id: UUID) -> int:
+    duplicates = await index_product(db, product_id)
+    await db.commit()
+    return len(duplicates)
+
+
+@celery_app.task(name="app.tasks.index_product_duplicates")
+def index_product_duplicates_task(product_id: str):
+    """Fingerprint a created or edited listing and flag its near-duplicates"""
+    return run_with_session(_index_product, UUID(product_id))
+
+
+@celery_app.task(name="app.tasks.index_pending_duplicates")
+def index_pending_duplicates_task():
+    """Catch up on listings whose fingerprint is missing or outdated"""
+    return run_with_session(index_pending)
+
+
+def enqueue_duplicate_check(product_id: UUID):
+    """Queue duplicate detection for a listing after it is committed"""
+    try:
+        index_product_duplicates_task.delay(str(product_id))
+    except Exception as e:
+        logger.error(f"Could not enqueue duplicate check for {product_id}: {e}")
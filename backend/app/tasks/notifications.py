@@ -0,0 +1,39 @@
+"""
+Notification Tasks
+"""
+import logging
+from uuid import UUID
+
+from app.celery_app import celery_app
+from app.core.redis import close_redis
+from app.services.notification_fanout import run_fanout
+from app.tasks.base import run_with_session
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_fanout(db, fanout_id: UUID) -> dict:
+    try:
+        return await run_fanout(db, fanout_id)
+    finally:
+        # The shared Redis client is bound to this task's event loop
+        await close_redis()
+
+
+@celery_app.task(
+    name="app.tasks.run_notification_fanout",
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def run_notification_fanout_task(fanout_id: str):
+    """Deliver a bulk notification job (resumes where a failed run stopped)"""
+    return run_with_session(_run_fanout, UUID(fanout_id))
+
+
+def enqueue_fanout(fanout_id: UUID):
+    """Queue a fan-out job after it is committed"""
+    try:
+        run_notification_fanout_task.delay(str(fanout_id))
+    except Exception as e:
+        logger.error(f"Could not enqueue notification fan-out {fanout_id}: {e}")
@@ -0,0 +1,12 @@
+"""
+Recommendation Tasks
+"""
+from app.celery_app import celery_app
+from app.services.similarity import build_product_similarities
+from app.tasks.base import run_with_session
+
+
+@celery_app.task(name="app.tasks.build_product_similarities")
+def build_product_similarities_task():
+    """Rebuild item-to-item neighbours for /recommendations/similar"""
+    return run_with_session(build_product_similarities)
@@ -0,0 +1,78 @@
+"""
+Referral Commission Tasks
+"""
+import logging
+from typing import Iterable, List
+from uuid import UUID
+
+from app.celery_app import celery_app
+from app.services.notification_fanout import create_fanout
+from app.services.referral_settlement import settle_orders, settle_pending_orders
+from app.services.referral_stats import recount_expired
+from app.tasks.base import run_with_session
+from app.tasks.notifications import enqueue_fanout
+
+logger = logging.getLogger(__name__)
+
+
+async def _settle_and_commit(db, order_ids: List[UUID]) -> dict:
+    stats = await settle_orders(db, order_ids)
+    fanout = None
+    if stats["completed"]:
+        # Paid referrers of the batch hear about it in one bulk job
+        fanout = await create_fanout(
+            db,
+            audience="settlement_referrers",
+            params={"order_ids": [str(order_id) for order_id in order_ids]},
+            type="wallet",
+            title="Реферальная комиссия начислена",
+            message="На ваш реферальный баланс поступила комиссия за покупку по вашей ссылке.",
+        )
+    await db.commit()
+    if fanout:
+        enqueue_fanout(fanout.id)
+    return stats
+
+
+@celery_app.task(
+    name="app.tasks.settle_referral_commissions",
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def settle_referral_commissions_task(order_ids: List[str]):
+    """Settle referral commissions of the given completed orders"""
+    stats = run_with_session(_settle_and_commit, [UUID(order_id) for order_id in order_ids])
+    return {**stats, "amount": str(stats["amount"])}
+
+
+@celery_app.task(name="app.tasks.settle_pending_referral_commissions")
+def settle_pending_referral_commissions_task():
+    """Periodic sweep for completed orders that still have pending commissions"""
+    stats = run_with_session(settle_pending_orders)
+    return {**stats, "amount": str(stats["amount"])}
+
+
+async def _recount_and_commit(db) -> int:
+    updated = await recount_expired(db)
+    await db.commit()
+    return updated
+
+
+@celery_app.task(name="app.tasks.recount_expired_referrals")
+def recount_expired_referrals_task():
+    """Periodic recount of active referrals for referrers whose referrals just expired"""
+    return {"referrers": run_with_session(_recount_and_commit)}
+
+
+def enqueue_settlement(order_ids: Iterable[UUID]):
+    """
+    Queue settlement after the order status change is committed
+
+    If the broker is unreachable the periodic sweep settles the order later.
+    """
+    order_ids = [str(order_id) for order_id in order_ids]
+    try:
+        settle_referral_commissions_task.delay(order_ids)
+    except Exception as e:
+        logger.error(f"Could not enqueue referral settlement for {order_ids}: {e}")
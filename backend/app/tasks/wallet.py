@@ -0,0 +1,12 @@
+"""
+Wallet Tasks
+"""
+from app.celery_app import celery_app
+from app.services.ledger import build_balance_snapshots
+from app.tasks.base import run_with_session
+
+
+@celery_app.task(name="app.tasks.build_wallet_balance_snapshots")
+def build_wallet_balance_snapshots_task():
+    """Checkpoint wallet balances for historical balance queries"""
+    return run_with_session(build_balance_snapshots)
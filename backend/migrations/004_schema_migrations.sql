@@ -0,0 +1,57 @@
+-- =====================================================================
+-- Миграция 004: Версионирование схемы
+-- =====================================================================
+-- Описание: Схема БД больше не создаётся приложением при старте
+--          (Base.metadata.create_all удалён из lifespan). Все изменения
+--          схемы выполняются только миграциями из backend/migrations,
+--          а приложение при старте проверяет версию в schema_migrations.
+--
+--          Также создаёт таблицы, которые раньше появлялись только через
+--          create_all: referral_earnings, product_referral_purchases.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/004_schema_migrations.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS referral_earnings (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    referrer_id UUID NOT NULL REFERENCES users(id),
+    referee_id UUID NOT NULL REFERENCES users(id),
+    transaction_id UUID REFERENCES transactions(id),
+    topup_amount NUMERIC(10, 2) NOT NULL,
+    earning_amount NUMERIC(10, 2) NOT NULL,
+    status VARCHAR(20) DEFAULT 'completed',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_referral_earnings_referrer_id ON referral_earnings(referrer_id);
+CREATE INDEX IF NOT EXISTS ix_referral_earnings_created_at ON referral_earnings(created_at);
+
+CREATE TABLE IF NOT EXISTS product_referral_purchases (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    referrer_id UUID NOT NULL REFERENCES users(id),
+    buyer_id UUID NOT NULL REFERENCES users(id),
+    product_id UUID NOT NULL REFERENCES products(id),
+    order_id UUID REFERENCES orders(id),
+    commission_percent NUMERIC(5, 2) NOT NULL,
+    commission_amount NUMERIC(10, 2) NOT NULL,
+    product_price NUMERIC(10, 2) NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    completed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_referral_purchases_referrer_id ON product_referral_purchases(referrer_id);
+CREATE INDEX IF NOT EXISTS ix_product_referral_purchases_created_at ON product_referral_purchases(created_at);
+
+INSERT INTO schema_migrations (version, name)
+VALUES (4, 'schema_migrations')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- =====================================================================
+-- Миграция 005: Похожие товары (item-to-item)
+-- =====================================================================
+-- Описание: Таблица top-K соседей для каждого товара. Заполняется
+--          периодической задачей Celery build_product_similarities по
+--          совместным просмотрам (view_history) и избранному (favorites).
+--          /recommendations/similar/{id} читает её одним запросом по PK.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/005_product_similarities.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS product_similarities (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    rank SMALLINT NOT NULL,
+    neighbor_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL,
+    computed_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (product_id, rank)
+);
+
+-- Для выборки истории просмотров за окно lookback
+CREATE INDEX IF NOT EXISTS idx_view_history_viewed_at_user ON view_history(viewed_at, user_id, product_id);
+
+INSERT INTO schema_migrations (version, name)
+VALUES (5, 'product_similarities')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
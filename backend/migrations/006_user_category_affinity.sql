@@ -0,0 +1,47 @@
+-- =====================================================================
+-- Миграция 006: Интересы пользователя по категориям
+-- =====================================================================
+-- Описание: Вектор интересов пользователя по категориям для
+--          /recommendations/for-you. Обновляется при каждом просмотре
+--          товара (score с экспоненциальным затуханием, период
+--          полураспада AFFINITY_HALF_LIFE_DAYS). Заполняется из
+--          существующей истории просмотров.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/006_user_category_affinity.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS user_category_affinity (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, category_id)
+);
+
+-- Начальное заполнение: каждый просмотр затухает с периодом 30 дней
+INSERT INTO user_category_affinity (user_id, category_id, score, updated_at)
+SELECT
+    vh.user_id,
+    p.category_id,
+    SUM(POWER(0.5, EXTRACT(EPOCH FROM (NOW() - vh.viewed_at)) / (30 * 86400))),
+    NOW()
+FROM view_history vh
+JOIN products p ON p.id = vh.product_id
+WHERE p.category_id IS NOT NULL
+GROUP BY vh.user_id, p.category_id
+ON CONFLICT (user_id, category_id) DO NOTHING;
+
+-- Кандидаты по категории: активные товары в порядке продвижения и популярности
+CREATE INDEX IF NOT EXISTS idx_products_category_active_rank
+    ON products(category_id, (COALESCE(promotion_views_remaining, 0)) DESC, views_count DESC, created_at DESC)
+    WHERE status = 'active';
+
+-- Для восстановления фильтра просмотренных товаров
+CREATE INDEX IF NOT EXISTS idx_view_history_user_viewed_at ON view_history(user_id, viewed_at DESC);
+
+INSERT INTO schema_migrations (version, name)
+VALUES (6, 'user_category_affinity')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
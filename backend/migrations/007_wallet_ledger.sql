@@ -0,0 +1,80 @@
+-- =====================================================================
+-- Миграция 007: Журнал операций кошелька
+-- =====================================================================
+-- Описание: transactions становится журналом (ledger) движений средств:
+--          - balance_delta: изменение баланса balance_type со знаком
+--          - idempotency_key: ключ идемпотентности, повтор запроса
+--            с тем же ключом не списывает/не начисляет повторно
+--          - wallet_balance_snapshots: периодические снимки балансов,
+--            исторический баланс = снимок + записи журнала после него
+--          - составные индексы (user_id, type, created_at) для
+--            /wallet/transactions и /partners/earnings
+--
+--          Для старых записей balance_delta восстанавливается по type.
+--          Старые переводы (type = 'transfer') записаны одной строкой
+--          (зачисление на основной баланс): для каждого добавляется
+--          недостающее списание с реферального баланса. Начальный снимок
+--          каждого кошелька берётся из wallets на момент миграции, так что
+--          дальнейшие снимки считаются от фактических балансов.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/007_wallet_ledger.sql
+-- =====================================================================
+
+BEGIN;
+
+-- Приложение давно пишет типы, которых нет в исходном CHECK
+-- (transfer, tariff_upgrade, withdrawal_refund, product_referral_commission ...)
+ALTER TABLE transactions DROP CONSTRAINT IF EXISTS transactions_type_check;
+
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS balance_delta NUMERIC(10, 2);
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255);
+
+-- Недостающая половина старых переводов; до UPDATE ниже у старых строк
+-- balance_delta ещё NULL, поэтому повторный запуск ничего не добавит
+INSERT INTO transactions (id, user_id, type, amount, balance_delta, balance_type, description, status, created_at)
+SELECT gen_random_uuid(), t.user_id, 'transfer', t.amount, -t.amount, 'referral', t.description, t.status, t.created_at
+FROM transactions t
+WHERE t.type = 'transfer'
+  AND t.balance_delta IS NULL
+  AND COALESCE(t.balance_type, 'main') = 'main';
+
+UPDATE transactions
+SET balance_delta = CASE
+    WHEN type IN ('topup', 'transfer') THEN amount
+    WHEN type IN ('referral', 'referral_commission', 'product_referral_commission', 'withdrawal_refund') THEN amount
+    WHEN type IN ('withdrawal', 'promotion', 'tariff_upgrade', 'product_referral_commission_deducted') THEN -amount
+END
+WHERE balance_delta IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_transactions_idempotency_key
+    ON transactions(idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_type_created ON transactions(user_id, type, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at);
+
+-- Покрываются составными индексами выше
+DROP INDEX IF EXISTS idx_transactions_user_id;
+DROP INDEX IF EXISTS idx_transactions_type;
+
+CREATE TABLE IF NOT EXISTS wallet_balance_snapshots (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    taken_at TIMESTAMP NOT NULL,
+    main_balance NUMERIC(10, 2) NOT NULL DEFAULT 0,
+    referral_balance NUMERIC(10, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, taken_at)
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_balance_snapshots_taken_at ON wallet_balance_snapshots(taken_at);
+
+-- Начальные снимки из текущих балансов (время в UTC, как в приложении)
+INSERT INTO wallet_balance_snapshots (user_id, taken_at, main_balance, referral_balance)
+SELECT w.user_id, NOW() AT TIME ZONE 'UTC', COALESCE(w.main_balance, 0), COALESCE(w.referral_balance, 0)
+FROM wallets w
+WHERE NOT EXISTS (SELECT 1 FROM wallet_balance_snapshots s WHERE s.user_id = w.user_id)
+ON CONFLICT (user_id, taken_at) DO NOTHING;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (7, 'wallet_ledger')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,49 @@
+-- =====================================================================
+-- Миграция 008: Атомарные счётчики купонов
+-- =====================================================================
+-- Описание: Купоны применяются при оформлении заказа по протоколу
+--          reserve (заказ создан) -> commit (заказ выполнен) /
+--          release (заказ отменён):
+--          - coupon_user_usage: счётчик использований купона
+--            пользователем, увеличивается условным upsert
+--          - coupon_usage.status: reserved, committed, released
+--          - orders.coupon_id / discount_amount: применённая скидка
+--          - CHECK used_count <= max_uses на coupons
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/008_coupon_counters.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS coupon_user_usage (
+    coupon_id UUID NOT NULL REFERENCES coupons(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    used_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (coupon_id, user_id)
+);
+
+-- Существующие использования считаются завершёнными
+ALTER TABLE coupon_usage ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'committed';
+
+INSERT INTO coupon_user_usage (coupon_id, user_id, used_count)
+SELECT coupon_id, user_id, COUNT(*)
+FROM coupon_usage
+WHERE status <> 'released'
+GROUP BY coupon_id, user_id
+ON CONFLICT (coupon_id, user_id) DO NOTHING;
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS coupon_id UUID REFERENCES coupons(id) ON DELETE SET NULL;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS discount_amount NUMERIC(10, 2) DEFAULT 0;
+
+-- Защита от превышения лимита; NOT VALID - старые строки не проверяются
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'check_coupon_used_count') THEN
+        ALTER TABLE coupons ADD CONSTRAINT check_coupon_used_count
+            CHECK (max_uses IS NULL OR used_count <= max_uses) NOT VALID;
+    END IF;
+END $$;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (8, 'coupon_counters')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,39 @@
+-- =====================================================================
+-- Миграция 009: Счётчик непрочитанных уведомлений
+-- =====================================================================
+-- Описание: notification_counters хранит число непрочитанных
+--          уведомлений пользователя. Счётчик обновляется приложением в
+--          той же транзакции, что и вставка/прочтение/удаление
+--          уведомлений (app/services/notifications.py), поэтому бейдж
+--          читается по первичному ключу без COUNT.
+--          Составной индекс (user_id, is_read, created_at) для списка
+--          уведомлений и массового прочтения.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/009_notification_counters.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS notification_counters (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    unread_count INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO notification_counters (user_id, unread_count)
+SELECT user_id, COUNT(*)
+FROM notifications
+WHERE is_read = false
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
+
+CREATE INDEX IF NOT EXISTS idx_notifications_user_read_created
+    ON notifications(user_id, is_read, created_at DESC);
+
+-- Покрываются составным индексом
+DROP INDEX IF EXISTS idx_notifications_user_id;
+DROP INDEX IF EXISTS idx_notifications_is_read;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (9, 'notification_counters')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- =====================================================================
+-- Миграция 010: Массовые рассылки уведомлений
+-- =====================================================================
+-- Описание: notification_fanouts - задания массовой рассылки (шаблон +
+--          аудитория). Celery-воркер читает получателей курсором по
+--          возрастанию user_id и пишет уведомления пачками; last_user_id
+--          сохраняется с каждой пачкой, поэтому повтор задания
+--          продолжает с места остановки без дублей
+--          (app/services/notification_fanout.py).
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/010_notification_fanouts.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS notification_fanouts (
+    id UUID PRIMARY KEY,
+    audience VARCHAR(50) NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,
+    template JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    last_user_id UUID,
+    sent_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+INSERT INTO schema_migrations (version, name)
+VALUES (10, 'notification_fanouts')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- =====================================================================
+-- Миграция 011: Очередь модерации товаров
+-- =====================================================================
+-- Описание: Модераторы берут пачки товаров в статусе 'moderation' в
+--          аренду (SELECT ... FOR UPDATE SKIP LOCKED), поэтому двое не
+--          получают один и тот же товар (app/services/moderation_queue.py).
+--          moderation_claimed_by / moderation_lease_until - кто держит
+--          товар и до какого времени; по истечении аренды товар снова
+--          доступен. Индекс (status, created_at) обслуживает выборку
+--          самых старых ожидающих товаров.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/011_moderation_queue.sql
+-- =====================================================================
+
+BEGIN;
+
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS moderation_claimed_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    ADD COLUMN IF NOT EXISTS moderation_lease_until TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_products_status_created
+    ON products(status, created_at);
+
+-- Покрывается составным индексом
+DROP INDEX IF EXISTS idx_products_status;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (11, 'moderation_queue')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- =====================================================================
+-- Миграция 012: Автоматическая проверка изображений товаров
+-- =====================================================================
+-- Описание: Перед модератором изображения новых товаров проходят через
+--          классификатор (app/services/image_moderation.py). Локальный
+--          классификатор сравнивает перцептивные хэши (pHash/dHash) с
+--          таблицей banned_images - изображениями, запрещёнными
+--          администраторами. Хэши хранятся как знаковые 64-битные числа.
+--          Индекс по (created_at) частичный: выборка непроверенных
+--          товаров в статусе 'moderation' без ключа classifier.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/012_image_moderation.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS banned_images (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    phash BIGINT NOT NULL,
+    dhash BIGINT NOT NULL,
+    image_url VARCHAR(500),
+    reason TEXT,
+    created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_products_moderation_unchecked
+    ON products(created_at)
+    WHERE status = 'moderation' AND NOT (COALESCE(moderation_result, '{}'::jsonb) ? 'classifier');
+
+INSERT INTO schema_migrations (version, name)
+VALUES (12, 'image_moderation')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
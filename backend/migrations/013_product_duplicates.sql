@@ -0,0 +1,46 @@
+-- =====================================================================
+-- Миграция 013: Поиск дубликатов объявлений
+-- =====================================================================
+-- Описание: Для каждого активного товара и товара на модерации хранится
+--          отпечаток (product_fingerprints): pHash и dHash изображений и
+--          simhash названия. Фоновый индексатор держит отпечатки в
+--          BK-деревьях и записывает найденные пары почти одинаковых
+--          объявлений в product_duplicates (по одной строке на пару,
+--          product_id < duplicate_id). Отчёт для администраторов
+--          объединяет пары в кластеры
+--          (app/services/duplicate_detection.py).
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/013_product_duplicates.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS product_fingerprints (
+    product_id UUID PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    image_phashes BIGINT[] NOT NULL DEFAULT '{}',
+    image_dhashes BIGINT[] NOT NULL DEFAULT '{}',
+    title_simhash BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Инкрементальная синхронизация индекса в воркерах
+CREATE INDEX IF NOT EXISTS idx_product_fingerprints_updated_at
+    ON product_fingerprints(updated_at);
+
+CREATE TABLE IF NOT EXISTS product_duplicates (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    duplicate_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    match VARCHAR(20) NOT NULL,
+    distance INTEGER NOT NULL,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (product_id, duplicate_id),
+    CHECK (product_id < duplicate_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_duplicates_duplicate
+    ON product_duplicates(duplicate_id);
+
+INSERT INTO schema_migrations (version, name)
+VALUES (13, 'product_duplicates')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,32 @@
+-- =====================================================================
+-- Миграция 014: Поиск "рядом со мной"
+-- =====================================================================
+-- Описание: Фильтр near=lat,lon&radius_km= для товаров, продавцов и
+--          поиска (app/services/geo.py). Сначала ограничивающий
+--          прямоугольник (диапазон по latitude/longitude - B-tree индекс
+--          ниже, расширения PostGIS/earthdistance не нужны), затем точное
+--          расстояние по формуле гаверсинуса. Продавцы без собственных
+--          координат получают координаты своего рынка.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/014_geo_search.sql
+-- =====================================================================
+
+BEGIN;
+
+UPDATE seller_profiles sp
+SET latitude = m.latitude,
+    longitude = m.longitude
+FROM markets m
+WHERE sp.market_id = m.id
+  AND (sp.latitude IS NULL OR sp.longitude IS NULL)
+  AND m.latitude IS NOT NULL
+  AND m.longitude IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_seller_profiles_location
+    ON seller_profiles(latitude, longitude)
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (14, 'geo_search')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,85 @@
+-- =====================================================================
+-- Миграция 015: Сводная статистика рефералов
+-- =====================================================================
+-- Описание: referral_stats хранит по одной строке на реферера: число
+--          рефералов, активных рефералов, кэшбек с пополнений, выплаченные
+--          и ожидающие комиссии за товары. Счётчики обновляются
+--          приложением в транзакции события - регистрация, пополнение,
+--          оформление, завершение и отмена заказа
+--          (app/services/referral_stats.py). Истечение реферального срока
+--          пересчитывается периодической задачей.
+--          Ожидающие покупки отменённых заказов переводятся в cancelled,
+--          как это теперь делает отмена заказа.
+--          Индексы по users.referred_by для списка рефералов и пересчёта.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/015_referral_stats.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS referral_stats (
+    referrer_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    referrals_count INTEGER NOT NULL DEFAULT 0,
+    active_referrals INTEGER NOT NULL DEFAULT 0,
+    topup_earnings NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    commission_earnings NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    pending_earnings NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_referred_by_expires
+    ON users(referred_by, referral_expires_at)
+    WHERE referred_by IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_users_referral_expires_at
+    ON users(referral_expires_at)
+    WHERE referred_by IS NOT NULL;
+
+UPDATE product_referral_purchases p
+SET status = 'cancelled', completed_at = CURRENT_TIMESTAMP
+FROM orders o
+WHERE o.id = p.order_id
+  AND o.status = 'cancelled'
+  AND p.status = 'pending';
+
+-- Заполнение из исходных таблиц (повторный запуск пересчитывает заново)
+INSERT INTO referral_stats (
+    referrer_id, referrals_count, active_referrals,
+    topup_earnings, commission_earnings, pending_earnings
+)
+SELECT referrer_id,
+       SUM(referrals_count), SUM(active_referrals),
+       SUM(topup_earnings), SUM(commission_earnings), SUM(pending_earnings)
+FROM (
+    SELECT referred_by AS referrer_id,
+           COUNT(*) AS referrals_count,
+           COUNT(*) FILTER (WHERE referral_expires_at > (NOW() AT TIME ZONE 'UTC')) AS active_referrals,
+           0 AS topup_earnings, 0 AS commission_earnings, 0 AS pending_earnings
+    FROM users
+    WHERE referred_by IS NOT NULL
+    GROUP BY referred_by
+    UNION ALL
+    SELECT referrer_id, 0, 0, SUM(earning_amount), 0, 0
+    FROM referral_earnings
+    GROUP BY referrer_id
+    UNION ALL
+    SELECT referrer_id, 0, 0, 0,
+           COALESCE(SUM(commission_amount) FILTER (WHERE status = 'completed'), 0),
+           COALESCE(SUM(commission_amount) FILTER (WHERE status = 'pending'), 0)
+    FROM product_referral_purchases
+    GROUP BY referrer_id
+) totals
+WHERE referrer_id IN (SELECT id FROM users)
+GROUP BY referrer_id
+ON CONFLICT (referrer_id) DO UPDATE SET
+    referrals_count = EXCLUDED.referrals_count,
+    active_referrals = EXCLUDED.active_referrals,
+    topup_earnings = EXCLUDED.topup_earnings,
+    commission_earnings = EXCLUDED.commission_earnings,
+    pending_earnings = EXCLUDED.pending_earnings,
+    updated_at = CURRENT_TIMESTAMP;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (15, 'referral_stats')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
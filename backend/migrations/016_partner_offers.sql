@@ -0,0 +1,77 @@
+-- =====================================================================
+-- Миграция 016: Индекс партнёрских предложений
+-- =====================================================================
+-- Описание: partner_offers хранит по строке на активный товар с
+--          реферальной программой (комиссия >= 1%): эффективную цену
+--          (цена со скидкой, иначе цена), процент и сумму комиссии в
+--          сомах и признак тарифа Business у продавца. Каталог партнёров
+--          (/products/referral/products, /partners/top-products) читается
+--          по частичным индексам WHERE seller_is_business без соединения
+--          с users и сортировки по вычисляемому выражению. Строки
+--          обновляются приложением при изменении товара, модерации и смене
+--          тарифа (app/services/partner_offers.py).
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/016_partner_offers.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS partner_offers (
+    product_id UUID PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    seller_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    category_id INTEGER,
+    effective_price NUMERIC(10, 2) NOT NULL,
+    commission_percent NUMERIC(5, 2) NOT NULL,
+    commission_amount NUMERIC(10, 2) NOT NULL,
+    seller_is_business BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_partner_offers_seller_id ON partner_offers(seller_id);
+
+-- Сортировка "комиссия в сомах"
+CREATE INDEX IF NOT EXISTS idx_partner_offers_commission_amount
+    ON partner_offers(commission_amount DESC, product_id)
+    WHERE seller_is_business;
+
+-- Топ по проценту (/partners/top-products, sort_by=commission_percent)
+CREATE INDEX IF NOT EXISTS idx_partner_offers_commission_percent
+    ON partner_offers(commission_percent DESC, commission_amount DESC)
+    WHERE seller_is_business;
+
+CREATE INDEX IF NOT EXISTS idx_partner_offers_created
+    ON partner_offers(created_at DESC)
+    WHERE seller_is_business;
+
+CREATE INDEX IF NOT EXISTS idx_partner_offers_category_commission
+    ON partner_offers(category_id, commission_amount DESC)
+    WHERE seller_is_business;
+
+INSERT INTO partner_offers (
+    product_id, seller_id, category_id, effective_price,
+    commission_percent, commission_amount, seller_is_business, created_at
+)
+SELECT p.id, p.seller_id, p.category_id,
+       COALESCE(NULLIF(p.discount_price, 0), p.price),
+       p.referral_commission_percent,
+       ROUND(COALESCE(NULLIF(p.discount_price, 0), p.price) * p.referral_commission_percent / 100, 2),
+       u.tariff = 'business',
+       p.created_at
+FROM products p
+JOIN users u ON u.id = p.seller_id
+WHERE p.status = 'active'
+  AND p.is_referral_enabled = true
+  AND p.referral_commission_percent >= 1
+ON CONFLICT (product_id) DO UPDATE SET
+    seller_id = EXCLUDED.seller_id,
+    category_id = EXCLUDED.category_id,
+    effective_price = EXCLUDED.effective_price,
+    commission_percent = EXCLUDED.commission_percent,
+    commission_amount = EXCLUDED.commission_amount,
+    seller_is_business = EXCLUDED.seller_is_business,
+    created_at = EXCLUDED.created_at;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (16, 'partner_offers')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- =====================================================================
+-- Миграция 017: Каталог пользователей для администраторов
+-- =====================================================================
+-- Описание: Поиск по подстроке email, имени и телефона (ILIKE '%...%')
+--          через триграммные GIN-индексы (pg_trgm). Фильтры по роли,
+--          тарифу и блокировке - составные индексы, заканчивающиеся
+--          порядком списка (created_at DESC, id DESC), чтобы keyset-
+--          пагинация читала страницу прямо из индекса
+--          (app/services/user_directory.py).
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/017_admin_user_directory.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_full_name_trgm ON users USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_phone_trgm ON users USING gin (phone gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_users_created_id ON users(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_role_created_id ON users(role, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_tariff_created_id ON users(tariff, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_banned_created_id ON users(is_banned, created_at DESC, id DESC);
+
+INSERT INTO schema_migrations (version, name)
+VALUES (17, 'admin_user_directory')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
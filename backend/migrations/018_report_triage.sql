@@ -0,0 +1,114 @@
+-- =====================================================================
+-- Миграция 018: Сортировка жалоб по объектам
+-- =====================================================================
+-- Описание: report_targets - одна строка на объект жалобы
+--          (report_type, target_id) со счётчиками, суммой весов причин
+--          и последней жалобой; очередь модерации читается индексом по
+--          priority_score (app/services/report_triage.py).
+--          reports.target_id - id объекта жалобы любого типа. Частичный
+--          уникальный индекс оставляет одну ожидающую жалобу на автора и
+--          объект; существующие дубли закрываются как dismissed.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/018_report_triage.sql
+-- =====================================================================
+
+BEGIN;
+
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS target_id UUID;
+
+UPDATE reports SET target_id = CASE report_type
+        WHEN 'product' THEN reported_product_id
+        WHEN 'seller' THEN reported_seller_id
+        WHEN 'review' THEN reported_review_id
+        WHEN 'user' THEN reported_user_id
+        WHEN 'order' THEN reported_order_id
+    END
+WHERE target_id IS NULL;
+
+-- Дубли ожидающих жалоб: остаётся последняя
+UPDATE reports r SET status = 'dismissed',
+       admin_notes = COALESCE(r.admin_notes, 'Повторная жалоба'),
+       updated_at = NOW()
+FROM (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY reporter_id, report_type, target_id ORDER BY created_at DESC, id DESC
+    ) AS rn
+    FROM reports
+    WHERE status = 'pending' AND target_id IS NOT NULL
+) d
+WHERE r.id = d.id AND d.rn > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_reports_pending_reporter_target
+    ON reports(reporter_id, report_type, target_id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_reports_target_status ON reports(report_type, target_id, status);
+CREATE INDEX IF NOT EXISTS idx_reports_status_type ON reports(status, report_type);
+
+CREATE TABLE IF NOT EXISTS report_targets (
+    report_type report_type_enum NOT NULL,
+    target_id UUID NOT NULL,
+    status report_status_enum NOT NULL DEFAULT 'pending',
+    reports_count INTEGER NOT NULL DEFAULT 0,
+    pending_reports INTEGER NOT NULL DEFAULT 0,
+    priority_score INTEGER NOT NULL DEFAULT 0,
+    reasons JSONB NOT NULL DEFAULT '{}'::jsonb,
+    last_report_id UUID REFERENCES reports(id) ON DELETE SET NULL,
+    first_reported_at TIMESTAMP NOT NULL,
+    last_reported_at TIMESTAMP NOT NULL,
+    reviewed_by UUID REFERENCES users(id),
+    reviewed_at TIMESTAMP,
+    PRIMARY KEY (report_type, target_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_report_targets_pending_priority
+    ON report_targets(priority_score DESC, last_reported_at DESC) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_report_targets_pending_type_priority
+    ON report_targets(report_type, priority_score DESC, last_reported_at DESC) WHERE status = 'pending';
+
+-- Заполнение из существующих жалоб; веса причин как REASON_WEIGHTS
+INSERT INTO report_targets (
+    report_type, target_id, status, reports_count, pending_reports, priority_score,
+    reasons, last_report_id, first_reported_at, last_reported_at, reviewed_by, reviewed_at
+)
+SELECT
+    report_type,
+    target_id,
+    CASE WHEN COUNT(*) FILTER (WHERE status = 'pending') > 0 THEN 'pending'
+         ELSE (ARRAY_AGG(status ORDER BY updated_at DESC))[1] END,
+    COUNT(*),
+    COUNT(*) FILTER (WHERE status = 'pending'),
+    COALESCE(SUM(CASE reason
+        WHEN 'fraud' THEN 5
+        WHEN 'fake' THEN 3
+        WHEN 'copyright' THEN 3
+        WHEN 'offensive' THEN 3
+        WHEN 'inappropriate' THEN 2
+        ELSE 1
+    END) FILTER (WHERE status = 'pending'), 0),
+    '{}'::jsonb,
+    (ARRAY_AGG(id ORDER BY status = 'pending' DESC, created_at DESC))[1],
+    COALESCE(MIN(created_at) FILTER (WHERE status = 'pending'), MIN(created_at)),
+    MAX(created_at),
+    (ARRAY_AGG(reviewed_by ORDER BY reviewed_at DESC NULLS LAST))[1],
+    MAX(reviewed_at)
+FROM reports
+WHERE target_id IS NOT NULL
+GROUP BY report_type, target_id
+ON CONFLICT (report_type, target_id) DO NOTHING;
+
+UPDATE report_targets t SET reasons = r.reasons
+FROM (
+    SELECT report_type, target_id, jsonb_object_agg(reason, cnt) AS reasons
+    FROM (
+        SELECT report_type, target_id, reason, COUNT(*) AS cnt
+        FROM reports
+        WHERE status = 'pending' AND target_id IS NOT NULL
+        GROUP BY report_type, target_id, reason
+    ) per_reason
+    GROUP BY report_type, target_id
+) r
+WHERE t.report_type = r.report_type AND t.target_id = r.target_id AND t.status = 'pending';
+
+INSERT INTO schema_migrations (version, name)
+VALUES (18, 'report_triage')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,37 @@
+-- =====================================================================
+-- Миграция 019: Счётчики товаров для навигации по каталогу
+-- =====================================================================
+-- Описание: catalog_facet_counts - число активных товаров на
+--          (категория, город продавца, тип продавца); 0 и '' - не задано.
+--          Дерево категорий и фильтры суммируют эту небольшую таблицу
+--          вместо COUNT по products на каждый узел
+--          (app/services/catalog_facets.py). Счётчики меняются вместе с
+--          товарами, ночная задача пересчитывает их полностью.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/019_catalog_facets.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS catalog_facet_counts (
+    category_id INTEGER NOT NULL DEFAULT 0,
+    city_id INTEGER NOT NULL DEFAULT 0,
+    seller_type VARCHAR(50) NOT NULL DEFAULT '',
+    active_products INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (category_id, city_id, seller_type)
+);
+
+-- Начальное заполнение
+INSERT INTO catalog_facet_counts (category_id, city_id, seller_type, active_products)
+SELECT COALESCE(p.category_id, 0), COALESCE(sp.city_id, 0), COALESCE(sp.seller_type, ''), COUNT(*)
+FROM products p
+LEFT JOIN seller_profiles sp ON sp.user_id = p.seller_id
+WHERE p.status = 'active'
+GROUP BY 1, 2, 3
+ON CONFLICT (category_id, city_id, seller_type) DO UPDATE SET active_products = EXCLUDED.active_products;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (19, 'catalog_facets')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,52 @@
+-- =====================================================================
+-- Миграция 020: Фильтры и фасеты по характеристикам товаров
+-- =====================================================================
+-- Описание: product_attributes - характеристики из products.characteristics
+--          ([{name, value}]) по одной строке на товар, имя и значение.
+--          name/value нормализованы (пробелы схлопнуты, нижний регистр)
+--          для фильтров attr=name:value, *_label - как ввёл продавец.
+--          Индекс (name, value, product_id) обслуживает фильтры, первичный
+--          ключ - подсчёт значений по найденным товарам
+--          (app/services/product_attributes.py).
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/020_product_attributes.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS product_attributes (
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    name VARCHAR(100) NOT NULL,
+    value VARCHAR(200) NOT NULL,
+    name_label VARCHAR(100) NOT NULL,
+    value_label VARCHAR(200) NOT NULL,
+    PRIMARY KEY (product_id, name, value)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_attributes_name_value ON product_attributes(name, value, product_id);
+
+-- Начальное заполнение; нормализация как normalize() в сервисе
+INSERT INTO product_attributes (product_id, name, value, name_label, value_label)
+SELECT DISTINCT ON (product_id, name, value) product_id, name, value, name_label, value_label
+FROM (
+    SELECT
+        p.id AS product_id,
+        LEFT(LOWER(BTRIM(REGEXP_REPLACE(item->>'name', '\s+', ' ', 'g'))), 100) AS name,
+        LEFT(LOWER(BTRIM(REGEXP_REPLACE(item->>'value', '\s+', ' ', 'g'))), 200) AS value,
+        LEFT(BTRIM(item->>'name'), 100) AS name_label,
+        LEFT(BTRIM(item->>'value'), 200) AS value_label,
+        ord
+    FROM products p
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(p.characteristics) = 'array' THEN p.characteristics ELSE '[]'::jsonb END
+    ) WITH ORDINALITY AS c(item, ord)
+    WHERE jsonb_typeof(item) = 'object'
+) a
+WHERE name <> '' AND value <> ''
+ORDER BY product_id, name, value, ord
+ON CONFLICT (product_id, name, value) DO NOTHING;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (20, 'product_attributes')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,35 @@
+-- =====================================================================
+-- Миграция 021: Гистограммы цен по категориям
+-- =====================================================================
+-- Описание: category_price_buckets - число активных товаров на
+--          (категория, интервал цены). Интервалы логарифмические
+--          (0, 10, 15, 20, 30, 50, 70, 100, ...), номер - width_bucket()
+--          по тем же границам, что PRICE_BUCKET_EDGES в
+--          app/services/price_stats.py. Счётчики меняются вместе с
+--          catalog_facet_counts, ночная задача пересчитывает обе таблицы.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/021_category_price_buckets.sql
+-- =====================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS category_price_buckets (
+    category_id INTEGER NOT NULL DEFAULT 0,
+    bucket INTEGER NOT NULL,
+    active_products INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (category_id, bucket)
+);
+
+-- Начальное заполнение
+INSERT INTO category_price_buckets (category_id, bucket, active_products)
+SELECT COALESCE(category_id, 0), width_bucket(price, ARRAY[0,10,15,20,30,50,70,100,150,200,300,500,700,1000,1500,2000,3000,5000,7000,10000,15000,20000,30000,50000,70000,100000,150000,200000,300000,500000,700000,1000000,1500000,2000000,3000000,5000000,7000000]::numeric[]), COUNT(*)
+FROM products
+WHERE status = 'active'
+GROUP BY 1, 2
+ON CONFLICT (category_id, bucket) DO UPDATE SET active_products = EXCLUDED.active_products;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (21, 'category_price_buckets')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- =====================================================================
+-- Миграция 022: Хэш содержимого в отпечатках товаров
+-- =====================================================================
+-- Описание: product_fingerprints.content_hash - md5 названия и ссылок на
+--          изображения, по которым посчитан отпечаток. Индексатор
+--          дубликатов пересчитывает отпечаток только при смене хэша, а не
+--          при каждом изменении products.updated_at (просмотры,
+--          продвижение, модерация). Выражение совпадает с content_hash()
+--          в app/services/duplicate_detection.py. Актуальные отпечатки
+--          заполняются сразу, остальные пересчитает индексатор.
+-- Применение: psql -U bazarlar_user -d bazarlar_claude < backend/migrations/022_product_fingerprint_content_hash.sql
+-- =====================================================================
+
+BEGIN;
+
+ALTER TABLE product_fingerprints ADD COLUMN IF NOT EXISTS content_hash VARCHAR(32);
+
+UPDATE product_fingerprints f
+SET content_hash = md5(concat(p.title, E'\n', p.images::text))
+FROM products p
+WHERE p.id = f.product_id
+  AND f.content_hash IS NULL
+  AND f.updated_at >= p.updated_at;
+
+INSERT INTO schema_migrations (version, name)
+VALUES (22, 'product_fingerprint_content_hash')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
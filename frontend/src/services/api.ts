@@ -156,6 +156,7 @@ export const ordersAPI = {
   getOrders: (params?: any) => api.get('/orders/', { params }),
   getOrderById: (id: string) => api.get(`/orders/${id}`),
   createOrder: (data: any) => api.post('/orders/', data),
+  checkoutCart: (data: any) => api.post('/orders/cart', data),
   updateOrderStatus: (id: string, status: string) => api.put(`/orders/${id}/status`, { status }),
 };
 